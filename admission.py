@@ -0,0 +1,236 @@
+"""
+Admission control for expensive endpoints.
+
+Every /invocations request holds a worker for a full retrieval plus model
+round trip. Without a limit, a spike queues hundreds of multi-second requests
+and they all time out together. AdmissionMiddleware puts three checks in
+front of the handler:
+
+1. Per-client rate limit: a token bucket per API key (or client IP). A client
+   over its rate gets 429 with Retry-After.
+2. In-flight limit: at most max_in_flight requests run at once.
+3. Bounded queue with a deadline: extra requests wait up to queue_timeout
+   for a slot and are answered 503 with Retry-After if none frees up. When the
+   queue is full, the oldest waiting request is shed to make room. It has
+   already used most of its deadline and is the most likely to time out
+   anyway.
+
+A request keeps its slot until its response has been sent completely, so
+streamed responses count for their whole lifetime. Limits apply per process;
+with serve.py every worker has its own.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+
+from starlette.responses import JSONResponse
+
+from rate_limit import TokenBucket
+
+ADMITTED = "admitted"
+SHED = "shed"
+TIMED_OUT = "queue_timeout"
+REJECTED = "overloaded"
+RATE_LIMITED = "rate_limited"
+
+
+class AdmissionController:
+    """
+    In-flight limit, waiting queue and per-client token buckets. Must be used
+    from a single event loop.
+
+    Args:
+        max_in_flight: Requests handled at the same time
+        max_queue: Requests allowed to wait for a slot (0 = reject immediately when busy)
+        queue_timeout: Seconds a request may wait before it is rejected
+        client_rate: Requests per second allowed per client (0 = no per-client limit)
+        client_burst: Token bucket capacity per client (default: the rate)
+        max_clients: Client buckets kept; the least recently seen are dropped
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float, client_rate: float = 0.0,
+                 client_burst: float = None, max_clients: int = 10000):
+        self.max_in_flight = max(int(max_in_flight), 1)
+        self.max_queue = max(int(max_queue), 0)
+        self.queue_timeout = queue_timeout
+        self.client_rate = client_rate
+        self.client_burst = client_burst or None
+        self.max_clients = max_clients
+        self.in_flight = 0
+        self._queue = deque()  # futures of waiting requests, oldest first
+        self._buckets = OrderedDict()  # client -> TokenBucket
+        self._service_seconds = None  # moving average of time in the handler
+        self.admitted = 0
+        self.queued = 0
+        self.queue_wait_seconds = 0.0
+        self.peak_in_flight = 0
+        self.peak_queue = 0
+        self.rejections = {RATE_LIMITED: 0, SHED: 0, TIMED_OUT: 0, REJECTED: 0}
+
+    # ---------- Rate limiting ----------
+    def check_rate(self, client: str) -> float:
+        """Takes a token from the client's bucket. Returns 0.0, or the seconds until a token is available."""
+        if self.client_rate <= 0:
+            return 0.0
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = TokenBucket(self.client_rate, self.client_burst)
+            self._buckets[client] = bucket
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        wait = bucket.try_acquire()
+        if wait > 0:
+            self.rejections[RATE_LIMITED] += 1
+        return wait
+
+    # ---------- Slots ----------
+    def _start(self):
+        self.in_flight += 1
+        self.admitted += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    async def acquire(self) -> str:
+        """
+        Waits for an in-flight slot. Returns ADMITTED (the caller must call
+        release() when done) or the reason the request was rejected.
+        """
+        if self.in_flight < self.max_in_flight and not self._queue:
+            self._start()
+            return ADMITTED
+        if self.max_queue == 0:
+            self.rejections[REJECTED] += 1
+            return REJECTED
+        if len(self._queue) >= self.max_queue:
+            oldest = self._queue.popleft()
+            if not oldest.done():
+                oldest.set_result(SHED)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append(future)
+        self.queued += 1
+        self.peak_queue = max(self.peak_queue, len(self._queue))
+        timer = loop.call_later(self.queue_timeout, self._expire, future)
+        start = time.perf_counter()
+        try:
+            outcome = await future
+        except asyncio.CancelledError:
+            # Client went away while waiting; give back a slot that was handed over concurrently
+            if future.done() and not future.cancelled() and future.result() == ADMITTED:
+                self.release()
+            self._discard(future)
+            raise
+        finally:
+            timer.cancel()
+            self.queue_wait_seconds += time.perf_counter() - start
+        if outcome != ADMITTED:
+            self.rejections[outcome] += 1
+        return outcome
+
+    def _expire(self, future):
+        if not future.done():
+            future.set_result(TIMED_OUT)
+            self._discard(future)
+
+    def _discard(self, future):
+        try:
+            self._queue.remove(future)
+        except ValueError:
+            pass
+
+    def release(self, service_seconds: float = None):
+        """Frees a slot and hands it to the oldest waiting request."""
+        self.in_flight = max(self.in_flight - 1, 0)
+        if service_seconds is not None:
+            average = self._service_seconds
+            self._service_seconds = service_seconds if average is None else 0.9 * average + 0.1 * service_seconds
+        while self._queue and self.in_flight < self.max_in_flight:
+            future = self._queue.popleft()
+            if not future.done():
+                self._start()
+                future.set_result(ADMITTED)
+
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait: roughly the time to work off the current queue."""
+        service = self._service_seconds or 1.0
+        return max(1, math.ceil(service * (len(self._queue) + 1) / self.max_in_flight))
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "queue_depth": len(self._queue),
+            "max_queue": self.max_queue,
+            "peak_queue": self.peak_queue,
+            "queue_timeout": self.queue_timeout,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "queue_wait_seconds": self.queue_wait_seconds,
+            "rejections": dict(self.rejections),
+            "clients_tracked": len(self._buckets),
+            "avg_service_seconds": self._service_seconds,
+        }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying an AdmissionController to POST requests on the given paths.
+
+    Args:
+        app: The wrapped ASGI app
+        controller: The AdmissionController to use
+        paths: Request paths that are admission-controlled
+        rate_limited_paths: Paths also subject to the per-client rate limit (default: all of paths)
+        client_header: Header identifying the client (e.g. an API key); falls back to the client IP
+        trust_forwarded: Use the first X-Forwarded-For address as the client IP (only behind a trusted proxy)
+    """
+
+    def __init__(self, app, controller: AdmissionController, paths=("/invocations",), rate_limited_paths=None,
+                 client_header: str = "x-api-key", trust_forwarded: bool = False):
+        self.app = app
+        self.controller = controller
+        self.paths = set(paths)
+        self.rate_limited_paths = self.paths if rate_limited_paths is None else set(rate_limited_paths)
+        self.client_header = client_header.lower().encode("latin-1") if client_header else None
+        self.trust_forwarded = trust_forwarded
+
+    def client_id(self, scope) -> str:
+        forwarded = None
+        for name, value in scope.get("headers", ()):
+            if self.client_header and name == self.client_header and value:
+                return "key:" + value.decode("latin-1")
+            if self.trust_forwarded and name == b"x-forwarded-for":
+                forwarded = value.decode("latin-1").split(",")[0].strip()
+        if forwarded:
+            return "ip:" + forwarded
+        client = scope.get("client")
+        return "ip:" + (client[0] if client else "unknown")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        wait = self.controller.check_rate(self.client_id(scope)) if scope["path"] in self.rate_limited_paths else 0.0
+        if wait > 0:
+            response = JSONResponse({"error": "Rate limit exceeded"}, status_code=429,
+                                    headers={"Retry-After": str(max(1, math.ceil(wait)))})
+            await response(scope, receive, send)
+            return
+
+        outcome = await self.controller.acquire()
+        if outcome != ADMITTED:
+            response = JSONResponse({"error": "Server is overloaded, retry later", "reason": outcome},
+                                    status_code=503, headers={"Retry-After": str(self.controller.retry_after())})
+            await response(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(time.perf_counter() - start)
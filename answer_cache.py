@@ -0,0 +1,233 @@
+"""
+Full-response cache for generated answers.
+
+An answer is reused only if the normalized prompt, the exact context that
+was put into the prompt (by hash) and the knowledge base version stamp all
+match, so a re-sync or any change in retrieved context produces a fresh
+answer. Entries live in an in-memory LRU with a TTL; an optional SQLite
+file adds a larger on-disk tier that survives restarts and is shared by
+worker processes on the same host, each through its own connection.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from context_budget import context_parts
+from retrieval_cache import normalize_query
+
+
+def context_hash(chunks: list) -> str:
+    """SHA-256 of the joined context, computed piece by piece without joining it."""
+    digest = hashlib.sha256()
+    for part in context_parts(chunks):
+        digest.update(part.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def answer_key(prompt: str, chunks: list, version: str) -> str:
+    """Cache key for a prompt answered from the given context chunks at a given knowledge base version."""
+    digest = hashlib.sha256()
+    for part in (normalize_query(prompt), context_hash(chunks), version):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class AnswerCache:
+    """
+    Two-tier answer cache.
+
+    The memory tier is cheap and can be used from the event loop. The disk
+    tier blocks on SQLite: get()/put() use both tiers, while a server calls
+    get_memory()/put_memory() on its loop and get_disk()/put_disk() on an
+    executor. Each process opens its own SQLite connection on first use, so
+    a connection is never inherited across a fork (e.g. by serve.py's workers).
+
+    Args:
+        max_size: Maximum entries in memory
+        ttl_seconds: Lifetime of an entry (both tiers)
+        db_path: Optional SQLite file for the on-disk tier
+        max_disk_entries: Maximum entries kept on disk; oldest are deleted first
+        version_fn: Optional callable() -> str returning the knowledge base version
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 3600.0, db_path: str = "",
+                 max_disk_entries: int = 100000, version_fn=None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self.version_fn = version_fn
+        self.db_path = db_path
+        self._entries = OrderedDict()  # key -> (expires_at_wall_clock, answer)
+        self._lock = threading.Lock()
+        self._version = version_fn() if version_fn else ""
+        self._db_lock = threading.Lock()  # serializes the disk tier; never held together with _lock
+        self._db = None
+        self._db_pid = None
+        self._purge_disk = False  # the version changed; rows of older versions are deleted on the next disk access
+        self._puts_since_trim = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+    @property
+    def disk_enabled(self) -> bool:
+        return bool(self.db_path)
+
+    def _connection(self):
+        """This process's SQLite connection, opened on first use. Call with _db_lock held."""
+        if self._db is None or self._db_pid != os.getpid():
+            # A connection inherited from the parent process is abandoned, not closed: it belongs to the parent
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._db_pid = os.getpid()
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, answer TEXT NOT NULL, version TEXT NOT NULL, "
+                "created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS answers_created ON answers (created_at)")
+        if self._purge_disk:
+            self._purge_disk = False
+            self._db.execute("DELETE FROM answers WHERE version != ?", (self._version,))
+        return self._db
+
+    @property
+    def version(self) -> str:
+        """Current knowledge base version; clears the cache when it changes."""
+        if self.version_fn is None:
+            return self._version
+        version = self.version_fn()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._version = version
+                    self._entries.clear()
+                    self.invalidations += 1
+                    self._purge_disk = self.disk_enabled
+        return version
+
+    def key(self, prompt: str, chunks: list) -> str:
+        """Returns the cache key for a prompt and the context chunks it is answered from."""
+        return answer_key(prompt, chunks, self.version)
+
+    def get(self, key: str):
+        """Returns the cached answer from either tier, or None on a miss. May block on the disk tier."""
+        answer = self.get_memory(key)
+        if answer is None:
+            answer = self.get_disk(key)
+        return answer
+
+    def get_memory(self, key: str):
+        """Returns the answer if it is in the memory tier, else None (not counted as a miss: try get_disk next)."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+            if not self.disk_enabled:
+                self.misses += 1
+            return None
+
+    def get_disk(self, key: str):
+        """Returns the answer from the disk tier (promoting it to memory), else None. Blocks on SQLite."""
+        if not self.disk_enabled:
+            return None
+        now = time.time()
+        with self._db_lock:
+            row = self._connection().execute(
+                "SELECT answer, expires_at FROM answers WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self._store_locked(key, row[0], row[1])
+            self.disk_hits += 1
+            return row[0]
+
+    def _store_locked(self, key: str, answer: str, expires_at: float):
+        self._entries[key] = (expires_at, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def put(self, key: str, answer: str):
+        """Stores an answer in memory and, if configured, on disk. May block on the disk tier."""
+        self.put_memory(key, answer)
+        self.put_disk(key, answer)
+
+    def put_memory(self, key: str, answer: str):
+        """Stores an answer in the memory tier."""
+        with self._lock:
+            self._store_locked(key, answer, time.time() + self.ttl_seconds)
+
+    def put_disk(self, key: str, answer: str):
+        """Stores an answer in the disk tier, if configured. Blocks on SQLite."""
+        if not self.disk_enabled:
+            return
+        now = time.time()
+        with self._db_lock:
+            db = self._connection()
+            db.execute(
+                "INSERT OR REPLACE INTO answers (key, answer, version, created_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)", (key, answer, self._version, now, now + self.ttl_seconds)
+            )
+            self._puts_since_trim += 1
+            if self._puts_since_trim >= 100:
+                self._trim_db_locked(db, now)
+
+    def _trim_db_locked(self, db, now: float):
+        """Deletes expired rows and the oldest rows beyond max_disk_entries."""
+        self._puts_since_trim = 0
+        db.execute("DELETE FROM answers WHERE expires_at <= ?", (now,))
+        db.execute(
+            "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,)
+        )
+
+    def invalidate(self):
+        """Drops every entry in both tiers. May block on the disk tier."""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+        if self.disk_enabled:
+            with self._db_lock:
+                self._connection().execute("DELETE FROM answers")
+
+    def disk_size(self) -> int:
+        """Number of rows in the disk tier (0 without one). Blocks on SQLite."""
+        if not self.disk_enabled:
+            return 0
+        with self._db_lock:
+            return self._connection().execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the memory tier's size (see disk_size() for the disk tier)."""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "disk_enabled": self.disk_enabled,
+            }
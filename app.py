@@ -1,75 +1,765 @@
+import time
+# Taken before any other import so the startup breakdown includes import time
+_IMPORT_START = time.perf_counter()
 import os
 import json
-from starlette.responses import JSONResponse
+import asyncio
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from starlette.responses import JSONResponse, PlainTextResponse
 from starlette.middleware.cors import CORSMiddleware
-import boto3
 from bedrock_agentcore import BedrockAgentCoreApp
-from strands import Agent
+# strands (the agent framework) is imported on first use / during warm-up, see make_agent()
+
+from admission import AdmissionController, AdmissionMiddleware
+import aws_clients
+import kb_version
+from answer_cache import AnswerCache
+from embeddings import embed_text
+import local_index
+from lexical_index import BM25Index
+from context_budget import CHARS_PER_TOKEN, assemble_context, context_length, context_parts
+from metrics import registry
+from query_expansion import expand_query, llm_rewrite, merge_results
+from retrieval_backends import BedrockBackend, HybridBackend, LocalBackend, RetrievalBackend
+from single_flight import SingleFlight
+from retrieval_cache import RetrievalCache, normalize_query
+from sessions import SessionManager
+from startup import StartupTimer, WarmUp
+from tenants import Tenant, TenantRegistry, load_configs
+
+startup_timer = StartupTimer(_IMPORT_START)
+startup_timer.mark("imports")
 
 # ---------- Config ----------
 REGION = os.getenv("AWS_REGION", "us-east-2")
 KNOWLEDGE_BASE_ID = os.getenv("KNOWLEDGE_BASE_ID", "YN0B2UVKBS")  # Set via environment variable
 
+# Maximum number of blocking Bedrock retrieve calls running at once (thread-pool size)
+RETRIEVAL_MAX_CONCURRENCY = int(os.getenv("RETRIEVAL_MAX_CONCURRENCY", "32"))
+
 # ---------- Clients ----------
-kb_client = boto3.client("bedrock-agent-runtime", region_name=REGION)
+# Shared, tuned client (timeouts, keep-alive, adaptive retries; see aws_clients.py), built on first use or
+# during warm-up. Size the connection pool to match the retrieval thread pool so offloaded calls never wait on a connection
+kb_client = aws_clients.lazy_client(
+    "bedrock-agent-runtime",
+    region=REGION,
+    max_pool_connections=RETRIEVAL_MAX_CONCURRENCY,
+)
+# boto3 is blocking; async handlers offload retrieve calls to this bounded pool instead of stalling the event loop
+_retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_MAX_CONCURRENCY, thread_name_prefix="kb-retrieve")
 
-# ---------- Retrieval ----------
-def retrieve_from_kb(query: str, top_k: int = 5) -> str:
+# ---------- Retrieval Single-Flight ----------
+# Cache misses are dispatched at once (Retrieve takes one query per call, so there is nothing to merge);
+# identical queries in flight share one call
+RETRIEVAL_SINGLE_FLIGHT_ENABLED = os.getenv("RETRIEVAL_SINGLE_FLIGHT_ENABLED", "1") == "1"
+
+retrieval_single_flight = SingleFlight(_retrieval_executor)
+
+# ---------- Metrics ----------
+# Exposed in Prometheus text format on GET /metrics
+STAGE_SECONDS = registry.histogram(
+    "rag_stage_duration_seconds", "Time spent in each stage of a request", labels=("stage",))
+REQUEST_SECONDS = registry.histogram(
+    "rag_request_duration_seconds", "End-to-end time of /invocations requests", labels=("mode",))
+BACKEND_SECONDS = registry.histogram(
+    "rag_backend_retrieve_duration_seconds", "Time of uncached retrieval backend calls", labels=("backend",))
+REQUESTS_TOTAL = registry.counter("rag_requests_total", "Requests handled by /invocations", labels=("mode",))
+RETRIEVED_CHUNKS = registry.histogram(
+    "rag_retrieved_chunks", "Chunks retrieved per request", buckets=(0, 1, 2, 3, 5, 8, 10, 20, 50))
+CONTEXT_CHARS = registry.histogram(
+    "rag_context_chars", "Size of the retrieved context per request in characters",
+    buckets=(0, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000))
+CONTEXT_TOKENS = registry.histogram(
+    "rag_context_tokens", "Estimated size of the retrieved context per request in tokens",
+    buckets=(0, 128, 256, 512, 1000, 2000, 4000, 8000, 16000))
+
+CONTEXT_TOKENS_SAVED = registry.histogram(
+    "rag_context_tokens_saved", "Estimated tokens removed from the context per request by the context budget",
+    buckets=(0, 64, 128, 256, 512, 1000, 2000, 4000, 8000))
+CONTEXT_CHUNKS_DROPPED = registry.counter(
+    "rag_context_chunks_dropped_total", "Retrieved chunks left out of the prompt", labels=("reason",))
+
+def _record_context(chunks: list, selected: list, report: dict):
+    chars = context_length(selected)
+    RETRIEVED_CHUNKS.observe(len(chunks))
+    CONTEXT_CHARS.observe(chars)
+    CONTEXT_TOKENS.observe((chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+    CONTEXT_TOKENS_SAVED.observe(report["tokens_saved"])
+    for reason in ("low_score", "duplicate", "budget"):
+        if report[f"dropped_{reason}"]:
+            CONTEXT_CHUNKS_DROPPED.inc(report[f"dropped_{reason}"], reason=reason)
+
+# ---------- Context Budget ----------
+# Retrieved chunks are filtered, deduplicated and packed into a token budget before prompt building
+CONTEXT_BUDGET_ENABLED = os.getenv("CONTEXT_BUDGET_ENABLED", "1") == "1"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))  # 0 = unlimited
+CONTEXT_MIN_SCORE = float(os.getenv("CONTEXT_MIN_SCORE", "0"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+
+def select_context(chunks: list, record: bool = True) -> tuple:
     """
-    Calls Bedrock Knowledge Base 'Retrieve' to get the most relevant text chunks.
-    Returns a single string with all retrieved texts joined together.
+    Applies the context budget to the retrieved chunks.
+    Returns (selected_chunks, report); the context is never joined on its own,
+    build_prompt() writes the selected chunks straight into the prompt.
     """
-    try:
-        resp = kb_client.retrieve(
-            knowledgeBaseId=KNOWLEDGE_BASE_ID,
-            retrievalQuery={"text": query},
-            retrievalConfiguration={"vectorSearchConfiguration": {"numberOfResults": top_k}}
+    if CONTEXT_BUDGET_ENABLED:
+        selected, report = assemble_context(
+            chunks,
+            token_budget=CONTEXT_TOKEN_BUDGET,
+            min_score=CONTEXT_MIN_SCORE,
+            dedup_threshold=CONTEXT_DEDUP_THRESHOLD,
         )
-        results = resp.get("retrievalResults", [])
-        
-        if not results:
-            # Log warning but don't fail - return empty string
-            print(f"Warning: No results retrieved from knowledge base for query: {query}")
-            return ""
-        
-        texts = []
-        for r in results:
-            # Try different possible structures for the content
-            content = r.get("content", {})
-            
-            # Handle different content formats
-            if isinstance(content, dict):
-                # Standard format: content.text
-                if "text" in content:
-                    texts.append(content["text"])
-                # Alternative: content might be the text directly
-                elif len(content) == 1 and list(content.values())[0]:
-                    texts.append(str(list(content.values())[0]))
-            elif isinstance(content, str):
-                # Content is already a string
-                texts.append(content)
-            else:
-                # Fallback: try to get text from other possible locations
-                if "text" in r:
-                    texts.append(r["text"])
-                elif "body" in r:
-                    texts.append(str(r["body"]))
-        
-        if texts:
-            return "\n\n---\n\n".join(texts)
-        else:
-            print(f"Warning: Could not extract text from retrieval results. Raw result: {r}")
-            return ""
-            
+    else:
+        selected = chunks
+        report = {"chunks_in": len(chunks), "chunks_out": len(chunks), "dropped_low_score": 0,
+                  "dropped_duplicate": 0, "dropped_budget": 0, "tokens_saved": 0}
+    if record:
+        _record_context(chunks, selected, report)
+    return selected, report
+
+# ---------- Retrieval Cache ----------
+RETRIEVAL_CACHE_ENABLED = os.getenv("RETRIEVAL_CACHE_ENABLED", "1") == "1"
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "512"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "300"))  # seconds
+# Near-duplicate matching via embeddings (off by default; see embeddings.py for backends)
+RETRIEVAL_CACHE_SEMANTIC = os.getenv("RETRIEVAL_CACHE_SEMANTIC", "0") == "1"
+RETRIEVAL_CACHE_SIMILARITY = float(os.getenv("RETRIEVAL_CACHE_SIMILARITY", "0.92"))
+
+def new_retrieval_cache(max_size: int) -> RetrievalCache:
+    return RetrievalCache(
+        max_size=max_size,
+        ttl_seconds=RETRIEVAL_CACHE_TTL,
+        embed_fn=embed_text if RETRIEVAL_CACHE_SEMANTIC else None,
+        similarity_threshold=RETRIEVAL_CACHE_SIMILARITY,
+        version_fn=kb_version.current_version,
+    )
+
+# The default tenant's cache; every other tenant gets its own (see Tenants below)
+retrieval_cache = new_retrieval_cache(RETRIEVAL_CACHE_SIZE)
+
+# ---------- Answer Cache ----------
+# Full answers for stateless requests, keyed on prompt + hash of the selected context + knowledge base version
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))  # seconds
+# Optional SQLite file for a persistent on-disk tier shared by workers on the same host (one connection each)
+ANSWER_CACHE_DB = os.getenv("ANSWER_CACHE_DB", "")
+ANSWER_CACHE_DB_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_DB_MAX_ENTRIES", "100000"))
+
+answer_cache = AnswerCache(
+    max_size=ANSWER_CACHE_SIZE,
+    ttl_seconds=ANSWER_CACHE_TTL,
+    db_path=ANSWER_CACHE_DB,
+    max_disk_entries=ANSWER_CACHE_DB_MAX_ENTRIES,
+    version_fn=kb_version.current_version,
+)
+
+def answer_cache_key(user_prompt: str, selected: list, session_id=None):
+    """
+    Returns the answer cache key for a request, or None if its answer must not be cached:
+    conversations (the answer depends on history) and requests without retrieved context.
+    """
+    if not ANSWER_CACHE_ENABLED or session_id or not user_prompt or not selected:
+        return None
+    return answer_cache.key(user_prompt, selected)
+
+async def get_cached_answer(cache_key: str):
+    """Looks up an answer; the on-disk tier is read on an executor thread, off the event loop."""
+    cached = answer_cache.get_memory(cache_key)
+    if cached is None and answer_cache.disk_enabled:
+        cached = await asyncio.get_running_loop().run_in_executor(None, answer_cache.get_disk, cache_key)
+    return cached
+
+def store_answer(cache_key: str, answer: str):
+    """Caches an answer; the on-disk write runs in the background on an executor thread."""
+    answer_cache.put_memory(cache_key, answer)
+    if answer_cache.disk_enabled:
+        write = asyncio.get_running_loop().run_in_executor(None, answer_cache.put_disk, cache_key, answer)
+        write.add_done_callback(_consume_result)
+
+# ---------- Retrieval Backends ----------
+# "bedrock" (Knowledge Base over the network) or "local" (offline vector index over knowledge/)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "bedrock")
+# Also load the local index when Bedrock is the default, so requests can A/B via "retrieval_backend"
+LOCAL_INDEX_ENABLED = os.getenv("LOCAL_INDEX_ENABLED", "0") == "1" or RETRIEVAL_BACKEND == "local"
+
+# Chunks passed on to the context budget and the model
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+
+# Hybrid retrieval: BM25 keyword search over knowledge/ fused with vector search (reciprocal rank fusion),
+# then an optional local reranker; each retriever fetches RETRIEVAL_CANDIDATES chunks
+HYBRID_RETRIEVAL_ENABLED = os.getenv("HYBRID_RETRIEVAL_ENABLED", "1") == "1"
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "1") == "1"
+RERANK_LEXICAL_WEIGHT = float(os.getenv("RERANK_LEXICAL_WEIGHT", "0.5"))
+
+retrieval_backends = {"bedrock": BedrockBackend(kb_client, KNOWLEDGE_BASE_ID)}
+if LOCAL_INDEX_ENABLED:
+    retrieval_backends["local"] = LocalBackend(local_index.load_or_build())
+
+def make_hybrid(backends: dict, knowledge_dir: str = local_index.KNOWLEDGE_DIR) -> dict:
+    """Wraps each backend in a HybridBackend over a BM25 index of knowledge_dir."""
+    # Reuse the local index's chunks when loaded; otherwise chunk the directory the same way
+    if "local" in backends:
+        lexical = BM25Index(backends["local"].index.records)
+    else:
+        lexical = BM25Index.from_directory(knowledge_dir)
+    return {
+        name: HybridBackend(
+            backend,
+            lexical,
+            candidates=RETRIEVAL_CANDIDATES,
+            rrf_k=RRF_K,
+            rerank_enabled=RERANK_ENABLED,
+            rerank_lexical_weight=RERANK_LEXICAL_WEIGHT,
+        )
+        for name, backend in backends.items()
+    }
+
+if HYBRID_RETRIEVAL_ENABLED:
+    retrieval_backends = make_hybrid(retrieval_backends)
+
+startup_timer.mark("retrieval_backends")
+
+# ---------- Tenants ----------
+# One worker can serve several knowledge bases: a request picks one with "tenant" or "knowledge_base_id".
+# Tenants are a JSON object in TENANTS (or the file TENANTS_FILE), e.g. {"support": {"knowledge_base_id": "ABC123DEF4"}};
+# optional per tenant: "max_concurrency", "retrieval_backend", and "knowledge_dir" (+ "index_dir") for hybrid/local search.
+# Requests naming neither use the default tenant: KNOWLEDGE_BASE_ID with the backends above
+TENANTS = os.getenv("TENANTS", "")
+TENANTS_FILE = os.getenv("TENANTS_FILE", "")
+DEFAULT_TENANT = os.getenv("DEFAULT_TENANT", "default")
+TENANT_MAX_ACTIVE = int(os.getenv("TENANT_MAX_ACTIVE", "16"))  # tenants kept loaded per worker, default included
+TENANT_IDLE_TTL = float(os.getenv("TENANT_IDLE_TTL", "900"))  # seconds before an idle tenant is unloaded
+# Requests per tenant at once, unless the tenant sets max_concurrency (0 = no quota). Only applied to the
+# default tenant when other tenants are configured, so single-tenant workers keep the full admission limit
+TENANT_MAX_CONCURRENCY = int(os.getenv("TENANT_MAX_CONCURRENCY", "32"))
+TENANT_CACHE_SIZE = int(os.getenv("TENANT_CACHE_SIZE", "128"))  # retrieval cache entries per non-default tenant
+
+tenant_configs = load_configs(TENANTS, TENANTS_FILE)
+
+def build_tenant(name: str, config: dict) -> Tenant:
+    """Builds a configured tenant's backends and retrieval cache. Runs on the tenant's first request."""
+    # Tenants share the pooled client; the knowledge base ID is passed per Retrieve call
+    backends = {"bedrock": BedrockBackend(kb_client, config["knowledge_base_id"])}
+    knowledge_dir = config.get("knowledge_dir")
+    if knowledge_dir and config.get("index_dir"):
+        backends["local"] = LocalBackend(local_index.load_or_build(knowledge_dir, config["index_dir"]))
+    # Keyword search needs the tenant's own documents; without them the tenant uses plain vector search
+    if knowledge_dir and HYBRID_RETRIEVAL_ENABLED:
+        backends = make_hybrid(backends, knowledge_dir)
+    return Tenant(
+        name,
+        config["knowledge_base_id"],
+        backends,
+        default_backend=config.get("retrieval_backend", "bedrock"),
+        retrieval_cache=new_retrieval_cache(TENANT_CACHE_SIZE) if RETRIEVAL_CACHE_ENABLED else None,
+        max_concurrency=config.get("max_concurrency", TENANT_MAX_CONCURRENCY),
+    )
+
+default_tenant = Tenant(
+    DEFAULT_TENANT,
+    KNOWLEDGE_BASE_ID,
+    retrieval_backends,
+    default_backend=RETRIEVAL_BACKEND,
+    retrieval_cache=retrieval_cache if RETRIEVAL_CACHE_ENABLED else None,
+    max_concurrency=TENANT_MAX_CONCURRENCY if tenant_configs else 0,
+    pinned=True,
+)
+tenant_registry = TenantRegistry(
+    tenant_configs,
+    build_tenant,
+    default_tenant,
+    max_active=TENANT_MAX_ACTIVE,
+    idle_ttl=TENANT_IDLE_TTL,
+)
+
+TENANT_REQUEST_SECONDS = registry.histogram(
+    "rag_tenant_request_duration_seconds", "End-to-end time of /invocations requests per tenant", labels=("tenant",))
+TENANT_REJECTIONS = registry.counter(
+    "rag_tenant_rejections_total", "Requests rejected because the tenant's concurrency quota was used up",
+    labels=("tenant",))
+
+async def get_tenant(name: str = None, knowledge_base_id: str = None) -> Tenant:
+    """
+    Returns the tenant for a request, loading it off the event loop if needed.
+    Raises KeyError for an unknown tenant or knowledge base.
+    """
+    name = tenant_registry.resolve(name, knowledge_base_id)
+    tenant = tenant_registry.loaded(name)
+    if tenant is None:
+        loop = asyncio.get_running_loop()
+        tenant = await loop.run_in_executor(None, tenant_registry.get, name)
+    return tenant
+
+async def acquire_tenant(name: str = None, knowledge_base_id: str = None) -> tuple:
+    """
+    Returns (tenant, acquired) for a request: the tenant as get_tenant() does, with
+    a slot of its quota taken under the same registry lock, so the tenant cannot be
+    unloaded before the request holds its slot. acquired is False if the quota is used up.
+    """
+    name = tenant_registry.resolve(name, knowledge_base_id)
+    tenant, acquired = tenant_registry.acquire_loaded(name)
+    if tenant is None:
+        loop = asyncio.get_running_loop()
+        tenant, acquired = await loop.run_in_executor(None, tenant_registry.get_and_acquire, name)
+    return tenant, acquired
+
+def release_tenant(tenant: Tenant, request_start: float):
+    seconds = time.perf_counter() - request_start
+    tenant_registry.release(tenant, seconds)
+    TENANT_REQUEST_SECONDS.observe(seconds, tenant=tenant.name)
+
+def _release_after_stream(tenant: Tenant, events, request_start: float):
+    """
+    Wraps a streamed request's events so that it keeps its tenant slot until the
+    last event is sent. A generator that is never started (the client went away
+    before the response began) never runs its finally block, so the slot is also
+    given back when the generator is discarded. Whichever comes first releases it.
+    """
+    lock = threading.Lock()
+    held = [True]
+
+    def release():
+        with lock:
+            if not held[0]:
+                return
+            held[0] = False
+        release_tenant(tenant, request_start)
+
+    async def stream():
+        try:
+            async for event in events:
+                yield event
+        finally:
+            release()
+
+    wrapped = stream()
+    weakref.finalize(wrapped, release)
+    return wrapped
+
+def get_backend(name=None, tenant: Tenant = None) -> RetrievalBackend:
+    """Returns the tenant's named retrieval backend (default: the tenant's default backend)."""
+    tenant = tenant or default_tenant
+    name = name or tenant.default_backend
+    backend = tenant.backends.get(name)
+    if backend is None:
+        raise ValueError(f"Unknown or disabled retrieval backend: {name}")
+    return backend
+
+# ---------- Retrieval ----------
+def _cached_chunks(query: str, top_k: int, backend: RetrievalBackend, tenant: Tenant):
+    """Returns cached chunks for the query, or None on a miss / when caching is disabled."""
+    if tenant.retrieval_cache is not None:
+        return tenant.retrieval_cache.get(query, top_k, scope=backend.name)
+    return None
+
+async def _cached_chunks_async(query: str, top_k: int, backend: RetrievalBackend, tenant: Tenant):
+    """Async version of _cached_chunks; the semantic lookup embeds the query, so it runs on an executor thread."""
+    cache = tenant.retrieval_cache
+    if cache is None:
+        return None
+    cached = cache.get_exact(query, top_k, scope=backend.name)
+    if cached is None and cache.semantic:
+        loop = asyncio.get_running_loop()
+        cached = await loop.run_in_executor(None, cache.get_similar, query, top_k, backend.name)
+    return cached
+
+def _retrieve_and_cache(query: str, top_k: int, backend: RetrievalBackend, tenant: Tenant) -> list:
+    """Fetches chunks from the backend and caches non-empty results. Never raises."""
+    try:
+        with BACKEND_SECONDS.time(backend=backend.name):
+            chunks = backend.retrieve(query, top_k)
     except Exception as e:
         print(f"Error retrieving from knowledge base: {e}")
         import traceback
         traceback.print_exc()
-        return ""
+        return []
+
+    if not chunks:
+        # Log warning but don't fail - return empty list
+        print(f"Warning: No results retrieved from knowledge base for query: {query}")
+        return []
+
+    if tenant.retrieval_cache is not None:
+        tenant.retrieval_cache.put(query, top_k, chunks, scope=backend.name)
+    return chunks
+
+def _submit_retrieval(query: str, top_k: int, backend: RetrievalBackend, tenant: Tenant):
+    """Schedules a blocking retrieval through the single-flight scheduler; identical concurrent queries share one call."""
+    key = (tenant.name, backend.name, normalize_query(query), top_k)
+    return retrieval_single_flight.submit(key, _retrieve_and_cache, query, top_k, backend, tenant)
+
+def retrieve_chunks(query: str, top_k: int = RETRIEVAL_TOP_K, backend_name=None, tenant: Tenant = None) -> list:
+    """
+    Returns the most relevant chunks for the query, served from the retrieval
+    cache when possible. Empty and failed retrievals are never cached.
+    """
+    tenant = tenant or default_tenant
+    backend = get_backend(backend_name, tenant)
+    cached = _cached_chunks(query, top_k, backend, tenant)
+    if cached is not None:
+        return cached
+    if backend.blocking and RETRIEVAL_SINGLE_FLIGHT_ENABLED:
+        return _submit_retrieval(query, top_k, backend, tenant).result()
+    return _retrieve_and_cache(query, top_k, backend, tenant)
+
+async def retrieve_chunks_async(query: str, top_k: int = RETRIEVAL_TOP_K, backend_name=None,
+                                tenant: Tenant = None) -> list:
+    """
+    Async version of retrieve_chunks. Exact cache hits and non-blocking backends
+    are answered on the event loop, semantic cache lookups on an executor thread; blocking backends (Bedrock) run on the bounded
+    retrieval thread pool, through the single-flight scheduler when enabled.
+    """
+    tenant = tenant or default_tenant
+    backend = get_backend(backend_name, tenant)
+    cached = await _cached_chunks_async(query, top_k, backend, tenant)
+    if cached is not None:
+        return cached
+    if not backend.blocking:
+        return _retrieve_and_cache(query, top_k, backend, tenant)
+    if RETRIEVAL_SINGLE_FLIGHT_ENABLED:
+        return await asyncio.wrap_future(_submit_retrieval(query, top_k, backend, tenant))
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_retrieval_executor, _retrieve_and_cache, query, top_k, backend, tenant)
+
+def retrieve_from_kb(query: str, top_k: int = RETRIEVAL_TOP_K, backend_name=None) -> str:
+    """
+    Retrieves the most relevant text chunks from the configured backend
+    (Bedrock Knowledge Base 'Retrieve' by default).
+    Returns a single string with all retrieved texts joined together.
+    """
+    return join_chunks(retrieve_chunks(query, top_k, backend_name))
+
+async def retrieve_from_kb_async(query: str, top_k: int = RETRIEVAL_TOP_K, backend_name=None) -> str:
+    """Async version of retrieve_from_kb."""
+    return join_chunks(await retrieve_chunks_async(query, top_k, backend_name))
+
+def join_chunks(chunks: list) -> str:
+    """Joins chunk texts into a single context string."""
+    return "".join(context_parts(chunks))
+
+# ---------- Query Expansion ----------
+# Compound questions are split into sub-queries that are retrieved concurrently and merged,
+# so the added latency is that of the slowest sub-query. "multi_query" in the payload overrides the default.
+MULTI_QUERY_ENABLED = os.getenv("MULTI_QUERY_ENABLED", "0") == "1"  # each sub-query is one more retrieval call
+MULTI_QUERY_MAX_SUBQUERIES = int(os.getenv("MULTI_QUERY_MAX_SUBQUERIES", "4"))  # including the original prompt
+MULTI_QUERY_TOP_K = int(os.getenv("MULTI_QUERY_TOP_K", str(RETRIEVAL_TOP_K)))  # chunks per sub-query
+MULTI_QUERY_MAX_CHUNKS = int(os.getenv("MULTI_QUERY_MAX_CHUNKS", str(2 * RETRIEVAL_TOP_K)))  # after merging
+# Optional LLM rewrite instead of the local heuristics; falls back to them on errors and timeouts
+QUERY_REWRITE_LLM = os.getenv("QUERY_REWRITE_LLM", "0") == "1"
+QUERY_REWRITE_MODEL_ID = os.getenv("QUERY_REWRITE_MODEL_ID", "amazon.nova-micro-v1:0")
+QUERY_REWRITE_TIMEOUT_MS = float(os.getenv("QUERY_REWRITE_TIMEOUT_MS", "800"))
+
+rewrite_client = aws_clients.lazy_client("bedrock-runtime", region=REGION)
+
+SUBQUERIES = registry.histogram(
+    "rag_retrieval_subqueries", "Sub-queries retrieved per request", buckets=(1, 2, 3, 4, 6, 8))
+
+async def expand_prompt(user_prompt: str) -> list:
+    """Sub-queries for a prompt (the prompt itself first), from the LLM rewrite or the heuristics."""
+    queries = expand_query(user_prompt, MULTI_QUERY_MAX_SUBQUERIES)
+    if not QUERY_REWRITE_LLM:
+        return queries
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(
+            loop.run_in_executor(_retrieval_executor, llm_rewrite, user_prompt, rewrite_client,
+                                 QUERY_REWRITE_MODEL_ID, MULTI_QUERY_MAX_SUBQUERIES),
+            timeout=QUERY_REWRITE_TIMEOUT_MS / 1000.0,
+        )
+    except Exception as e:
+        print(f"Warning: query rewrite failed, using heuristic sub-queries: {e!r}")
+        return queries
+
+async def retrieve_for_prompt(user_prompt: str, backend_name=None, multi_query=None, pipelined=None,
+                              tenant: Tenant = None) -> list:
+    """
+    Retrieves the chunks for a request. With query expansion, the sub-queries are
+    retrieved concurrently and merged, deduplicated by chunk location.
+    """
+    if not user_prompt:
+        return []
+    if not (MULTI_QUERY_ENABLED if multi_query is None else multi_query):
+        return await retrieve_chunks_async(user_prompt, backend_name=backend_name, tenant=tenant)
+    if PIPELINED_MODE if pipelined is None else pipelined:
+        return await _retrieve_pipelined(user_prompt, backend_name, tenant)
+    with STAGE_SECONDS.time(stage="query_expansion"):
+        queries = await expand_prompt(user_prompt)
+    SUBQUERIES.observe(len(queries))
+    if len(queries) <= 1:
+        return await retrieve_chunks_async(user_prompt, backend_name=backend_name, tenant=tenant)
+    results = await asyncio.gather(*(retrieve_chunks_async(q, MULTI_QUERY_TOP_K, backend_name, tenant)
+                                     for q in queries))
+    return merge_results(results, MULTI_QUERY_MAX_CHUNKS)
+
+# ---------- Pipelined Mode ----------
+# With query expansion on, prompt construction starts once the original prompt's chunks arrive instead of
+# after every sub-query (it still waits for that whole retrieval); without expansion the mode changes nothing.
+# "pipelined" in the payload overrides the default so both modes can be compared on the same server
+PIPELINED_MODE = os.getenv("PIPELINED_MODE", "0") == "1"
+# Extra wait for sub-queries after the original; at 0 only sub-queries already cached (e.g. prefetched) are used
+PIPELINE_GRACE_MS = float(os.getenv("PIPELINE_GRACE_MS", "0"))
+
+LATE_SUBQUERIES = registry.counter(
+    "rag_pipeline_late_subqueries_total",
+    "Sub-queries a pipelined request did not wait for (left running, or not sent at PIPELINE_GRACE_MS=0)")
+
+def _consume_result(task):
+    # Sub-queries left behind still fill the cache; just make sure their errors are not reported as unhandled
+    if not task.cancelled():
+        task.exception()
+
+async def _retrieve_pipelined(user_prompt: str, backend_name=None, tenant: Tenant = None) -> list:
+    """
+    Retrieves the original prompt while it is being expanded, then waits at most
+    PIPELINE_GRACE_MS for the sub-queries before returning what has arrived.
+    With no grace period, sub-queries are not sent at all; cached ones are used.
+    """
+    tenant = tenant or default_tenant
+    primary = asyncio.ensure_future(retrieve_chunks_async(user_prompt, MULTI_QUERY_TOP_K, backend_name, tenant))
+    with STAGE_SECONDS.time(stage="query_expansion"):
+        queries = await expand_prompt(user_prompt)
+    SUBQUERIES.observe(len(queries))
+    if PIPELINE_GRACE_MS <= 0:
+        # Nothing would wait for their results, so sending them would be pure cost
+        backend = get_backend(backend_name, tenant)
+        cached = await asyncio.gather(*[_cached_chunks_async(q, MULTI_QUERY_TOP_K, backend, tenant)
+                                        for q in queries[1:]])
+        hits = [result for result in cached if result]
+        LATE_SUBQUERIES.inc(len(cached) - len(hits))
+        chunks = await primary
+        return merge_results([chunks] + hits, MULTI_QUERY_MAX_CHUNKS) if hits else chunks
+    others = [asyncio.ensure_future(retrieve_chunks_async(q, MULTI_QUERY_TOP_K, backend_name, tenant))
+              for q in queries[1:]]
+    for task in others:
+        task.add_done_callback(_consume_result)
+    chunks = await primary
+    if not others:
+        return chunks
+    done, pending = await asyncio.wait(others, timeout=PIPELINE_GRACE_MS / 1000.0)
+    if pending:
+        LATE_SUBQUERIES.inc(len(pending))
+    results = [chunks] + [task.result() for task in others if task in done and task.exception() is None]
+    return merge_results(results, MULTI_QUERY_MAX_CHUNKS)
+
+# ---------- Prefetch ----------
+# Clients may send the prompt while the user is still typing (POST /prefetch); its retrieval starts early
+# and fills the retrieval cache, so the real request skips most of the retrieval stage
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+PREFETCH_MIN_CHARS = int(os.getenv("PREFETCH_MIN_CHARS", "12"))  # shorter partial prompts are ignored
+PREFETCH_MAX_IN_FLIGHT = int(os.getenv("PREFETCH_MAX_IN_FLIGHT", "8"))  # per worker; further hints are dropped
+
+PREFETCHES = registry.counter("rag_prefetch_hints_total", "Prefetch hints by outcome", labels=("result",))
+_prefetch_tasks = set()
+_prefetched = OrderedDict()  # (tenant, normalized prompt) prefetched recently, to count hints that paid off
+# Hints arrive on the main loop, requests on the entrypoint's worker loop
+_prefetched_lock = threading.Lock()
+
+def start_prefetch(user_prompt: str, backend_name=None, multi_query=None, tenant: Tenant = None) -> str:
+    """Starts a background retrieval for a (possibly partial) prompt. Returns the outcome."""
+    key = ((tenant or default_tenant).name, normalize_query(user_prompt))
+    with _prefetched_lock:
+        if len(key[1]) < PREFETCH_MIN_CHARS:
+            outcome = "too_short"
+        elif key in _prefetched:
+            outcome = "duplicate"
+        elif len(_prefetch_tasks) >= PREFETCH_MAX_IN_FLIGHT:
+            outcome = "dropped"
+        else:
+            outcome = "started"
+            _prefetched[key] = time.monotonic()
+            if len(_prefetched) > 1024:
+                _prefetched.popitem(last=False)
+    if outcome == "started":
+        # Always the full (non-pipelined) retrieval, so every sub-query ends up cached
+        task = asyncio.ensure_future(retrieve_for_prompt(user_prompt, backend_name, multi_query, pipelined=False,
+                                                         tenant=tenant))
+        _prefetch_tasks.add(task)
+        task.add_done_callback(_prefetch_tasks.discard)
+        task.add_done_callback(_consume_result)
+    PREFETCHES.inc(result=outcome)
+    return outcome
+
+def record_prefetch_use(user_prompt: str, tenant: Tenant = None):
+    """Counts a request whose prompt was prefetched."""
+    key = ((tenant or default_tenant).name, normalize_query(user_prompt))
+    with _prefetched_lock:
+        used = _prefetched.pop(key, None) is not None
+    if used:
+        PREFETCHES.inc(result="used")
+
+# ---------- Startup / Warm-up ----------
+# Once the server starts, build the agent framework and AWS clients in the background; /ready is red until done
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+WARMUP_AGENTS = int(os.getenv("WARMUP_AGENTS", "1"))  # pooled agents created ahead of the first request
+# Also send one retrieval to the default backend, priming credentials, DNS/TLS and a pooled connection
+WARMUP_REQUEST = os.getenv("WARMUP_REQUEST", "0") == "1"
+WARMUP_QUERY = os.getenv("WARMUP_QUERY", "What is NovaTech?")
+
+def _warm_agents():
+    session_manager.prefill(WARMUP_AGENTS)
+
+def _warm_clients():
+    resolve = getattr(kb_client, "resolve", None)
+    if resolve is not None:
+        resolve()
+
+def _warm_request():
+    get_backend().retrieve(WARMUP_QUERY, 1)
+
+def _warmup_done():
+    stats = warmup.stats()
+    steps = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in stats["steps"].items())
+    print(f"Warm-up finished in {stats['seconds']:.2f}s ({steps}); "
+          f"import took {startup_timer.report()['total_seconds']:.2f}s")
+    if _readiness["reason"] == "warming up":
+        set_ready(True)
+
+_warmup_steps = [("agents", _warm_agents), ("clients", _warm_clients)]
+if WARMUP_REQUEST:
+    _warmup_steps.append(("request", _warm_request))
+warmup = WarmUp(_warmup_steps, on_done=_warmup_done)
+
+@asynccontextmanager
+async def lifespan(app):
+    # Runs in each server process (after serve.py forks), so connections are never shared between workers
+    if WARMUP_ENABLED:
+        set_ready(False, "warming up")
+        warmup.start()
+    yield
 
 # ---------- Agent ----------
-app = BedrockAgentCoreApp()
-agent = Agent()   # default chat-style agent
+app = BedrockAgentCoreApp(lifespan=lifespan)
+
+# Messages kept per conversation when the payload carries a session_id
+SESSION_HISTORY_WINDOW = int(os.getenv("SESSION_HISTORY_WINDOW", "10"))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "900"))  # seconds
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+# Idle stateless agents kept around for reuse by requests without a session_id
+AGENT_POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", "16"))
+
+def make_agent(window_size: int):
+    """Creates a default chat-style agent whose history is capped at window_size messages."""
+    # Imported here so importing this module (and answering /health) doesn't wait for the agent framework
+    from strands import Agent
+    from strands.agent.conversation_manager import SlidingWindowConversationManager
+    return Agent(conversation_manager=SlidingWindowConversationManager(window_size=window_size))
+
+session_manager = SessionManager(
+    agent_factory=make_agent,
+    window_size=SESSION_HISTORY_WINDOW,
+    idle_ttl=SESSION_IDLE_TTL,
+    max_sessions=SESSION_MAX,
+    pool_size=AGENT_POOL_SIZE,
+)
+
+# ---------- Readiness ----------
+# /health says the process is alive; /ready says it should receive traffic (false while draining for shutdown)
+_readiness = {"ready": True, "reason": ""}
+
+def set_ready(ready: bool, reason: str = ""):
+    """Flips the readiness probe, e.g. to drain a worker before it stops."""
+    _readiness["ready"] = ready
+    _readiness["reason"] = reason
+
+# ---------- Metrics (scrape-time gauges) ----------
+def _cache_events():
+    stats = retrieval_cache.stats()
+    return {("hit",): stats["hits"], ("semantic_hit",): stats["semantic_hits"], ("miss",): stats["misses"]}
+
+registry.counter("rag_retrieval_cache_lookups_total", "Retrieval cache lookups by result", labels=("result",),
+                 fn=_cache_events)
+registry.gauge("rag_retrieval_cache_hit_ratio", "Share of retrieval cache lookups served from cache",
+               fn=lambda: retrieval_cache.stats()["hit_rate"])
+registry.gauge("rag_retrieval_cache_entries", "Entries in the retrieval cache", fn=lambda: retrieval_cache.stats()["size"])
+def _answer_cache_events():
+    stats = answer_cache.stats()
+    return {("hit",): stats["hits"], ("disk_hit",): stats["disk_hits"], ("miss",): stats["misses"]}
+
+registry.counter("rag_answer_cache_lookups_total", "Answer cache lookups by result", labels=("result",),
+                 fn=_answer_cache_events)
+registry.gauge("rag_answer_cache_entries", "Entries in the in-memory answer cache", fn=lambda: answer_cache.stats()["size"])
+registry.counter("rag_retrieval_deduplicated_calls_total", "Retrievals that shared an in-flight call",
+                 fn=lambda: retrieval_single_flight.stats()["deduplicated"])
+registry.counter("rag_retrieval_dispatched_calls_total", "Retrievals dispatched to a backend",
+                 fn=lambda: retrieval_single_flight.stats()["dispatched"])
+registry.gauge("rag_tenants_loaded", "Tenants with their resources loaded", fn=lambda: len(tenant_registry.loaded_tenants()))
+registry.counter("rag_tenant_loads_total", "Tenant resource builds (first use or after eviction)",
+                 fn=lambda: tenant_registry.loads)
+registry.counter("rag_tenant_evictions_total", "Idle tenants unloaded", fn=lambda: tenant_registry.evictions)
+registry.gauge("rag_tenant_in_flight", "Requests in flight per loaded tenant", labels=("tenant",),
+               fn=lambda: {(tenant.name,): tenant.active for tenant in tenant_registry.loaded_tenants()})
+registry.gauge("rag_agent_sessions", "Agent sessions held in memory", fn=lambda: session_manager.stats()["sessions"])
+registry.gauge("rag_agent_pool_idle", "Idle pooled agents", fn=lambda: session_manager.stats()["pooled_agents"])
+
+def _aws_stat(name):
+    return lambda: {(service,): stats[name] for service, stats in aws_clients.stats_by_service().items()}
+
+def _startup_phases():
+    phases = {(name,): seconds for name, seconds in startup_timer.phases.items()}
+    phases.update({(f"warmup_{name}",): seconds for name, seconds in warmup.stats()["steps"].items()})
+    return phases
+
+registry.gauge("rag_startup_seconds", "Time spent in each import and warm-up phase", labels=("phase",),
+               fn=_startup_phases)
+registry.counter("rag_aws_attempts_total", "AWS API call attempts, retries included", labels=("service",),
+                 fn=_aws_stat("attempts"))
+registry.counter("rag_aws_throttled_total", "AWS API attempts rejected with a throttling error",
+                 labels=("service",), fn=_aws_stat("throttled"))
+registry.counter("rag_aws_errors_total", "AWS API attempts that failed for other reasons", labels=("service",),
+                 fn=_aws_stat("errors"))
+registry.gauge("rag_aws_in_flight", "AWS API attempts currently in flight", labels=("service",),
+               fn=_aws_stat("in_flight"))
+registry.gauge("rag_aws_in_flight_peak", "Highest number of concurrent AWS API attempts", labels=("service",),
+               fn=_aws_stat("peak_in_flight"))
+registry.counter("rag_aws_pool_saturated_total", "AWS API attempts started while every pooled connection was busy",
+                 labels=("service",), fn=_aws_stat("pool_saturated"))
+registry.counter("rag_aws_rate_limit_wait_seconds_total", "Time spent waiting on the client-side rate limiter",
+                 labels=("service",), fn=_aws_stat("rate_limit_wait_seconds"))
+registry.counter("rag_aws_pool_discarded_connections_total",
+                 "Connections discarded because a connection pool was full", fn=aws_clients.pool_full_discards)
+
+# ---------- Admission Control ----------
+# Bounds concurrent /invocations work per worker; excess load is queued briefly, then rejected with Retry-After
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "48"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "96"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))  # seconds a request may wait
+CLIENT_RATE_LIMIT = float(os.getenv("CLIENT_RATE_LIMIT", "0"))  # requests per second per client (0 = none)
+CLIENT_RATE_BURST = float(os.getenv("CLIENT_RATE_BURST", "0"))  # 0 = same as the rate
+CLIENT_ID_HEADER = os.getenv("CLIENT_ID_HEADER", "x-api-key")  # header identifying a client; else its IP
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "0") == "1"  # only behind a trusted proxy
+
+admission = AdmissionController(
+    max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+    max_queue=ADMISSION_MAX_QUEUE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+    client_rate=CLIENT_RATE_LIMIT,
+    client_burst=CLIENT_RATE_BURST,
+)
+if ADMISSION_ENABLED:
+    # Added before CORS so rejections still carry CORS headers
+    # /prefetch starts retrievals too, so hints take in-flight slots. They are not rate limited per client:
+    # a client sends several hints per question, which would use up the tokens of its /invocations requests.
+    # PREFETCH_MAX_IN_FLIGHT bounds them instead.
+    app.add_middleware(AdmissionMiddleware, controller=admission, paths=("/invocations", "/prefetch"),
+                       rate_limited_paths=("/invocations",), client_header=CLIENT_ID_HEADER, trust_forwarded=TRUST_FORWARDED_FOR)
+
+registry.gauge("rag_admission_in_flight", "Admission-controlled requests being handled",
+               fn=lambda: admission.in_flight)
+registry.gauge("rag_admission_queue_depth", "Requests waiting for an in-flight slot",
+               fn=lambda: admission.stats()["queue_depth"])
+registry.counter("rag_admission_admitted_total", "Requests admitted", fn=lambda: admission.admitted)
+registry.counter("rag_admission_queue_wait_seconds_total", "Total time requests spent waiting in the admission queue",
+                 fn=lambda: admission.queue_wait_seconds)
+registry.counter("rag_admission_rejections_total", "Requests rejected by admission control", labels=("reason",),
+                 fn=lambda: {(reason,): count for reason, count in admission.rejections.items()})
 
 # ---------- CORS Middleware ----------
 # Allow CORS for browser requests
@@ -81,40 +771,188 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+_PROMPT_HEADER = (
+    "You are a helpful assistant for NovaTech Solutions. Use ONLY the information provided in the CONTEXT below to answer the question.\n\n"
+    "CONTEXT FROM KNOWLEDGE BASE:\n"
+)
+_PROMPT_QUESTION = "\n\nQUESTION: "
+_PROMPT_INSTRUCTIONS = (
+    "\n\n"
+    "INSTRUCTIONS:\n"
+    "- Answer based ONLY on the context provided above\n"
+    "- If the context contains the answer, provide a clear and concise response\n"
+    "- If the context doesn't contain enough information, say 'I don't have enough information in the knowledge base to answer this question.'\n"
+    "- Do not make up information or use knowledge outside of the provided context"
+)
+
+def build_prompt(user_prompt: str, chunks: list) -> str:
+    """Builds the agent prompt from the user question and the selected context chunks."""
+    if chunks:
+        # One join over the template pieces and the chunk texts themselves: the joined string is
+        # allocated once at its final size, with no intermediate context string
+        parts = [_PROMPT_HEADER, *context_parts(chunks), _PROMPT_QUESTION, user_prompt, _PROMPT_INSTRUCTIONS]
+        return "".join(parts)
+    return (
+        "You are a helpful assistant for NovaTech Solutions.\n\n"
+        f"QUESTION: {user_prompt}\n\n"
+        "I don't have enough information in the knowledge base to answer this question. "
+        "Please make sure the knowledge base has been synced and contains relevant information."
+    )
+
+def result_text(result) -> str:
+    """Normalizes an agent result to plain text."""
+    try:
+        return result.message["content"][0]["text"]
+    except Exception:
+        return str(result.message)
+
+async def run_agent(prompt: str, session_id=None):
+    """Invokes an agent for the request (or its session) without blocking the event loop."""
+    async with session_manager.agent_for(session_id) as agent:
+        return await agent.invoke_async(prompt)
+
+async def stream_agent(prompt: str, session_id=None):
+    """Streams text deltas from the agent as they are generated; yields the final AgentResult last."""
+    async with session_manager.agent_for(session_id) as agent:
+        async for event in agent.stream_async(prompt):
+            if "data" in event:
+                yield event["data"]
+            elif "result" in event:
+                yield event["result"]
+
+def source_references(chunks: list) -> list:
+    """Returns the distinct sources of the retrieved chunks with their best score."""
+    sources = {}
+    for chunk in chunks:
+        uri = chunk.source
+        score = chunk.score
+        if uri not in sources or (score is not None and (sources[uri] is None or score > sources[uri])):
+            sources[uri] = score
+    return [{"source": uri, "score": score} for uri, score in sources.items() if uri]
+
+async def stream_invoke(user_prompt: str, session_id=None, backend_name=None, multi_query=None, pipelined=None,
+                        tenant: Tenant = None):
+    """
+    Streaming variant of invoke. Yields events that the runtime sends as SSE:
+    a "sources" event as soon as retrieval and context selection finish, one
+    "token" event per text delta, and a final "done" event with the full answer.
+    """
+    request_start = time.perf_counter()
+    REQUESTS_TOTAL.inc(mode="stream")
+    with STAGE_SECONDS.time(stage="retrieval"):
+        chunks = await retrieve_for_prompt(user_prompt, backend_name, multi_query, pipelined, tenant)
+
+    with STAGE_SECONDS.time(stage="context_assembly"):
+        selected, _ = select_context(chunks)
+        combined = build_prompt(user_prompt, selected)
+    yield {"type": "sources", "sources": source_references(selected)}
+
+    cache_key = answer_cache_key(user_prompt, selected, session_id)
+    cached = await get_cached_answer(cache_key) if cache_key else None
+    if cached is not None:
+        yield {"type": "token", "data": cached}
+        REQUEST_SECONDS.observe(time.perf_counter() - request_start, mode="stream")
+        yield {"type": "done", "result": cached}
+        return
+
+    parts = []
+    agent_start = time.perf_counter()
+    async for item in stream_agent(combined, session_id):
+        if isinstance(item, str):
+            if not parts:
+                STAGE_SECONDS.observe(time.perf_counter() - agent_start, stage="first_token")
+            parts.append(item)
+            yield {"type": "token", "data": item}
+        else:
+            # Prefer the normalized final message if the model produced no deltas
+            if not parts:
+                parts.append(result_text(item))
+    STAGE_SECONDS.observe(time.perf_counter() - agent_start, stage="agent")
+    REQUEST_SECONDS.observe(time.perf_counter() - request_start, mode="stream")
+    answer = "".join(parts)
+    if cache_key and answer:
+        store_answer(cache_key, answer)
+    done = {"type": "done", "result": answer}
+    if session_id:
+        done["session_id"] = session_id
+    yield done
+
 @app.entrypoint
-def invoke(payload):
+async def invoke(payload):
     user_prompt = payload.get("prompt", "").strip()
-    
+    # Optional: keeps a bounded conversation history across requests with the same ID
+    session_id = payload.get("session_id")
+    # Optional: the knowledge base to answer from, by tenant name or knowledge base ID
+    try:
+        tenant, acquired = await acquire_tenant(payload.get("tenant"), payload.get("knowledge_base_id"))
+    except KeyError as e:
+        return JSONResponse({"error": e.args[0]}, status_code=400)
+    if not acquired:
+        TENANT_REJECTIONS.inc(tenant=tenant.name)
+        return JSONResponse({"error": "Tenant concurrency quota exceeded, retry later", "tenant": tenant.name},
+                            status_code=429, headers={"Retry-After": "1"})
+    # Optional: "bedrock" or "local" to compare retrieval backends per request
+    backend_name = payload.get("retrieval_backend")
+    if backend_name and backend_name not in tenant.backends:
+        tenant_registry.release(tenant)
+        return JSONResponse({"error": f"Unknown or disabled retrieval backend: {backend_name}"}, status_code=400)
+    # Optional: true/false to force query expansion on or off for this request
+    multi_query = payload.get("multi_query")
+    # Optional: true/false to choose pipelined or sequential retrieval for this request
+    pipelined = payload.get("pipelined")
+    record_prefetch_use(user_prompt, tenant)
+
+    request_start = time.perf_counter()
+
+    # Streaming mode: returning an async generator makes the runtime respond with SSE
+    if payload.get("stream"):
+        events = stream_invoke(user_prompt, session_id, backend_name, multi_query, pipelined, tenant)
+        return _release_after_stream(tenant, events, request_start)
+
+    REQUESTS_TOTAL.inc(mode="json")
+    try:
+        answer, _ = await answer_prompt(user_prompt, session_id, backend_name, multi_query, pipelined, tenant)
+    finally:
+        release_tenant(tenant, request_start)
+    response = {"result": answer}
+    if session_id:
+        response["session_id"] = session_id
+    REQUEST_SECONDS.observe(time.perf_counter() - request_start, mode="json")
+    return response
+
+
+async def answer_prompt(user_prompt: str, session_id: str = None, backend_name: str = None,
+                        multi_query: bool = None, pipelined: bool = None, tenant: Tenant = None) -> tuple:
+    """
+    Answers one prompt without streaming: retrieval, context assembly, answer
+    cache, agent. Returns (answer text, chunks used as context). Shared by the
+    JSON entrypoint and the batch CLI (scripts/batch_answer.py).
+    """
     # Retrieve context from knowledge base
-    context = retrieve_from_kb(user_prompt) if user_prompt else ""
-    
+    with STAGE_SECONDS.time(stage="retrieval"):
+        chunks = await retrieve_for_prompt(user_prompt, backend_name, multi_query, pipelined, tenant)
+
     # Build the prompt with context
-    if context:
-        combined = (
-            "You are a helpful assistant for NovaTech Solutions. Use ONLY the information provided in the CONTEXT below to answer the question.\n\n"
-            f"CONTEXT FROM KNOWLEDGE BASE:\n{context}\n\n"
-            f"QUESTION: {user_prompt}\n\n"
-            "INSTRUCTIONS:\n"
-            "- Answer based ONLY on the context provided above\n"
-            "- If the context contains the answer, provide a clear and concise response\n"
-            "- If the context doesn't contain enough information, say 'I don't have enough information in the knowledge base to answer this question.'\n"
-            "- Do not make up information or use knowledge outside of the provided context"
-        )
-    else:
-        combined = (
-            "You are a helpful assistant for NovaTech Solutions.\n\n"
-            f"QUESTION: {user_prompt}\n\n"
-            "I don't have enough information in the knowledge base to answer this question. "
-            "Please make sure the knowledge base has been synced and contains relevant information."
-        )
+    with STAGE_SECONDS.time(stage="context_assembly"):
+        selected, _ = select_context(chunks)
+        combined = build_prompt(user_prompt, selected)
 
-    result = agent(combined)
-    # Normalize to plain text
-    try:
-        text = result.message["content"][0]["text"]
-    except Exception:
-        text = str(result.message)
-    return {"result": text}
+    # Repeated stateless questions over unchanged context skip generation entirely
+    cache_key = answer_cache_key(user_prompt, selected, session_id)
+    if cache_key:
+        with STAGE_SECONDS.time(stage="answer_cache"):
+            cached = await get_cached_answer(cache_key)
+        if cached is not None:
+            return cached, selected
+
+    with STAGE_SECONDS.time(stage="agent"):
+        result = await run_agent(combined, session_id)
+
+    with STAGE_SECONDS.time(stage="normalize"):
+        answer = result_text(result)
+        if cache_key:
+            store_answer(cache_key, answer)
+    return answer, selected
 
 # ---------- Additional Routes ----------
 @app.route("/", methods=["GET"])
@@ -124,7 +962,17 @@ async def root(request):
         "endpoints": {
             "/": "This information page (GET)",
             "/health": "Health check (GET)",
-            "/invocations": "Main entrypoint - send POST request with JSON body: {\"prompt\": \"your question here\"}"
+            "/ready": "Readiness probe; 503 while the worker is not ready for traffic (GET)",
+            "/metrics": "Prometheus metrics: per-stage latency histograms, context sizes, cache hit rates (GET)",
+            "/debug/cache": "Retrieval and answer cache statistics (GET)",
+            "/debug/sessions": "Agent session and pool statistics (GET)",
+            "/debug/single-flight": "Retrieval single-flight deduplication statistics (GET)",
+            "/debug/clients": "AWS client pool, retry and throttling statistics (GET)",
+            "/debug/startup": "Import and warm-up timing breakdown (GET)",
+            "/debug/admission": "Admission control: in-flight requests, queue depth and rejections (GET)",
+            "/debug/tenants": "Configured and loaded tenants (knowledge bases), quotas, evictions and per-tenant latency (GET)",
+            "/prefetch": "Typing-time hint: starts retrieval for a partial prompt so the real request finds it cached (POST {\"prompt\": ...})",
+            "/invocations": "Main entrypoint - send POST request with JSON body: {\"prompt\": \"your question here\"}; add \"stream\": true for Server-Sent Events, \"session_id\" for multi-turn conversations and \"tenant\" to pick a knowledge base"
         },
         "example_curl": "curl -X POST http://127.0.0.1:18080/invocations -H 'Content-Type: application/json' -d '{\"prompt\": \"What is NovaTech?\"}'"
     })
@@ -133,40 +981,144 @@ async def root(request):
 async def health_check(request):
     return JSONResponse({"status": "healthy"})
 
+@app.route("/ready", methods=["GET"])
+async def readiness_probe(request):
+    """Readiness probe for load balancers and orchestrators"""
+    if not _readiness["ready"]:
+        return JSONResponse({"status": "not_ready", "reason": _readiness["reason"]}, status_code=503)
+    return JSONResponse({"status": "ready", "pid": os.getpid()})
+
+@app.route("/prefetch", methods=["POST"])
+async def prefetch(request):
+    """Starts retrieval for a prompt that is still being typed; returns immediately"""
+    if not PREFETCH_ENABLED:
+        return JSONResponse({"status": "disabled"})
+    try:
+        data = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "Invalid JSON"}, status_code=400)
+    try:
+        tenant = await get_tenant(data.get("tenant"), data.get("knowledge_base_id"))
+    except KeyError as e:
+        return JSONResponse({"error": e.args[0]}, status_code=400)
+    backend_name = data.get("retrieval_backend")
+    if backend_name and backend_name not in tenant.backends:
+        return JSONResponse({"error": f"Unknown or disabled retrieval backend: {backend_name}"}, status_code=400)
+    outcome = start_prefetch(str(data.get("prompt", "")).strip(), backend_name, data.get("multi_query"), tenant)
+    return JSONResponse({"status": outcome}, status_code=202 if outcome == "started" else 200)
+
+@app.route("/metrics", methods=["GET"])
+async def prometheus_metrics(request):
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.route("/debug/cache", methods=["GET"])
+async def debug_cache(request):
+    """Retrieval and answer cache hit/miss counters"""
+    answer_stats = {"enabled": ANSWER_CACHE_ENABLED, **answer_cache.stats()}
+    if answer_cache.disk_enabled:
+        answer_stats["disk_size"] = await asyncio.get_running_loop().run_in_executor(None, answer_cache.disk_size)
+    return JSONResponse({
+        "enabled": RETRIEVAL_CACHE_ENABLED,
+        "knowledge_base_version": kb_version.current_version(),
+        **retrieval_cache.stats(),
+        "answer_cache": answer_stats,
+    })
+
+@app.route("/debug/single-flight", methods=["GET"])
+async def debug_single_flight(request):
+    """Retrieval single-flight deduplication counters"""
+    return JSONResponse({"enabled": RETRIEVAL_SINGLE_FLIGHT_ENABLED, **retrieval_single_flight.stats()})
+
+@app.route("/debug/clients", methods=["GET"])
+async def debug_clients(request):
+    """AWS client pool, throttling and rate limiter counters"""
+    return JSONResponse({
+        "retry_mode": aws_clients.AWS_RETRY_MODE,
+        "max_attempts": aws_clients.AWS_MAX_ATTEMPTS,
+        "rate_limit": aws_clients.AWS_RATE_LIMIT,
+        "pool_discarded_connections": aws_clients.pool_full_discards(),
+        "clients": aws_clients.client_stats(),
+    })
+
+@app.route("/debug/startup", methods=["GET"])
+async def debug_startup(request):
+    """Import/start-up timing breakdown and warm-up status"""
+    return JSONResponse({
+        "import": startup_timer.report(),
+        "warmup": {"enabled": WARMUP_ENABLED, **warmup.stats()},
+        "ready": _readiness["ready"],
+        "kb_client_created": getattr(kb_client, "created", True),
+        "agents_created": session_manager.stats()["created_agents"],
+    })
+
+@app.route("/debug/admission", methods=["GET"])
+async def debug_admission(request):
+    """Admission control, queue and rate limiting counters"""
+    return JSONResponse({"enabled": ADMISSION_ENABLED, "client_rate_limit": CLIENT_RATE_LIMIT, **admission.stats()})
+
+@app.route("/debug/tenants", methods=["GET"])
+async def debug_tenants(request):
+    """Tenant registry: loaded tenants, quotas, evictions and request latency per tenant"""
+    stats = tenant_registry.stats()
+    for name, tenant_stats in stats["tenants"].items():
+        tenant_stats["latency_seconds"] = TENANT_REQUEST_SECONDS.percentiles(tenant=name)
+    return JSONResponse(stats)
+
+@app.route("/debug/sessions", methods=["GET"])
+async def debug_sessions(request):
+    """Agent session and pool counters"""
+    return JSONResponse(session_manager.stats())
+
 @app.route("/debug/retrieval", methods=["POST"])
 async def debug_retrieval(request):
     """Debug endpoint to test knowledge base retrieval"""
     try:
         data = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "Invalid JSON"}, status_code=400)
+    try:
+        tenant = await get_tenant(data.get("tenant"), data.get("knowledge_base_id"))
+    except KeyError as e:
+        return JSONResponse({"error": e.args[0]}, status_code=400)
+    # Same field as /invocations; "backend" is still accepted
+    backend_name = data.get("retrieval_backend") or data.get("backend")
+    if backend_name and backend_name not in tenant.backends:
+        return JSONResponse({"error": f"Unknown or disabled retrieval backend: {backend_name}"}, status_code=400)
+    try:
+        top_k = int(data.get("top_k", RETRIEVAL_TOP_K))
+    except (TypeError, ValueError):
+        top_k = 0
+    if top_k < 1:
+        return JSONResponse({"error": f"top_k must be a positive integer, got {data.get('top_k')!r}"}, status_code=400)
+    try:
         query = data.get("query", "NovaTech")
-        
-        # Test retrieval
-        context = retrieve_from_kb(query, top_k=3)
-        
-        # Also get raw response for debugging
-        try:
-            resp = kb_client.retrieve(
-                knowledgeBaseId=KNOWLEDGE_BASE_ID,
-                retrievalQuery={"text": query},
-                retrievalConfiguration={"vectorSearchConfiguration": {"numberOfResults": 3}}
-            )
-            raw_results = resp.get("retrievalResults", [])
-        except Exception as e:
-            raw_results = []
-            error = str(e)
-        
+        backend = get_backend(backend_name, tenant)
+        # Same retrieval (and cache) as /invocations; the chunks carry everything shown below
+        chunks = await retrieve_chunks_async(query, top_k=top_k, backend_name=backend.name, tenant=tenant)
+        _, budget_report = select_context(chunks, record=False)
+        context_chars = context_length(chunks)
+        preview = join_chunks(chunks)[:500] if chunks else ""
+
         return JSONResponse({
             "query": query,
-            "context_retrieved": context[:500] if context else "No context retrieved",
-            "context_length": len(context) if context else 0,
-            "num_results": len(raw_results),
-            "raw_results_count": len(raw_results),
-            "knowledge_base_id": KNOWLEDGE_BASE_ID,
-            "status": "success" if context else "no_results"
+            "context_retrieved": preview or "No context retrieved",
+            "context_length": context_chars,
+            "num_results": len(chunks),
+            "tenant": tenant.name,
+            "knowledge_base_id": tenant.knowledge_base_id,
+            "backend": backend.name,
+            "sub_queries": expand_query(query, MULTI_QUERY_MAX_SUBQUERIES),
+            "hybrid": isinstance(backend, HybridBackend),
+            "sources": [{"source": c.source, "score": c.score, "id": c.id} for c in chunks],
+            "context_budget": budget_report,
+            "status": "success" if chunks else "no_results"
         })
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
+startup_timer.mark("app_setup")
+
 if __name__ == "__main__":
     # Use a high port to avoid conflicts on Windows dev machines
     app.run(host="127.0.0.1", port=18080)
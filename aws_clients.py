@@ -0,0 +1,255 @@
+"""
+Shared boto3 client factory used by the server and the scripts.
+
+botocore defaults (10 pooled connections, legacy retries, 60 s timeouts) fall
+over under concurrency: requests queue for connections or open throw-away
+ones, and throttling errors are retried in lockstep. Clients from
+get_client() are configured with:
+
+- a configurable connection pool size and TCP keep-alive,
+- connect/read timeouts,
+- botocore's adaptive retry mode (exponential backoff with jitter, plus a
+  client-side send rate that backs off when the service throttles),
+- an optional fixed client-side rate limit (token bucket),
+
+and are instrumented with counters (attempts, throttling, errors, in-flight
+and pool-saturation) so the pool and limits can be sized under real load.
+Clients are cached, so every caller asking for the same configuration shares
+one client and its connection pool. lazy_client() returns a stand-in that
+builds the client (and imports boto3) only when it is first used.
+"""
+import logging
+import os
+import threading
+
+from rate_limit import TokenBucket
+
+# ---------- Config ----------
+REGION = os.getenv("AWS_REGION", "us-east-2")
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "32"))
+AWS_CONNECT_TIMEOUT = float(os.getenv("AWS_CONNECT_TIMEOUT", "3"))  # seconds
+AWS_READ_TIMEOUT = float(os.getenv("AWS_READ_TIMEOUT", "30"))  # seconds
+AWS_RETRY_MODE = os.getenv("AWS_RETRY_MODE", "adaptive")  # "adaptive", "standard" or "legacy"
+AWS_MAX_ATTEMPTS = int(os.getenv("AWS_MAX_ATTEMPTS", "5"))
+AWS_TCP_KEEPALIVE = os.getenv("AWS_TCP_KEEPALIVE", "1") == "1"
+# Fixed client-side limit in requests per second per client (0 = none; adaptive retries still back off)
+AWS_RATE_LIMIT = float(os.getenv("AWS_RATE_LIMIT", "0"))
+AWS_RATE_BURST = float(os.getenv("AWS_RATE_BURST", "0"))  # 0 = same as the rate
+
+THROTTLING_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "TooManyRequestsException",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "RequestLimitExceeded",
+    "ProvisionedThroughputExceededException",
+    "SlowDown",
+    "BandwidthLimitExceeded",
+}
+
+
+class ClientStats:
+    """Counters for one client; updated from botocore event hooks."""
+
+    def __init__(self, service: str, max_pool_connections: int):
+        self.service = service
+        self.max_pool_connections = max_pool_connections
+        self._lock = threading.Lock()
+        self.attempts = 0
+        self.throttled = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.saturated = 0
+        self.rate_limited = 0
+        self.rate_limit_wait_seconds = 0.0
+
+    def started(self, waited: float):
+        with self._lock:
+            self.attempts += 1
+            if self.in_flight >= self.max_pool_connections:
+                # Every pooled connection is busy: this attempt opens a connection that will be thrown away
+                self.saturated += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            if waited > 0:
+                self.rate_limited += 1
+                self.rate_limit_wait_seconds += waited
+
+    def finished(self, throttled: bool, error: bool):
+        with self._lock:
+            self.in_flight = max(self.in_flight - 1, 0)
+            if throttled:
+                self.throttled += 1
+            elif error:
+                self.errors += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "service": self.service,
+                "max_pool_connections": self.max_pool_connections,
+                "attempts": self.attempts,
+                "throttled": self.throttled,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "pool_saturated": self.saturated,
+                "rate_limited": self.rate_limited,
+                "rate_limit_wait_seconds": self.rate_limit_wait_seconds,
+            }
+
+
+class _PoolFullCounter(logging.Filter):
+    """Counts urllib3's 'Connection pool is full, discarding connection' warnings without hiding them."""
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def filter(self, record) -> bool:
+        if "Connection pool is full" in str(record.msg):
+            self.count += 1
+        return True
+
+
+_pool_full = _PoolFullCounter()
+logging.getLogger("urllib3.connectionpool").addFilter(_pool_full)
+
+_lock = threading.Lock()
+_session = None
+_clients = {}  # configuration key -> client
+_stats = []  # ClientStats, one per client
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        # A dedicated session: the default boto3 session is not safe to create clients from concurrently
+        import boto3
+        _session = boto3.session.Session()
+    return _session
+
+
+def _instrument(client, stats: ClientStats, limiter):
+    """Registers the rate limiter and counters on a client's event hooks (per attempt, retries included)."""
+
+    def before_send(**kwargs):
+        waited = limiter.acquire() if limiter is not None else 0.0
+        stats.started(waited)
+        # Returning None lets botocore send the request
+
+    def after_attempt(response=None, caught_exception=None, **kwargs):
+        throttled = False
+        error = caught_exception is not None
+        if response is not None:
+            http_response, parsed = response
+            code = (parsed or {}).get("Error", {}).get("Code", "")
+            throttled = code in THROTTLING_ERROR_CODES or http_response.status_code == 429
+            error = error or http_response.status_code >= 400
+        stats.finished(throttled, error)
+        # Returning None leaves the retry decision to botocore's retry handler
+
+    client.meta.events.register("before-send", before_send)
+    client.meta.events.register("needs-retry", after_attempt)
+
+
+def get_client(service: str, region: str = None, max_pool_connections: int = None, rate_limit: float = None,
+               rate_burst: float = None, endpoint_url: str = None, **config_overrides):
+    """
+    Returns a shared, tuned boto3 client for the service.
+
+    Args:
+        service: boto3 service name, e.g. "bedrock-agent-runtime"
+        region: AWS region (default: AWS_REGION)
+        max_pool_connections: Connection pool size (default: AWS_MAX_POOL_CONNECTIONS)
+        rate_limit: Client-side requests per second (default: AWS_RATE_LIMIT, 0 = unlimited)
+        rate_burst: Token bucket capacity (default: AWS_RATE_BURST, or the rate)
+        endpoint_url: Custom endpoint, e.g. a local stub service
+        **config_overrides: Extra botocore Config options
+    """
+    region = region or REGION
+    pool = max_pool_connections or AWS_MAX_POOL_CONNECTIONS
+    rate = AWS_RATE_LIMIT if rate_limit is None else rate_limit
+    burst = (AWS_RATE_BURST if rate_burst is None else rate_burst) or None
+    # repr() so that dict-valued options (e.g. retries) can be part of the key
+    key = (service, region, pool, rate, burst, endpoint_url, repr(sorted(config_overrides.items())))
+    with _lock:
+        client = _clients.get(key)
+        if client is not None:
+            return client
+        options = {
+            "region_name": region,
+            "max_pool_connections": pool,
+            "connect_timeout": AWS_CONNECT_TIMEOUT,
+            "read_timeout": AWS_READ_TIMEOUT,
+            "tcp_keepalive": AWS_TCP_KEEPALIVE,
+            "retries": {"mode": AWS_RETRY_MODE, "max_attempts": AWS_MAX_ATTEMPTS},
+        }
+        options.update(config_overrides)
+        from botocore.config import Config
+        client = _get_session().client(service, endpoint_url=endpoint_url, config=Config(**options))
+        stats = ClientStats(service, pool)
+        _instrument(client, stats, TokenBucket(rate, burst) if rate > 0 else None)
+        _clients[key] = client
+        _stats.append(stats)
+        return client
+
+
+def client_stats() -> list:
+    """Returns the counters of every client created so far."""
+    with _lock:
+        stats = list(_stats)
+    return [s.snapshot() for s in stats]
+
+
+def stats_by_service() -> dict:
+    """Counters summed per service (peaks are maxed)."""
+    totals = {}
+    for s in client_stats():
+        total = totals.setdefault(s["service"], {key: 0 for key in s if key != "service"})
+        for key, value in s.items():
+            if key == "service":
+                continue
+            total[key] = max(total[key], value) if key == "peak_in_flight" else total[key] + value
+    return totals
+
+
+def pool_full_discards() -> int:
+    """Connections urllib3 discarded because a pool was full (process-wide)."""
+    return _pool_full.count
+
+
+class LazyClient:
+    """Stand-in for a client from get_client(); the real client is built on first attribute access."""
+
+    def __init__(self, service: str, **kwargs):
+        self._lazy_service = service
+        self._lazy_kwargs = kwargs
+        self._lazy_client = None
+        self._lazy_lock = threading.Lock()
+
+    def resolve(self):
+        """Builds (once) and returns the real client."""
+        if self._lazy_client is None:
+            with self._lazy_lock:
+                if self._lazy_client is None:
+                    self._lazy_client = get_client(self._lazy_service, **self._lazy_kwargs)
+        return self._lazy_client
+
+    @property
+    def created(self) -> bool:
+        return self._lazy_client is not None
+
+    def __getattr__(self, name):
+        # Only called for attributes not defined on the stand-in itself
+        if name.startswith("_lazy_"):
+            raise AttributeError(name)
+        return getattr(self.resolve(), name)
+
+
+def lazy_client(service: str, **kwargs) -> LazyClient:
+    """Like get_client(), but defers building the client until it is first used."""
+    return LazyClient(service, **kwargs)
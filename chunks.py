@@ -0,0 +1,53 @@
+"""
+Compact record for retrieved chunks.
+
+Every retrieval result used to be a fresh four-key dict, copied again by rank
+fusion and reranking. Chunk is a __slots__ record instead: it has no
+per-instance dict, and rescoring it makes a new record that shares the
+original text string rather than copying it. Source URIs repeat across
+results and requests, so they are interned and each URI is stored once.
+Local index and BM25 records are Chunks too, so their search results point
+at the loaded corpus text.
+
+A chunk carries two scores: `score` ranks it and is replaced by rank fusion
+and reranking, while `relevance` keeps the vector retriever's similarity
+(None for keyword-only matches), so relevance thresholds keep their meaning
+whichever backend ranked the chunk.
+"""
+import sys
+
+
+class Chunk:
+    """
+    A retrieved passage: its text, source URI, ranking score (or None), chunk ID
+    and the vector retriever's relevance score (or None).
+    """
+
+    __slots__ = ("text", "source", "score", "id", "relevance")
+
+    def __init__(self, text: str, source: str = "", score: float = None, id: str = "", relevance: float = None):
+        self.text = text
+        self.source = sys.intern(source) if source else ""
+        self.score = score
+        self.id = id or ""
+        self.relevance = relevance
+
+    @classmethod
+    def from_dict(cls, record: dict) -> "Chunk":
+        return cls(record["text"], record.get("source") or "", record.get("score"), record.get("id") or "",
+                   record.get("relevance"))
+
+    def with_score(self, score: float) -> "Chunk":
+        """A copy ranked by another score, keeping its relevance; the text is shared, not copied."""
+        return Chunk(self.text, self.source, score, self.id, self.relevance)
+
+    def with_relevance(self, score: float) -> "Chunk":
+        """A copy scored by a vector retriever: the score is both its ranking score and its relevance."""
+        return Chunk(self.text, self.source, score, self.id, score)
+
+    def to_dict(self) -> dict:
+        return {"text": self.text, "source": self.source, "score": self.score, "id": self.id,
+                "relevance": self.relevance}
+
+    def __repr__(self) -> str:
+        return f"Chunk(id={self.id!r}, source={self.source!r}, score={self.score!r}, text={self.text[:40]!r})"
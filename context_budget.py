@@ -0,0 +1,118 @@
+"""
+Context assembly between retrieval and prompt building.
+
+Retrieved chunks often overlap (chunking windows share text) or repeat the
+same passage from different files, and nothing bounds how much text ends up
+in the prompt. assemble_context():
+
+1. drops chunks whose relevance score is below a threshold,
+2. drops chunks that duplicate or are mostly contained in a better chunk
+   (word-shingle containment),
+3. packs the remaining chunks, best first, into a token budget,
+
+and reports how many tokens that saved.
+"""
+import re
+
+# Rough token estimate (about 4 characters per token for English text); avoids tokenizing on the hot path
+CHARS_PER_TOKEN = 4
+SEPARATOR = "\n\n---\n\n"
+SHINGLE_SIZE = 3
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a piece of text."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def context_parts(chunks: list) -> list:
+    """The pieces of the joined context (chunk texts with separators between), without joining them."""
+    parts = [SEPARATOR] * (2 * len(chunks) - 1) if chunks else []
+    parts[::2] = [chunk.text for chunk in chunks]
+    return parts
+
+
+def context_length(chunks: list) -> int:
+    """Length of the joined context in characters, without building it."""
+    return sum(len(chunk.text) for chunk in chunks) + len(SEPARATOR) * max(len(chunks) - 1, 0)
+
+
+def _shingles(text: str) -> set:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _is_duplicate(shingles: set, kept: list, threshold: float) -> bool:
+    """True if most of this chunk's shingles already appear in one kept chunk (or vice versa)."""
+    if not shingles:
+        return True
+    for other in kept:
+        overlap = len(shingles & other)
+        if overlap and overlap / min(len(shingles), len(other)) >= threshold:
+            return True
+    return False
+
+
+def assemble_context(chunks: list, token_budget: int = 2000, min_score: float = 0.0,
+                     dedup_threshold: float = 0.8) -> tuple:
+    """
+    Selects the chunks to put into the prompt.
+
+    Args:
+        chunks: Retrieved chunks (chunks.Chunk), best first
+        token_budget: Maximum estimated tokens of the joined context (0 = unlimited)
+        min_score: Chunks whose relevance is below this are dropped (chunks without one are kept)
+        dedup_threshold: Shingle containment above which a chunk counts as a duplicate
+
+    Returns:
+        (selected_chunks, report) where report has token counts and drop reasons
+    """
+    report = {
+        "chunks_in": len(chunks),
+        "chunks_out": 0,
+        "dropped_low_score": 0,
+        "dropped_duplicate": 0,
+        "dropped_budget": 0,
+        "tokens_in": 0,
+        "tokens_out": 0,
+        "tokens_saved": 0,
+    }
+    if not chunks:
+        return [], report
+
+    separator_tokens = estimate_tokens(SEPARATOR)
+    report["tokens_in"] = sum(estimate_tokens(c.text) for c in chunks) + separator_tokens * (len(chunks) - 1)
+
+    # Highest score first; chunks without a score keep their retrieval order after scored ones
+    ranked = sorted(chunks, key=lambda c: c.score if c.score is not None else float("-inf"), reverse=True)
+
+    selected = []
+    kept_shingles = []
+    used_tokens = 0
+    for chunk in ranked:
+        # Relevance, not the ranking score: fusion and reranking scores are on another scale
+        relevance = chunk.relevance
+        if relevance is not None and relevance < min_score:
+            report["dropped_low_score"] += 1
+            continue
+        shingles = _shingles(chunk.text)
+        if _is_duplicate(shingles, kept_shingles, dedup_threshold):
+            report["dropped_duplicate"] += 1
+            continue
+        cost = estimate_tokens(chunk.text) + (separator_tokens if selected else 0)
+        if token_budget and used_tokens + cost > token_budget:
+            # Keep looking: a smaller, lower-ranked chunk may still fit
+            report["dropped_budget"] += 1
+            continue
+        selected.append(chunk)
+        kept_shingles.append(shingles)
+        used_tokens += cost
+
+    report["chunks_out"] = len(selected)
+    report["tokens_out"] = used_tokens
+    report["tokens_saved"] = report["tokens_in"] - used_tokens
+    return selected, report
@@ -0,0 +1,90 @@
+"""
+Text embeddings used for near-duplicate query matching.
+
+Two backends are available:
+- "local": a feature-hashing embedder (words and word bigrams) that needs no
+  network access and is deterministic across processes
+- "bedrock": Amazon Titan text embeddings through bedrock-runtime
+"""
+import json
+import math
+import os
+import re
+import zlib
+
+# ---------- Config ----------
+REGION = os.getenv("AWS_REGION", "us-east-2")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "local")  # "local" or "bedrock"
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "256"))
+BEDROCK_EMBEDDING_MODEL_ID = os.getenv("BEDROCK_EMBEDDING_MODEL_ID", "amazon.titan-embed-text-v2:0")
+# Parallel Bedrock calls per embed_batch() (Titan embeds one text per request)
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "8"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_bedrock_client = None
+_batch_executor = None
+
+
+def tokenize(text: str) -> list:
+    """Lowercases and splits text into alphanumeric tokens."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _normalize(vec: list) -> list:
+    norm = math.sqrt(sum(v * v for v in vec))
+    if norm == 0:
+        return vec
+    return [v / norm for v in vec]
+
+
+def _local_embed(text: str, dim: int) -> list:
+    """
+    Feature-hashing embedding. Uses crc32 rather than hash() so vectors are
+    stable across processes (hash() is randomized per interpreter).
+    """
+    vec = [0.0] * dim
+    tokens = tokenize(text)
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    for feature in features:
+        h = zlib.crc32(feature.encode("utf-8"))
+        sign = 1.0 if (h >> 31) & 1 else -1.0
+        vec[h % dim] += sign
+    return _normalize(vec)
+
+
+def _bedrock_embed(text: str, dim: int) -> list:
+    global _bedrock_client
+    if _bedrock_client is None:
+        import aws_clients
+        _bedrock_client = aws_clients.get_client("bedrock-runtime", region=REGION)
+    resp = _bedrock_client.invoke_model(
+        modelId=BEDROCK_EMBEDDING_MODEL_ID,
+        body=json.dumps({"inputText": text, "dimensions": dim, "normalize": True}),
+    )
+    return json.loads(resp["body"].read())["embedding"]
+
+
+def embed_text(text: str, dim: int = EMBEDDING_DIM) -> list:
+    """Returns a unit-length embedding for the given text using the configured backend."""
+    if EMBEDDING_BACKEND == "bedrock":
+        return _bedrock_embed(text, dim)
+    return _local_embed(text, dim)
+
+
+def embed_batch(texts: list, dim: int = EMBEDDING_DIM) -> list:
+    """
+    Embeds several texts at once, in order. With the Bedrock backend the
+    requests run in parallel over the shared client's connection pool.
+    """
+    if EMBEDDING_BACKEND != "bedrock" or len(texts) <= 1:
+        return [embed_text(text, dim) for text in texts]
+    global _batch_executor
+    if _batch_executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _batch_executor = ThreadPoolExecutor(max_workers=EMBEDDING_CONCURRENCY, thread_name_prefix="embed")
+    return list(_batch_executor.map(lambda text: _bedrock_embed(text, dim), texts))
+
+
+def cosine_similarity(a: list, b: list) -> float:
+    """Cosine similarity of two unit-length vectors."""
+    return sum(x * y for x, y in zip(a, b))
@@ -0,0 +1,118 @@
+"""
+Fusion and reranking of retrieval candidates.
+
+A hybrid retrieval fetches a wide candidate set from vector search and from
+the BM25 keyword index, fuses the ranked lists with reciprocal rank fusion
+(RRF), optionally reranks the fused list with a cheap local scorer, and
+passes only the best few chunks on to the model.
+
+Bedrock and local chunk IDs come from different namespaces, so chunks from
+different retrievers are matched by content instead: identical text
+(whitespace collapsed), or else the same source file name (an S3 URI and a
+local path to the same document match) and mostly the same words. The
+second rule is what fuses Bedrock's chunks with the BM25 index's chunks,
+which are cut differently and never have identical text.
+"""
+import re
+
+import embeddings
+from lexical_index import tokenize
+
+_SPACE_RE = re.compile(r"\s+")
+# Share of the shorter chunk's distinct terms the other must contain to count as the same passage
+MIN_FUSION_OVERLAP = 0.5
+
+
+def chunk_key(chunk) -> str:
+    """Exact identity of a chunk across retrievers."""
+    return _SPACE_RE.sub(" ", chunk.text).strip().lower()
+
+
+def source_name(chunk) -> str:
+    """File name of the chunk's source, comparable between S3 URIs and local paths."""
+    return chunk.source.rstrip("/").rsplit("/", 1)[-1].lower() if chunk.source else ""
+
+
+def term_overlap(a: set, b: set) -> float:
+    """Share of the smaller term set found in the other."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def _matching_entry(chunk, list_index: int, candidates: list, min_overlap: float):
+    """The best entry from another list with the chunk's source and enough term overlap, or None."""
+    terms = set(tokenize(chunk.text))
+    best, best_overlap = None, min_overlap
+    for entry in candidates:
+        if list_index in entry[2]:
+            # Overlapping windows of one retriever are different chunks, not the same one twice
+            continue
+        if entry[3] is None:
+            entry[3] = set(tokenize(entry[0].text))
+        overlap = term_overlap(terms, entry[3])
+        if overlap >= best_overlap:
+            best, best_overlap = entry, overlap
+    return best
+
+
+def reciprocal_rank_fusion(ranked_lists: list, k: int = 60, weights: list = None,
+                           min_overlap: float = MIN_FUSION_OVERLAP) -> list:
+    """
+    Merges ranked chunk lists into one, best first. Each chunk scores
+    sum(weight / (k + rank)) over the lists it appears in; the returned
+    chunks are copies whose score is the fused score. A chunk matched in
+    several lists is returned as its first occurrence (source, id and
+    relevance), so put the vector retriever's list first.
+    """
+    fused = {}  # chunk key -> [chunk, fused score, indexes of the lists it was found in, its terms or None]
+    by_source = {}  # source file name -> entries with that source
+    for list_index, chunks in enumerate(ranked_lists):
+        weight = weights[list_index] if weights else 1.0
+        for rank, chunk in enumerate(chunks, start=1):
+            key = chunk_key(chunk)
+            entry = fused.get(key)
+            name = source_name(chunk)
+            if entry is None and name:
+                entry = _matching_entry(chunk, list_index, by_source.get(name, ()), min_overlap)
+            if entry is None:
+                # Keep the first occurrence (its source and id)
+                entry = fused[key] = [chunk, 0.0, set(), None]
+                if name:
+                    by_source.setdefault(name, []).append(entry)
+            entry[1] += weight / (k + rank)
+            entry[2].add(list_index)
+    # New records with the fused score, so cached lists are not mutated
+    ranked = sorted(fused.values(), key=lambda entry: entry[1], reverse=True)
+    return [entry[0].with_score(entry[1]) for entry in ranked]
+
+
+def rerank(query: str, chunks: list, idf: dict, lexical_weight: float = 0.5) -> list:
+    """
+    Lightweight local reranker. Scores each chunk by a blend of
+    - IDF-weighted coverage of the query terms (rewards exact names and numbers), and
+    - cosine similarity of local feature-hashing embeddings (rewards paraphrases;
+      always local, so reranking never makes network calls),
+    and returns the chunks sorted by that score, which replaces their score
+    (their relevance is kept).
+    """
+    query_terms = set(tokenize(query))
+    if not chunks or not query_terms:
+        return chunks
+    # Terms missing from the corpus are treated as the rarest ones
+    default_idf = max(idf.values()) if idf else 1.0
+    weights = {term: idf.get(term, default_idf) for term in query_terms}
+    total = sum(weights.values()) or 1.0
+    dim = embeddings.EMBEDDING_DIM
+    query_vector = embeddings._local_embed(query, dim)
+
+    scored = []
+    for position, chunk in enumerate(chunks):
+        terms = set(tokenize(chunk.text))
+        coverage = sum(w for term, w in weights.items() if term in terms) / total
+        similarity = embeddings.cosine_similarity(query_vector, embeddings._local_embed(chunk.text, dim))
+        score = lexical_weight * coverage + (1 - lexical_weight) * similarity
+        # Earlier (better fused) position breaks ties
+        scored.append((score, -position, chunk))
+    scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+    return [chunk.with_score(score) for score, _, chunk in scored]
@@ -0,0 +1,205 @@
+"""
+Local ingestion pipeline: knowledge/ documents -> local vector index.
+
+Documents stream through four stages, so only a bounded window of the corpus
+is in memory at any time:
+
+1. parse: read, hash and decode each file. scripts/build_local_index.py runs
+   this in a process pool because it is CPU-bound, with at most a few
+   documents in flight per worker. Builds at app start parse in-process.
+2. chunk: split the text into overlapping chunks (local_index.chunk_text).
+3. embed: embed chunks in batches (embeddings.embed_batch).
+4. index: append the vectors and chunk records to the index files as they
+   arrive. The .npy matrix is assembled from a raw temporary file at the end.
+
+Each stage records how many items and characters it handled and how long it
+took. These stats show where build time goes when tuning chunk size and
+overlap. local_index.build_index() runs this pipeline. scripts/
+build_local_index.py runs it with settings from the command line.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import embeddings
+import local_index
+
+# ---------- Config ----------
+# Parse processes for scripts/build_local_index.py (0 = CPU count, 1 = in-process)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))  # chunks per embed_batch() call
+
+
+class StageStats:
+    """Work done by one pipeline stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.chars = 0
+        self.seconds = 0.0
+
+    def add(self, items: int, chars: int, seconds: float):
+        self.items += items
+        self.chars += chars
+        self.seconds += seconds
+
+    def report(self) -> dict:
+        return {
+            "items": self.items,
+            "chars": self.chars,
+            "seconds": self.seconds,
+            "items_per_second": self.items / self.seconds if self.seconds > 0 else None,
+            "chars_per_second": self.chars / self.seconds if self.seconds > 0 else None,
+        }
+
+
+# ---------- Stages ----------
+def parse_document(path: str) -> tuple:
+    """Reads one document. Returns (path, sha256, text, seconds). Runs in a worker process."""
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    text = data.decode("utf-8").replace("\r\n", "\n")
+    return path, digest, text, time.perf_counter() - start
+
+
+def parse_documents(paths: list, workers: int, stats: StageStats):
+    """Yields parsed documents in path order, keeping at most 2 per worker in flight."""
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            parsed = parse_document(path)
+            stats.add(1, len(parsed[2]), parsed[3])
+            yield parsed
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        remaining = iter(paths)
+        for path in remaining:
+            pending.append(pool.submit(parse_document, path))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            parsed = pending.popleft().result()
+            next_path = next(remaining, None)
+            if next_path is not None:
+                pending.append(pool.submit(parse_document, next_path))
+            # Worker time, summed over workers: the stage's throughput per process
+            stats.add(1, len(parsed[2]), parsed[3])
+            yield parsed
+
+
+def chunk_documents(documents, chunk_size: int, overlap: int, stats: StageStats, file_hashes: dict):
+    """Yields chunk records {"id", "source", "text"}; records each document's hash in file_hashes."""
+    for path, digest, text, _ in documents:
+        start = time.perf_counter()
+        source = local_index._source_name(path)
+        file_hashes[source] = digest
+        chunks = local_index.chunk_text(text, chunk_size, overlap)
+        stats.add(len(chunks), sum(len(chunk) for chunk in chunks), time.perf_counter() - start)
+        for i, chunk in enumerate(chunks):
+            yield {"id": f"{source}#{i}", "source": source, "text": chunk}
+
+
+def embed_chunks(records, batch_size: int, stats: StageStats):
+    """Yields (records, float32 matrix) batches of at most batch_size chunks."""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield _embed_batch(batch, stats)
+            batch = []
+    if batch:
+        yield _embed_batch(batch, stats)
+
+
+def _embed_batch(batch: list, stats: StageStats) -> tuple:
+    start = time.perf_counter()
+    vectors = embeddings.embed_batch([record["text"] for record in batch])
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(len(batch), embeddings.EMBEDDING_DIM)
+    stats.add(len(batch), sum(len(record["text"]) for record in batch), time.perf_counter() - start)
+    return batch, matrix
+
+
+def write_index(batches, index_dir: str, stats: StageStats) -> int:
+    """
+    Streams embedded batches into the index files; returns the number of chunks.
+    Files are written under temporary names and renamed when complete, so a
+    failed build leaves the previous index intact.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    vectors_path = os.path.join(index_dir, local_index.VECTORS_FILE)
+    chunks_path = os.path.join(index_dir, local_index.CHUNKS_FILE)
+    raw_path = vectors_path + ".raw"
+    count = 0
+    with open(raw_path, "wb") as raw, open(chunks_path + ".tmp", "w", encoding="utf-8") as chunks_file:
+        chunks_file.write("[")
+        for records, matrix in batches:
+            start = time.perf_counter()
+            raw.write(np.ascontiguousarray(matrix).tobytes())
+            for record in records:
+                chunks_file.write(("," if count else "") + json.dumps(record))
+                count += 1
+            stats.add(len(records), sum(len(record["text"]) for record in records), time.perf_counter() - start)
+        chunks_file.write("]")
+
+    # Prepend the .npy header now that the number of rows is known
+    start = time.perf_counter()
+    header = {"descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)), "fortran_order": False,
+              "shape": (count, embeddings.EMBEDDING_DIM)}
+    with open(vectors_path + ".tmp", "wb") as out, open(raw_path, "rb") as raw:
+        np.lib.format.write_array_header_1_0(out, header)
+        shutil.copyfileobj(raw, out, 1 << 20)
+    os.remove(raw_path)
+    os.replace(vectors_path + ".tmp", vectors_path)
+    os.replace(chunks_path + ".tmp", chunks_path)
+    stats.add(0, 0, time.perf_counter() - start)
+    return count
+
+
+# ---------- Pipeline ----------
+def iter_chunks(knowledge_dir: str = local_index.KNOWLEDGE_DIR, chunk_size: int = local_index.CHUNK_SIZE,
+                overlap: int = local_index.CHUNK_OVERLAP, workers: int = 1):
+    """Yields the chunk records of every document (the parse and chunk stages only), in index order."""
+    paths = local_index.list_documents(knowledge_dir)
+    documents = parse_documents(paths, workers, StageStats("parse"))
+    yield from chunk_documents(documents, chunk_size, overlap, StageStats("chunk"), {})
+
+
+def ingest(knowledge_dir: str = local_index.KNOWLEDGE_DIR, index_dir: str = local_index.INDEX_DIR,
+           chunk_size: int = local_index.CHUNK_SIZE, overlap: int = local_index.CHUNK_OVERLAP,
+           workers: int = INGEST_WORKERS, batch_size: int = EMBED_BATCH_SIZE) -> dict:
+    """
+    Builds the local index from every document in knowledge_dir.
+    Returns the index metadata plus a "stats" entry with per-stage throughput.
+    """
+    start = time.perf_counter()
+    paths = local_index.list_documents(knowledge_dir)
+    workers = workers or os.cpu_count() or 1
+    stages = {name: StageStats(name) for name in ("parse", "chunk", "embed", "index")}
+    file_hashes = {}
+
+    documents = parse_documents(paths, min(workers, len(paths)), stages["parse"])
+    records = chunk_documents(documents, chunk_size, overlap, stages["chunk"], file_hashes)
+    batches = embed_chunks(records, max(batch_size, 1), stages["embed"])
+    num_chunks = write_index(batches, index_dir, stages["index"])
+
+    meta = {**local_index._index_settings(), "chunk_size": chunk_size, "chunk_overlap": overlap,
+            "num_chunks": num_chunks, "files": file_hashes}
+    with open(os.path.join(index_dir, local_index.META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    meta["stats"] = {
+        "documents": len(paths),
+        "workers": min(workers, max(len(paths), 1)),
+        "batch_size": batch_size,
+        "seconds": time.perf_counter() - start,
+        "stages": {name: stage.report() for name, stage in stages.items()},
+    }
+    return meta
@@ -0,0 +1,66 @@
+"""
+Knowledge base version stamp shared by the server and the helper scripts.
+
+scripts/sync_knowledge_base.py bumps the stamp whenever it starts a new
+ingestion job, and again when the job has finished. Caches in the server compare their stored version against
+the current stamp and drop stale entries when it changes, so no restart is
+needed after a re-sync.
+"""
+import os
+import threading
+import time
+
+# ---------- Config ----------
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+KB_VERSION_FILE = os.getenv("KB_VERSION_FILE", os.path.join(PROJECT_ROOT, ".kb_version"))
+# How often (seconds) the server re-reads the stamp file; keeps the hot path to a clock check
+KB_VERSION_CHECK_SECONDS = float(os.getenv("KB_VERSION_CHECK_SECONDS", "2"))
+
+_lock = threading.Lock()
+_cached_version = None
+_checked_at = 0.0
+
+
+def _read_version_file() -> str:
+    try:
+        with open(KB_VERSION_FILE, "r", encoding="utf-8") as f:
+            return f.read().strip() or "0"
+    except FileNotFoundError:
+        return "0"
+    except OSError as e:
+        print(f"Warning: Could not read knowledge base version file {KB_VERSION_FILE}: {e}")
+        return "0"
+
+
+def current_version() -> str:
+    """
+    Returns the current knowledge base version stamp.
+    The stamp file is re-read at most every KB_VERSION_CHECK_SECONDS.
+    """
+    global _cached_version, _checked_at
+    now = time.monotonic()
+    if _cached_version is not None and now - _checked_at < KB_VERSION_CHECK_SECONDS:
+        return _cached_version
+    with _lock:
+        if _cached_version is None or now - _checked_at >= KB_VERSION_CHECK_SECONDS:
+            _cached_version = _read_version_file()
+            _checked_at = now
+        return _cached_version
+
+
+def bump_version() -> str:
+    """
+    Writes a new version stamp. Called when a new ingestion job starts and when
+    it has finished, so that every cache keyed on the knowledge base contents
+    is invalidated.
+    """
+    global _cached_version, _checked_at
+    version = str(time.time_ns())
+    tmp_path = f"{KB_VERSION_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, KB_VERSION_FILE)
+    with _lock:
+        _cached_version = version
+        _checked_at = time.monotonic()
+    return version
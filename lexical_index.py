@@ -0,0 +1,90 @@
+"""
+In-process BM25 keyword index over the knowledge/ corpus.
+
+Vector search is good at paraphrases but often misses exact product names,
+version strings and spec numbers. This index scores chunks by term matches
+(Okapi BM25) instead. It is built from the same documents and the same
+chunking as local_index.py, so local chunk IDs line up with the vector index.
+
+Compound tokens such as "2.3.1", "soc-2" or "x1" are indexed both whole and
+split into their parts, so an exact spec number matches strongly and its
+pieces still match loosely.
+"""
+import heapq
+import math
+import os
+import re
+from collections import Counter
+
+import local_index
+from chunks import Chunk
+
+# ---------- Config ----------
+BM25_K1 = float(os.getenv("BM25_K1", "1.5"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+_PART_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list:
+    """Lowercased terms of a text; compound tokens are followed by their parts."""
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        terms.append(token)
+        parts = _PART_RE.findall(token)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+class BM25Index:
+    """
+    Inverted index with BM25 scoring.
+
+    Args:
+        records: chunks.Chunk records, one document each
+        k1: Term-frequency saturation
+        b: Document-length normalization
+    """
+
+    def __init__(self, records: list, k1: float = BM25_K1, b: float = BM25_B):
+        self.records = records
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> list of (record index, term frequency)
+        lengths = []
+        for i, record in enumerate(records):
+            counts = Counter(tokenize(record.text))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((i, tf))
+        self.doc_lengths = lengths
+        self.avg_length = sum(lengths) / len(lengths) if lengths else 0.0
+        n = len(records)
+        self.idf = {term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self.postings.items()}
+
+    @classmethod
+    def from_directory(cls, knowledge_dir: str = local_index.KNOWLEDGE_DIR) -> "BM25Index":
+        """Chunks every document under knowledge_dir (as the ingestion pipeline does) and indexes the chunks."""
+        import ingest
+        return cls([Chunk.from_dict(record) for record in ingest.iter_chunks(knowledge_dir)])
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def search(self, query: str, top_k: int = 5) -> list:
+        """Returns the top_k chunks as Chunk records, best first."""
+        if not self.records or not query:
+            return []
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for i, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[i] / self.avg_length)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [self.records[i].with_score(score) for i, score in best]
@@ -0,0 +1,170 @@
+"""
+Local, offline vector index over the knowledge/ directory.
+
+The index is built by chunking and embedding every document, then stored as:
+- vectors.npy: contiguous float32 matrix (one unit-length row per chunk),
+  memory-mapped at load time
+- chunks.json: text, source and chunk ID for each row (loaded as chunks.Chunk records)
+- meta.json:   embedding settings and content hashes used to detect stale indexes
+
+Queries are answered with one matrix-vector product and a partial sort.
+The index is built by the streaming pipeline in ingest.py. Build it ahead of
+time with scripts/build_local_index.py, or let the server build it at startup.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import embeddings
+from chunks import Chunk
+
+# ---------- Config ----------
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+KNOWLEDGE_DIR = os.getenv("KNOWLEDGE_DIR", os.path.join(PROJECT_ROOT, "knowledge"))
+INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(PROJECT_ROOT, "index"))
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "800"))  # characters
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "100"))  # characters
+DOCUMENT_EXTENSIONS = (".txt", ".md")
+
+VECTORS_FILE = "vectors.npy"
+CHUNKS_FILE = "chunks.json"
+META_FILE = "meta.json"
+
+
+# ---------- Chunking ----------
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list:
+    """
+    Splits text into chunks of at most chunk_size characters.
+    Paragraphs are kept together where possible; paragraphs longer than
+    chunk_size are split into windows that overlap by `overlap` characters.
+    """
+    paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
+    chunks = []
+    current = ""
+    for paragraph in paragraphs:
+        if len(paragraph) > chunk_size:
+            if current:
+                chunks.append(current)
+                current = ""
+            step = max(chunk_size - overlap, 1)
+            for start in range(0, len(paragraph), step):
+                chunks.append(paragraph[start:start + chunk_size])
+                if start + chunk_size >= len(paragraph):
+                    break
+        elif not current:
+            current = paragraph
+        elif len(current) + 2 + len(paragraph) <= chunk_size:
+            current = f"{current}\n\n{paragraph}"
+        else:
+            chunks.append(current)
+            current = paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def file_sha256(path: str) -> str:
+    """Returns the hex SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def list_documents(knowledge_dir: str = KNOWLEDGE_DIR) -> list:
+    """Returns the paths of all indexable documents under knowledge_dir, sorted."""
+    paths = []
+    for root, _, files in os.walk(knowledge_dir):
+        for name in files:
+            if name.lower().endswith(DOCUMENT_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+def _source_name(path: str) -> str:
+    return os.path.relpath(path, PROJECT_ROOT).replace(os.sep, "/")
+
+
+def _index_settings() -> dict:
+    return {
+        "embedding_backend": embeddings.EMBEDDING_BACKEND,
+        "embedding_dim": embeddings.EMBEDDING_DIM,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+    }
+
+
+# ---------- Build ----------
+def build_index(knowledge_dir: str = KNOWLEDGE_DIR, index_dir: str = INDEX_DIR) -> dict:
+    """
+    Chunks and embeds every document in knowledge_dir and writes the index files,
+    streaming them through the ingestion pipeline (ingest.py).
+    Returns the index metadata, including per-stage stats.
+
+    Documents are parsed in-process: this runs when the app is imported, where
+    starting a process pool would re-import the app in every spawned worker.
+    scripts/build_local_index.py builds with a pool.
+    """
+    import ingest
+    return ingest.ingest(knowledge_dir, index_dir, workers=1)
+
+
+def is_stale(knowledge_dir: str = KNOWLEDGE_DIR, index_dir: str = INDEX_DIR) -> bool:
+    """True if the index is missing, was built with other settings, or the documents changed."""
+    try:
+        with open(os.path.join(index_dir, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return True
+    if any(meta.get(key) != value for key, value in _index_settings().items()):
+        return True
+    current = {_source_name(path): file_sha256(path) for path in list_documents(knowledge_dir)}
+    return current != meta.get("files")
+
+
+# ---------- Query ----------
+class LocalIndex:
+    """Memory-mapped embedding matrix plus chunk records, queried by cosine similarity."""
+
+    def __init__(self, vectors: np.ndarray, records: list):
+        self.vectors = vectors
+        self.records = records
+
+    @classmethod
+    def load(cls, index_dir: str = INDEX_DIR) -> "LocalIndex":
+        """Loads an index from disk; the vector matrix is memory-mapped, not read into memory."""
+        path = os.path.join(index_dir, VECTORS_FILE)
+        try:
+            vectors = np.load(path, mmap_mode="r")
+        except ValueError:
+            # Empty matrices cannot be memory-mapped
+            vectors = np.load(path)
+        with open(os.path.join(index_dir, CHUNKS_FILE), "r", encoding="utf-8") as f:
+            records = [Chunk.from_dict(record) for record in json.load(f)]
+        return cls(vectors, records)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def search(self, query: str, top_k: int = 5) -> list:
+        """Returns the top_k chunks as Chunk records, best first."""
+        if not self.records or not query:
+            return []
+        query_vector = np.asarray(embeddings.embed_text(query), dtype=np.float32)
+        # Rows and query are unit length, so the dot product is the cosine similarity
+        scores = self.vectors @ query_vector
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self.records[i].with_relevance(float(scores[i])) for i in top]
+
+
+def load_or_build(knowledge_dir: str = KNOWLEDGE_DIR, index_dir: str = INDEX_DIR) -> LocalIndex:
+    """Loads the index, rebuilding it first if it is missing or stale."""
+    if is_stale(knowledge_dir, index_dir):
+        meta = build_index(knowledge_dir, index_dir)
+        print(f"Built local index: {meta['num_chunks']} chunks from {len(meta['files'])} files")
+    return LocalIndex.load(index_dir)
@@ -0,0 +1,263 @@
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Counters, gauges and histograms are kept in plain Python structures behind a
+lock, so recording a value costs a few microseconds on the hot path.
+Histograms keep cumulative buckets (aggregatable across workers by Prometheus)
+and also a sliding window of recent observations, from which p50/p95/p99 are
+reported directly as a summary.
+
+Counters and gauges can also be read at scrape time from a callback, for
+values that other modules already track (cache hits, AWS attempts). Values
+that only ever grow must be counters named *_total, so Prometheus' rate()
+and counter-reset handling apply to them.
+"""
+import bisect
+import threading
+import time
+from collections import deque
+
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _escape(value: str) -> str:
+    """Escapes a label value as the text exposition format requires."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, *extra: str) -> str:
+    # Label values can come from configuration and requests (tenant names), so they are escaped
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    parts.extend(e for e in extra if e)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.label_names)
+
+    def render(self, const: str = "") -> list:
+        """Returns the exposition lines; `const` is a formatted label set added to every sample."""
+        help_text = self.help_text.replace("\\", "\\\\").replace("\n", "\\n")
+        return [f"# HELP {self.name} {help_text}", f"# TYPE {self.name} {self.kind}"]
+
+    def _callback_values(self) -> dict:
+        try:
+            values = self.fn()
+        except Exception as e:
+            print(f"Warning: metrics callback for {self.name} failed: {e}")
+            return {}
+        return values if isinstance(values, dict) else {(): values}
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing value per label set. Either incremented here, or
+    read at scrape time from a callback returning {label_values_tuple: value}
+    (or a plain number) that must never decrease.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), fn=None):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+        self.fn = fn
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self, const: str = "") -> list:
+        lines = super().render()
+        if self.fn is not None:
+            values = self._callback_values()
+        else:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.label_names, key, const)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Point-in-time value. Either set explicitly, or computed at scrape time by
+    a callback returning {label_values_tuple: value} (or a plain number).
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), fn=None):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+        self.fn = fn
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self, const: str = "") -> list:
+        lines = super().render()
+        if self.fn is not None:
+            values = self._callback_values()
+        else:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.label_names, key, const)} {_format_value(value)}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Histogram(_Metric):
+    """
+    Cumulative-bucket histogram plus a sliding window of the most recent
+    observations used for exact p50/p95/p99 at scrape time.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_LATENCY_BUCKETS,
+                 window: int = 2048, quantiles: tuple = DEFAULT_QUANTILES):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.window = window
+        self.quantiles = quantiles
+        self._series = {}  # label values -> [bucket_counts, sum, count, recent deque]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0, deque(maxlen=self.window)]
+                self._series[key] = series
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+            series[3].append(value)
+
+    def time(self, **labels) -> _Timer:
+        """Context manager that observes the elapsed wall time of its block."""
+        return _Timer(self, labels)
+
+    def percentiles(self, **labels) -> dict:
+        """Returns {quantile: value} over the recent window for one label set."""
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            recent = sorted(series[3]) if series else []
+        return {q: _quantile(recent, q) for q in self.quantiles}
+
+    def render(self, const: str = "") -> list:
+        lines = super().render()
+        summary = [f"# HELP {self.name}_recent {self.help_text} (last {self.window} observations)",
+                   f"# TYPE {self.name}_recent summary"]
+        with self._lock:
+            snapshot = {key: (list(s[0]), s[1], s[2], sorted(s[3])) for key, s in self._series.items()}
+        for key, (counts, total, count, recent) in snapshot.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, const, le)} {cumulative}")
+            labels = _format_labels(self.label_names, key, const)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+            for q in self.quantiles:
+                quantile = f'quantile="{q}"'
+                summary.append(f"{self.name}_recent{_format_labels(self.label_names, key, const, quantile)} "
+                               f"{_format_value(_quantile(recent, q))}")
+            summary.append(f"{self.name}_recent_sum{labels} {_format_value(sum(recent))}")
+            summary.append(f"{self.name}_recent_count{labels} {len(recent)}")
+        return lines + summary
+
+
+def _quantile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(q * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+        self._const_labels = ""
+
+    def set_const_labels(self, **labels):
+        """Adds labels to every sample, e.g. the worker a pre-forked process serves as."""
+        self._const_labels = _format_labels(tuple(labels), tuple(labels.values()))[1:-1]
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: tuple = (), fn=None) -> Counter:
+        return self.register(Counter(name, help_text, labels, fn))
+
+    def gauge(self, name: str, help_text: str, labels: tuple = (), fn=None) -> Gauge:
+        return self.register(Gauge(name, help_text, labels, fn))
+
+    def histogram(self, name: str, help_text: str, labels: tuple = (), **kwargs) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, **kwargs))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render(self._const_labels))
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide default registry
+registry = Registry()
@@ -0,0 +1,191 @@
+"""
+Query expansion for compound questions.
+
+A question such as "price and warranty of InsightPro" asks two things, and a
+single retrieval for the whole sentence tends to find chunks about only one
+of them. expand_query() turns a prompt into a few focused sub-queries:
+
+- separate questions/sentences become separate sub-queries,
+- coordinated items sharing a tail ("A and B of X") are distributed
+  ("A of X", "B of X"),
+- independent clauses joined by "and" ("who founded X and where is it
+  based") are split.
+
+The original prompt is always the first sub-query, so expansion can only add
+recall. Every sub-query costs a retrieval call, so a prompt is only split when
+every part can stand on its own: each part needs MIN_CONTENT_WORDS content
+words (or one name, e.g. "What is InsightPro") and no pronoun pointing back at
+another part ("where is it based").
+Otherwise the prompt is the only query. llm_rewrite() optionally asks a small Bedrock model for sub-queries
+instead; callers should bound it with a timeout and fall back to the
+heuristics. merge_results() combines the sub-queries' chunks.
+"""
+import re
+
+from hybrid_search import chunk_key
+
+_SENTENCE_RE = re.compile(r"(?<=[?!.;])\s+")
+_CONJUNCTION_RE = re.compile(r"\s*,\s*(?:and|or)\s+|\s*,\s*|\s+and\s+|\s+or\s+|\s*&\s*|\s+as well as\s+|\s+plus\s+",
+                             re.IGNORECASE)
+_TAIL_RE = re.compile(r"\s+(?:of|for|in|on|about|with|from|at|by|across)\s+", re.IGNORECASE)
+_LEAD_RE = re.compile(
+    r"^(?:(?:what|which|who|where|when|why|how(?:\s+(?:much|many|long|often))?|tell me|list|describe|explain)"
+    r"(?:\s+(?:is|are|was|were|does|do|did|can|about))*\s+(?:the\s+)?)",
+    re.IGNORECASE,
+)
+_QUESTION_WORDS = r"(?:what|which|who|where|when|why|how|is|are|does|do|did|can|could|should)\b"
+_QUESTION_START_RE = re.compile(r"^" + _QUESTION_WORDS, re.IGNORECASE)
+# Clause boundaries: a comma, semicolon or "and"/"or" followed by a new question
+_CLAUSE_RE = re.compile(r"\s*(?:,\s*(?:and\s+|or\s+)?|;\s*|\s+and\s+|\s+or\s+)(?=" + _QUESTION_WORDS + ")",
+                        re.IGNORECASE)
+_BETWEEN_RE = re.compile(r"\bbetween\b", re.IGNORECASE)
+# Coordinated items longer than this are treated as clauses, not as a list of nouns
+MAX_ITEM_WORDS = 4
+MIN_CLAUSE_WORDS = 3
+# A sub-query needs this many words that are not question words, auxiliaries, pronouns or particles
+MIN_CONTENT_WORDS = 2
+
+_WORD_RE = re.compile(r"[^\W\d_][\w'-]*")
+# Words that refer back to something named elsewhere in the prompt; a part containing one cannot stand alone
+_PRONOUNS = frozenset(
+    "it its it's they them their theirs this that these those he him his she her hers one ones".split())
+_FUNCTION_WORDS = _PRONOUNS | frozenset(
+    "what which who whom whose where when why how much many long often tell me list describe explain "
+    "is are was were be been being does do did can could should would will shall may might must have has had "
+    "a an the of for in on about with from at by across to into and or as well plus also "
+    "i you we us our your my there here not".split())
+
+
+def _words(text: str) -> int:
+    return len(text.split())
+
+
+def _clean(text: str) -> str:
+    return text.strip(" \t\n,;:.?!")
+
+
+def _expand_clause(clause: str) -> list:
+    """Sub-queries for one sentence; an empty list means it does not split."""
+    # "between A and B" relates the items rather than listing them
+    if not _CONJUNCTION_RE.search(clause) or _BETWEEN_RE.search(clause):
+        return []
+
+    lead_match = _LEAD_RE.match(clause)
+    lead = lead_match.group(0) if lead_match else ""
+    rest = clause[len(lead):]
+
+    # "A and B of X": distribute the shared tail over the coordinated items
+    conjunctions = list(_CONJUNCTION_RE.finditer(rest))
+    tail_match = _TAIL_RE.search(rest, conjunctions[-1].end())
+    head, tail = (rest[:tail_match.start()], rest[tail_match.start():]) if tail_match else (rest, "")
+    items = [_clean(item) for item in _CONJUNCTION_RE.split(head)]
+    items = [item for item in items if item]
+    if (len(items) > 1 and all(_words(item) <= MAX_ITEM_WORDS for item in items)
+            and not any(_QUESTION_START_RE.match(item) for item in items[1:])):
+        return [_clean(f"{lead}{item}{tail}") for item in items]
+
+    # "Who founded X and where is it based": independent clauses, split where a new question starts
+    parts = [part for part in (_clean(p) for p in _CLAUSE_RE.split(clause)) if part]
+    if len(parts) > 1:
+        return parts
+    # "... and ..." joining two longer statements
+    parts = [part for part in (_clean(p) for p in re.split(r"\s+and\s+", clause, flags=re.IGNORECASE)) if part]
+    if len(parts) > 1 and all(_words(part) >= MIN_CLAUSE_WORDS for part in parts):
+        return parts
+    return []
+
+
+def stands_alone(part: str) -> bool:
+    """True if a sub-query makes sense on its own: enough content words and no pronoun referring elsewhere."""
+    words = _WORD_RE.findall(part)
+    if any(word.lower() in _PRONOUNS for word in words):
+        return False
+    content = [(i, word) for i, word in enumerate(words) if word.lower() not in _FUNCTION_WORDS]
+    # A capitalized word after the first is a name ("InsightPro"), which is a subject on its own
+    return len(content) >= MIN_CONTENT_WORDS or any(i > 0 and word[0].isupper() for i, word in content)
+
+
+def expand_query(prompt: str, max_queries: int = 4) -> list:
+    """
+    Returns up to max_queries sub-queries for the prompt, the prompt itself first.
+    Simple questions, and prompts with any part that does not stand alone, come back as [prompt].
+    """
+    prompt = prompt.strip()
+    if not prompt:
+        return []
+    sentences = [s for s in (_clean(s) for s in _SENTENCE_RE.split(prompt)) if s]
+    candidates = []
+    for sentence in sentences:
+        candidates.extend(_expand_clause(sentence) or ([sentence] if len(sentences) > 1 else []))
+    # All or nothing: a fragment would cost a retrieval call and pull in unrelated chunks
+    if not all(stands_alone(candidate) for candidate in candidates):
+        return [prompt]
+    queries = [prompt]
+    seen = {prompt.lower()}
+    for candidate in candidates:
+        if len(queries) >= max_queries:
+            break
+        key = candidate.lower()
+        if key not in seen:
+            seen.add(key)
+            queries.append(candidate)
+    return queries
+
+
+REWRITE_INSTRUCTIONS = (
+    "Rewrite the user's question into at most {n} short, standalone search queries for a document search engine. "
+    "Cover every distinct thing the question asks about. Output one query per line and nothing else."
+)
+
+
+def llm_rewrite(prompt: str, client, model_id: str, max_queries: int = 4) -> list:
+    """
+    Asks a Bedrock model (via the Converse API) for sub-queries.
+    Returns them with the original prompt first; raises on API errors.
+    """
+    resp = client.converse(
+        modelId=model_id,
+        system=[{"text": REWRITE_INSTRUCTIONS.format(n=max_queries - 1)}],
+        messages=[{"role": "user", "content": [{"text": prompt}]}],
+        inferenceConfig={"maxTokens": 200, "temperature": 0},
+    )
+    text = "".join(block.get("text", "") for block in resp["output"]["message"]["content"])
+    queries = [prompt.strip()]
+    seen = {queries[0].lower()}
+    for line in text.splitlines():
+        # Strip list markers the model may add anyway
+        line = _clean(re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", line))
+        if line and line.lower() not in seen and len(queries) < max_queries:
+            seen.add(line.lower())
+            queries.append(line)
+    return queries
+
+
+def chunk_location(chunk) -> tuple:
+    """Where a chunk comes from: its source plus chunk ID (or normalized text when there is no ID)."""
+    return chunk.source, chunk.id or chunk_key(chunk)
+
+
+def merge_results(result_lists: list, max_chunks: int = 10) -> list:
+    """
+    Merges the chunk lists of several sub-queries, deduplicated by chunk location.
+    Lists are interleaved by rank so every sub-query is represented before any gets
+    a second chunk; a chunk found by several sub-queries keeps its best score.
+    """
+    merged = {}
+    order = []
+    depth = max((len(chunks) for chunks in result_lists), default=0)
+    for rank in range(depth):
+        for chunks in result_lists:
+            if rank >= len(chunks):
+                continue
+            chunk = chunks[rank]
+            location = chunk_location(chunk)
+            existing = merged.get(location)
+            if existing is None:
+                if len(order) < max_chunks:
+                    merged[location] = chunk
+                    order.append(location)
+            elif chunk.score is not None and (existing.score is None or chunk.score > existing.score):
+                merged[location] = chunk
+    return [merged[location] for location in order]
@@ -0,0 +1,58 @@
+"""
+Thread-safe token bucket rate limiter.
+
+Tokens are refilled continuously at `rate` per second up to `burst`. Callers
+either take a token without waiting (try_acquire, which reports how long
+until one is available) or block until one is (acquire).
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Args:
+        rate: Tokens added per second
+        burst: Bucket capacity (largest burst allowed after an idle period)
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1.0))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """
+        Takes tokens if available. Returns 0.0 on success, otherwise the number
+        of seconds until enough tokens will be available (nothing is taken).
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Blocks until tokens are available and takes them. Returns the time spent waiting."""
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0.0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    @property
+    def available(self) -> float:
+        """Tokens currently in the bucket."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
@@ -0,0 +1,152 @@
+"""
+Pluggable retrieval backends.
+
+Every backend implements retrieve(query, top_k) and returns a list of
+chunks.Chunk records, best match first, raising on errors.
+- BedrockBackend: Bedrock Knowledge Base 'Retrieve' over the network
+- LocalBackend:   the in-process vector index from local_index.py (no network)
+- HybridBackend:  wraps either of them with BM25 keyword search, rank fusion
+                  and an optional local reranker
+"""
+import embeddings
+from chunks import Chunk
+from hybrid_search import reciprocal_rank_fusion, rerank
+
+
+class RetrievalBackend:
+    """Base class for retrieval backends."""
+
+    name = "base"
+    # Blocking backends are offloaded to a thread pool by async callers;
+    # non-blocking ones are fast enough to run directly on the event loop.
+    blocking = True
+
+    def retrieve(self, query: str, top_k: int) -> list:
+        raise NotImplementedError
+
+
+def _extract_text(r: dict):
+    """Pulls the chunk text out of a single retrieval result, handling the different formats seen."""
+    # Try different possible structures for the content
+    content = r.get("content", {})
+
+    # Handle different content formats
+    if isinstance(content, dict):
+        # Standard format: content.text
+        if "text" in content:
+            return content["text"]
+        # Alternative: content might be the text directly
+        elif len(content) == 1 and list(content.values())[0]:
+            return str(list(content.values())[0])
+    elif isinstance(content, str):
+        # Content is already a string
+        return content
+    else:
+        # Fallback: try to get text from other possible locations
+        if "text" in r:
+            return r["text"]
+        elif "body" in r:
+            return str(r["body"])
+    return None
+
+
+def _extract_source(r: dict) -> str:
+    """Returns the source URI of a retrieval result (S3, web, etc.), or an empty string."""
+    location = r.get("location") or {}
+    for value in location.values():
+        if isinstance(value, dict):
+            uri = value.get("uri") or value.get("url")
+            if uri:
+                return uri
+    return ""
+
+
+class BedrockBackend(RetrievalBackend):
+    """Retrieves chunks from a Bedrock Knowledge Base."""
+
+    name = "bedrock"
+    blocking = True
+
+    def __init__(self, client, knowledge_base_id: str):
+        self.client = client
+        self.knowledge_base_id = knowledge_base_id
+
+    def retrieve(self, query: str, top_k: int) -> list:
+        resp = self.client.retrieve(
+            knowledgeBaseId=self.knowledge_base_id,
+            retrievalQuery={"text": query},
+            retrievalConfiguration={"vectorSearchConfiguration": {"numberOfResults": top_k}}
+        )
+        results = resp.get("retrievalResults", [])
+
+        chunks = []
+        for r in results:
+            text = _extract_text(r)
+            if text:
+                metadata = r.get("metadata") or {}
+                chunks.append(Chunk(text, _extract_source(r), r.get("score"),
+                                    metadata.get("x-amz-bedrock-kb-chunk-id", ""), r.get("score")))
+
+        if results and not chunks:
+            print(f"Warning: Could not extract text from retrieval results. Raw result: {results[-1]}")
+        return chunks
+
+
+class LocalBackend(RetrievalBackend):
+    """Retrieves chunks from the local memory-mapped vector index."""
+
+    name = "local"
+
+    def __init__(self, index):
+        self.index = index
+        # The search embeds the query first, which is a network call with Bedrock embeddings
+        self.blocking = embeddings.EMBEDDING_BACKEND == "bedrock"
+
+    def retrieve(self, query: str, top_k: int) -> list:
+        return self.index.search(query, top_k)
+
+
+class HybridBackend(RetrievalBackend):
+    """
+    Fuses a vector backend with the BM25 keyword index.
+
+    Both retrievers fetch `candidates` chunks; the ranked lists are merged with
+    reciprocal rank fusion, optionally reranked, and cut down to top_k. The
+    wrapper keeps the vector backend's name, so requests still select it as
+    "bedrock" or "local".
+
+    Args:
+        vector: Backend providing vector search
+        lexical: lexical_index.BM25Index over the same corpus
+        candidates: Chunks fetched from each retriever before fusion
+        rrf_k: Reciprocal rank fusion constant (higher flattens rank differences)
+        rerank_enabled: Rerank the fused candidates with hybrid_search.rerank
+        rerank_lexical_weight: Weight of query-term coverage vs. embedding similarity in the reranker
+    """
+
+    def __init__(self, vector: RetrievalBackend, lexical, candidates: int = 20, rrf_k: int = 60,
+                 rerank_enabled: bool = True, rerank_lexical_weight: float = 0.5):
+        self.vector = vector
+        self.lexical = lexical
+        self.name = vector.name
+        self.blocking = vector.blocking
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.rerank_enabled = rerank_enabled
+        self.rerank_lexical_weight = rerank_lexical_weight
+
+    def retrieve(self, query: str, top_k: int) -> list:
+        width = max(self.candidates, top_k)
+        keyword_chunks = self.lexical.search(query, width)
+        try:
+            vector_chunks = self.vector.retrieve(query, width)
+        except Exception as e:
+            if not keyword_chunks:
+                raise
+            # Keyword results alone are still useful when the vector store is unavailable
+            print(f"Warning: {self.vector.name} retrieval failed, using keyword results only: {e}")
+            vector_chunks = []
+        fused = reciprocal_rank_fusion([vector_chunks, keyword_chunks], k=self.rrf_k)
+        if self.rerank_enabled:
+            fused = rerank(query, fused, self.lexical.idf, self.rerank_lexical_weight)
+        return fused[:top_k]
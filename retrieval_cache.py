@@ -0,0 +1,184 @@
+"""
+In-memory cache for knowledge base retrieval results.
+
+Entries are keyed on the normalized query text plus top_k (and an optional
+scope such as the retrieval backend), expire after a TTL and are evicted
+least-recently-used once the cache is full. Optionally, a miss
+on the exact key falls back to embedding similarity so near-duplicate
+questions ("What is NovaTech" vs "what is novatech?") share one entry.
+The whole cache is dropped when the knowledge base version stamp changes.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from embeddings import cosine_similarity
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercases, collapses whitespace and strips trailing punctuation."""
+    return _WHITESPACE_RE.sub(" ", query.lower()).strip().rstrip("?!. ")
+
+
+class RetrievalCache:
+    """
+    Thread-safe LRU + TTL cache for retrieval results.
+
+    Args:
+        max_size: Maximum number of entries kept in memory
+        ttl_seconds: Lifetime of an entry
+        embed_fn: Optional callable(text) -> unit vector; enables near-duplicate matching
+        similarity_threshold: Minimum cosine similarity for a near-duplicate hit
+        version_fn: Optional callable() -> str; the cache is cleared when its value changes
+    """
+
+    def __init__(self, max_size: int = 256, ttl_seconds: float = 300.0, embed_fn=None,
+                 similarity_threshold: float = 0.92, version_fn=None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.version_fn = version_fn
+        self._entries = OrderedDict()  # (scope, normalized_query, top_k) -> (expires_at, value, embedding)
+        self._embedding_memo = OrderedDict()  # normalized_query -> embedding, reused by put()
+        self._lock = threading.Lock()
+        self._version = version_fn() if version_fn else None
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version(self):
+        """Clears the cache if the knowledge base version changed. Caller holds the lock."""
+        if self.version_fn is None:
+            return
+        version = self.version_fn()
+        if version != self._version:
+            self._version = version
+            self._clear_locked()
+
+    def _clear_locked(self):
+        self._entries.clear()
+        self._embedding_memo.clear()
+        self.invalidations += 1
+
+    @property
+    def semantic(self) -> bool:
+        """Whether misses fall back to embedding similarity (which may block on an embedding call)."""
+        return self.embed_fn is not None
+
+    def _embed(self, normalized: str):
+        """Returns the query's embedding. Called without the lock: embed_fn may be a network call."""
+        with self._lock:
+            embedding = self._embedding_memo.get(normalized)
+        if embedding is None:
+            embedding = self.embed_fn(normalized)
+            with self._lock:
+                self._embedding_memo[normalized] = embedding
+                if len(self._embedding_memo) > self.max_size:
+                    self._embedding_memo.popitem(last=False)
+        return embedding
+
+    def get(self, query: str, top_k: int, scope: str = ""):
+        """Returns the cached value for the query, or None on a miss. May block in semantic mode."""
+        value = self.get_exact(query, top_k, scope)
+        if value is None and self.semantic:
+            value = self.get_similar(query, top_k, scope)
+        return value
+
+    def get_exact(self, query: str, top_k: int, scope: str = ""):
+        """
+        Returns the value cached under the exact normalized query, else None.
+        Never blocks; in semantic mode a miss is only counted by get_similar().
+        """
+        key = (scope, normalize_query(query), top_k)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+            if not self.semantic:
+                self.misses += 1
+            return None
+
+    def get_similar(self, query: str, top_k: int, scope: str = ""):
+        """
+        Returns the value of the most similar cached query above the threshold,
+        else None. Embeds the query, so call it off the event loop; the lock is
+        only held to copy the candidates and to take the hit.
+        """
+        with self._lock:
+            self._check_version()
+            now = time.monotonic()
+            candidates = [(key, embedding) for key, (expires_at, _, embedding) in self._entries.items()
+                          if key[0] == scope and key[2] == top_k and expires_at > now and embedding is not None]
+        best_key = None
+        if candidates:
+            try:
+                query_embedding = self._embed(normalize_query(query))
+            except Exception as e:
+                print(f"Warning: Could not embed query for cache lookup: {e}")
+                query_embedding = None
+            if query_embedding is not None:
+                best_score = self.similarity_threshold
+                for key, embedding in candidates:
+                    score = cosine_similarity(query_embedding, embedding)
+                    if score >= best_score:
+                        best_key, best_score = key, score
+        with self._lock:
+            # The entry may have been evicted or expired while we compared
+            entry = self._entries.get(best_key) if best_key is not None else None
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(best_key)
+                self.semantic_hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, query: str, top_k: int, value, scope: str = ""):
+        """Stores a value, evicting the least recently used entries if the cache is full."""
+        normalized = normalize_query(query)
+        key = (scope, normalized, top_k)
+        embedding = None
+        if self.semantic:
+            try:
+                embedding = self._embed(normalized)
+            except Exception as e:
+                print(f"Warning: Could not embed query for cache entry: {e}")
+        with self._lock:
+            self._check_version()
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        """Drops every entry (e.g. after the knowledge base was re-synced)."""
+        with self._lock:
+            self._clear_locked()
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the current size."""
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,276 @@
+"""
+Batch question answering: answers a JSONL file (or stdin) of prompts offline.
+
+Runs the same retrieval + generation pipeline as the /invocations JSON path,
+in-process, with bounded parallelism. Designed for nightly jobs with
+thousands of questions:
+
+- Input is read as a stream, so large files are never loaded at once.
+- Identical questions (after normalization) are answered once and the
+  answer is written for each of their IDs, however far apart they are in
+  the input (answers are kept in memory for the run). Sub-queries shared between
+  different questions are retrieved once through the retrieval cache and
+  single-flight scheduler.
+- Results are appended to the output file as JSONL as soon as each answer is
+  ready. The output file doubles as the checkpoint: with --resume, IDs that
+  already have a successful result are skipped, so an interrupted run picks
+  up where it stopped.
+- Progress and a final throughput report go to stderr.
+
+Input lines are JSON objects with "prompt" (or "question") and an optional
+"id" (default: the line number); a line that is not JSON is used as the
+prompt text itself. A record whose prompt is not a string, or whose id is
+not a string or number, gets an error result and the run carries on.
+
+Examples:
+    python scripts/batch_answer.py questions.jsonl --output answers.jsonl --concurrency 16
+    python scripts/batch_answer.py questions.jsonl --output answers.jsonl --resume
+    python scripts/batch_answer.py questions.jsonl --output answers.jsonl --tenant support
+    cat questions.txt | python scripts/batch_answer.py - > answers.jsonl
+    python scripts/batch_answer.py questions.jsonl --output answers.jsonl --fake   # no AWS access
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+# Allow importing shared modules from the project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+
+def read_prompts(stream):
+    """
+    Yields (id, prompt, error) for every non-empty input line. error is None
+    for a usable record, else why the record cannot be answered.
+    """
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            record = line
+        if not isinstance(record, dict):
+            yield str(line_number), str(record).strip(), None
+            continue
+        item_id = record.get("id")
+        if item_id is None:
+            item_id = line_number
+        elif not isinstance(item_id, (str, int, float)):
+            yield str(line_number), "", f"id must be a string or number, got {type(item_id).__name__}"
+            continue
+        prompt = record.get("prompt") or record.get("question") or ""
+        if not isinstance(prompt, str):
+            yield str(item_id), "", f"prompt must be a string, got {type(prompt).__name__}"
+            continue
+        yield str(item_id), prompt.strip(), None
+
+
+def load_checkpoint(path: str) -> set:
+    """
+    Returns the IDs that already have a successful result in the output file.
+    A partially written last line (from a killed run) is cut off.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "rb+") as f:
+        data = f.read()
+        complete = data.rfind(b"\n") + 1
+        if complete < len(data):
+            f.truncate(complete)
+    for line in data[:complete].decode("utf-8").splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        # The latest record for an ID wins, so a retried failure counts once it succeeds
+        if "error" in record:
+            done.discard(str(record.get("id")))
+        else:
+            done.add(str(record.get("id")))
+    return done
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+class BatchRunner:
+    """Answers prompts with bounded concurrency, answering duplicate prompts once."""
+
+    def __init__(self, app_module, out, concurrency: int, backend_name: str = None, multi_query: bool = None,
+                 progress_every: int = 100, tenant=None):
+        self.app = app_module
+        self.out = out
+        self.concurrency = concurrency
+        self.backend_name = backend_name
+        self.multi_query = multi_query
+        self.progress_every = progress_every
+        self.tenant = tenant or app_module.default_tenant
+        # Normalized prompt -> task answering it, kept for the whole run so a repeat finds the answer
+        self.answers = {}
+        self.latencies = []
+        self.completed = 0
+        self.errors = 0
+        self.deduplicated = 0
+        self.skipped = 0
+        self.started = time.perf_counter()
+
+    async def _answer(self, prompt: str) -> dict:
+        start = time.perf_counter()
+        answer, chunks = await self.app.answer_prompt(prompt, None, self.backend_name, self.multi_query,
+                                                      tenant=self.tenant)
+        return {"result": answer, "sources": self.app.source_references(chunks),
+                "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+    async def answer(self, item_id: str, prompt: str, error: str = None):
+        if error:
+            self.write({"id": item_id, "error": error})
+            return
+        if not prompt:
+            self.write({"id": item_id, "prompt": prompt, "error": "empty prompt"})
+            return
+        key = self.app.normalize_query(prompt)
+        task = self.answers.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._answer(prompt))
+            self.answers[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget_failed(key, done))
+        else:
+            self.deduplicated += 1
+        try:
+            record = {"id": item_id, "prompt": prompt, **await asyncio.shield(task)}
+        except Exception as e:
+            record = {"id": item_id, "prompt": prompt, "error": f"{type(e).__name__}: {e}"}
+        self.write(record)
+
+    def _forget_failed(self, key: str, task: asyncio.Future):
+        # Failed answers are not kept, so a later repeat of the prompt tries again
+        if task.cancelled() or task.exception() is not None:
+            self.answers.pop(key, None)
+
+    def write(self, record: dict):
+        self.out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.out.flush()
+        self.completed += 1
+        if "error" in record:
+            self.errors += 1
+        else:
+            self.latencies.append(record["latency_ms"])
+        if self.progress_every and self.completed % self.progress_every == 0:
+            elapsed = time.perf_counter() - self.started
+            print(f"  {self.completed} answered ({self.errors} errors) in {elapsed:.1f}s "
+                  f"- {self.completed / elapsed:.1f}/s", file=sys.stderr)
+
+    async def worker(self, queue: asyncio.Queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            await self.answer(*item)
+
+    async def run(self, items, done_ids: set):
+        # A small bounded queue keeps memory flat however large the input is
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [asyncio.create_task(self.worker(queue)) for _ in range(self.concurrency)]
+        for item_id, prompt, error in items:
+            if item_id in done_ids:
+                self.skipped += 1
+                continue
+            await queue.put((item_id, prompt, error))
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    def report(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        latencies = sorted(self.latencies)
+        answer_cache = self.app.answer_cache.stats()
+        retrieval_cache = self.tenant.retrieval_cache.stats() if self.tenant.retrieval_cache else {}
+        return {
+            "tenant": self.tenant.name,
+            "answered": self.completed,
+            "errors": self.errors,
+            "skipped_from_checkpoint": self.skipped,
+            "deduplicated": self.deduplicated,
+            "elapsed_seconds": round(elapsed, 2),
+            "throughput_per_second": round(self.completed / elapsed, 2) if elapsed > 0 else 0.0,
+            "latency_ms": {"p50": percentile(latencies, 0.50), "p95": percentile(latencies, 0.95),
+                           "max": latencies[-1] if latencies else 0.0},
+            "answer_cache_hits": answer_cache.get("hits", 0),
+            "retrieval_cache_hits": retrieval_cache.get("hits", 0),
+        }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of prompts with the RAG pipeline")
+    parser.add_argument("input", help="JSONL (or plain text) file of prompts, or - for stdin")
+    parser.add_argument("--output", "-o", help="JSONL file to write results to; it is overwritten unless "
+                                                   "--resume is given, which appends (default: stdout)")
+    parser.add_argument("--resume", action="store_true", help="Skip IDs that already have a result in --output")
+    parser.add_argument("--concurrency", type=int, default=8, help="Prompts answered at the same time")
+    parser.add_argument("--tenant", help="Tenant (knowledge base) to answer from (default: the default tenant)")
+    parser.add_argument("--backend", help="Retrieval backend to use (default: the tenant's default backend)")
+    parser.add_argument("--multi-query", action="store_true", help="Expand compound questions into sub-queries")
+    parser.add_argument("--no-multi-query", action="store_true", help="Disable query expansion")
+    parser.add_argument("--progress-every", type=int, default=100, help="Print progress every N results (0 = never)")
+    parser.add_argument("--report", help="Also write the final report as JSON to this file")
+    parser.add_argument("--fake", action="store_true",
+                        help="Use the benchmark's fake knowledge base and agent instead of AWS")
+    args = parser.parse_args()
+    if args.resume and not args.output:
+        parser.error("--resume needs --output")
+    return args
+
+
+def main():
+    args = parse_args()
+    import app as app_module
+    if args.fake:
+        from benchmark import install_fakes
+        install_fakes(app_module, argparse.Namespace(kb_latency_ms=120, kb_jitter_ms=30, first_token_ms=300,
+                                                     tokens_per_second=50, answer_tokens=60))
+    try:
+        tenant = app_module.tenant_registry.get(app_module.tenant_registry.resolve(args.tenant))
+    except KeyError as e:
+        sys.exit(e.args[0])
+    if args.backend and args.backend not in tenant.backends:
+        sys.exit(f"Unknown or disabled retrieval backend: {args.backend}")
+
+    done_ids = load_checkpoint(args.output) if args.resume else set()
+    if done_ids:
+        print(f"Resuming: {len(done_ids)} prompts already answered in {args.output}", file=sys.stderr)
+    source = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    out = open(args.output, "a" if args.resume else "w", encoding="utf-8") if args.output else sys.stdout
+
+    runner = BatchRunner(app_module, out, max(args.concurrency, 1), args.backend,
+                         False if args.no_multi_query else (True if args.multi_query else None),
+                         args.progress_every, tenant)
+    try:
+        asyncio.run(runner.run(read_prompts(source), done_ids))
+    except KeyboardInterrupt:
+        print("Interrupted; rerun with --resume to continue", file=sys.stderr)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+
+    report = runner.report()
+    print("\nBatch report:", file=sys.stderr)
+    for key, value in report.items():
+        print(f"  {key}: {value}", file=sys.stderr)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
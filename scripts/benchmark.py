@@ -0,0 +1,463 @@
+"""
+Offline load test / benchmark for the RAG server.
+
+By default the app is started in-process on a local port, with the Bedrock
+Knowledge Base client and the Strands agent replaced by local fakes that
+inject configurable latency and token rates, so no AWS access is needed.
+The in-process app runs with its answer cache off (--answer-cache turns it
+back on): repeated prompts would otherwise skip the agent entirely, and the
+benchmark would stop measuring generation and conversation history.
+The harness drives /invocations either at a fixed concurrency (closed loop)
+or at a fixed request rate (open loop) and reports throughput, latency
+percentiles, errors, and process memory sampled over the run.
+
+Examples:
+    python scripts/benchmark.py --concurrency 50 --duration 30
+    python scripts/benchmark.py --rate 200 --duration 60 --stream
+    python scripts/benchmark.py --compound --unique --mode pipelined   # compare with --mode sequential
+    python scripts/benchmark.py --tenants support,docs,sales --concurrency 60   # one worker, several knowledge bases
+    python scripts/benchmark.py --url http://127.0.0.1:18080 --concurrency 10   # real server, no fakes
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import sys
+import threading
+import time
+
+# Allow importing shared modules from the project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+import httpx
+
+DEFAULT_PROMPTS = [
+    "What is NovaTech?",
+    "What industries does NovaTech serve?",
+    "Does NovaTech use AWS services?",
+    "How often is InsightPro updated?",
+    "Is customer data secure?",
+]
+
+# Questions that query expansion splits into several sub-queries (see --compound). Every part names
+# the product or company, so --unique can vary the name without stopping the expansion
+COMPOUND_PROMPTS = [
+    "What is the price and warranty of InsightPro?",
+    "Who founded NovaTech and where is NovaTech based?",
+    "How often is InsightPro updated, and how does InsightPro secure customer data?",
+    "What industries does NovaTech serve and which AWS services does NovaTech use?",
+]
+_NAME_RE = re.compile(r"\b(NovaTech|InsightPro)\b")
+
+
+# ---------- Fakes ----------
+class FakeKnowledgeBaseClient:
+    """Stand-in for the bedrock-agent-runtime client: ranks chunks of knowledge/ by word overlap."""
+
+    def __init__(self, latency_ms: float, jitter_ms: float):
+        import local_index
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.chunks = []
+        for path in local_index.list_documents():
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            uri = f"s3://benchmark/{os.path.basename(path)}"
+            for i, chunk in enumerate(local_index.chunk_text(text)):
+                self.chunks.append((chunk, uri, f"{uri}#{i}", set(chunk.lower().split())))
+        self.calls = 0
+
+    def retrieve(self, knowledgeBaseId, retrievalQuery, retrievalConfiguration):
+        self.calls += 1
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        words = set(retrievalQuery["text"].lower().split())
+        top_k = retrievalConfiguration["vectorSearchConfiguration"]["numberOfResults"]
+        scored = sorted(self.chunks, key=lambda c: len(words & c[3]), reverse=True)[:top_k]
+        return {"retrievalResults": [
+            {
+                "content": {"text": text},
+                "location": {"type": "S3", "s3Location": {"uri": uri}},
+                "score": min(1.0, len(words & vocab) / (len(words) or 1)),
+                "metadata": {"x-amz-bedrock-kb-chunk-id": chunk_id},
+            }
+            for text, uri, chunk_id, vocab in scored
+        ]}
+
+
+class _FakeResult:
+    def __init__(self, text: str):
+        self.message = {"role": "assistant", "content": [{"text": text}]}
+
+
+class FakeAgent:
+    """
+    Stand-in for strands.Agent. Waits first_token_ms, then emits answer_tokens
+    tokens at tokens_per_second. Keeps message history like the real agent
+    (bounded by the window), so history growth shows up in memory samples.
+    """
+
+    first_token = 0.3
+    tokens_per_second = 50.0
+    answer_tokens = 60
+
+    def __init__(self, window_size: int):
+        self.window_size = window_size
+        self.messages = []
+
+    def _remember(self, prompt: str, answer: str):
+        self.messages.append({"role": "user", "content": [{"text": prompt}]})
+        self.messages.append({"role": "assistant", "content": [{"text": answer}]})
+        if self.window_size and len(self.messages) > self.window_size:
+            del self.messages[:len(self.messages) - self.window_size]
+
+    async def stream_async(self, prompt: str):
+        await asyncio.sleep(self.first_token)
+        tokens = []
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        for i in range(self.answer_tokens):
+            token = f"tok{i} "
+            tokens.append(token)
+            yield {"data": token}
+            if interval:
+                await asyncio.sleep(interval)
+        answer = "".join(tokens)
+        self._remember(prompt, answer)
+        yield {"result": _FakeResult(answer)}
+
+    async def invoke_async(self, prompt: str):
+        result = None
+        async for event in self.stream_async(prompt):
+            if "result" in event:
+                result = event["result"]
+        return result
+
+
+def install_fakes(app_module, args):
+    """Replace the Bedrock client and the agent factory of an imported app module."""
+    fake_kb = FakeKnowledgeBaseClient(args.kb_latency_ms, args.kb_jitter_ms)
+    app_module.kb_client = fake_kb
+    for backend in app_module.retrieval_backends.values():
+        # Hybrid backends wrap the vector backend that owns the client
+        backend = getattr(backend, "vector", backend)
+        if hasattr(backend, "client"):
+            backend.client = fake_kb
+    FakeAgent.first_token = args.first_token_ms / 1000.0
+    FakeAgent.tokens_per_second = args.tokens_per_second
+    FakeAgent.answer_tokens = args.answer_tokens
+    app_module.session_manager.agent_factory = FakeAgent
+    return fake_kb
+
+
+def start_local_server(app_module) -> str:
+    """Run the app with uvicorn in a background thread on a free port; returns its base URL."""
+    import uvicorn
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    config = uvicorn.Config(app_module.app, host="127.0.0.1", port=port, log_level="error", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("Local server did not start")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+# ---------- Measurements ----------
+def rss_mb() -> float:
+    """Resident set size of this process in MB (Linux /proc; falls back to peak RSS)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 if sys.platform != "darwin" else peak / (1024 * 1024)
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+class Results:
+    def __init__(self):
+        self.latencies = []
+        self.first_tokens = []
+        self.errors = 0
+        self.status_codes = {}
+        self.memory = []  # (elapsed_seconds, rss_mb, completed)
+
+
+# ---------- Load Generation ----------
+def unique_prompt(prompt: str, n: int) -> str:
+    """
+    Makes a prompt (and each of its sub-queries) unique to request n. Names are
+    numbered rather than text appended, since query expansion keeps a question
+    whole when one of its parts does not read as a question on its own.
+    """
+    tag = str(n) if n >= 0 else f"W{-n}"  # warm-up requests use negative numbers
+    prompt, replaced = _NAME_RE.subn(lambda m: f"{m.group(1)}{tag}", prompt)
+    return prompt if replaced else f"{prompt} (request {tag})"
+
+
+def make_payload(args, n: int) -> dict:
+    prompt = random.choice(args.prompt_list)
+    if args.unique:
+        # Defeat caches so every request pays for retrieval and generation
+        prompt = unique_prompt(prompt, n)
+    payload = {"prompt": prompt, "pipelined": args.mode == "pipelined"}
+    if args.compound:
+        # Query expansion is off by default; compound questions are only interesting with it on
+        payload["multi_query"] = True
+    if args.stream:
+        payload["stream"] = True
+    if args.sessions:
+        payload["session_id"] = f"bench-{n % args.sessions}"
+    if args.tenant_list:
+        payload["tenant"] = args.tenant_list[n % len(args.tenant_list)]
+    return payload
+
+
+async def send_prefetch(client: httpx.AsyncClient, url: str, payload: dict, think_seconds: float):
+    """Sends the typing-time hint, then waits as long as a user would before submitting."""
+    try:
+        # Same expansion setting as the request, so the hint warms the sub-queries the request will use
+        await client.post(url, json={"prompt": payload["prompt"], "tenant": payload.get("tenant"),
+                                     "multi_query": payload.get("multi_query")})
+    except Exception:
+        pass
+    await asyncio.sleep(think_seconds)
+
+
+async def send_one(client: httpx.AsyncClient, url: str, payload: dict, results: Results):
+    start = time.perf_counter()
+    try:
+        if payload.get("stream"):
+            async with client.stream("POST", url, json=payload) as response:
+                first = None
+                async for line in response.aiter_lines():
+                    if first is None and line.startswith("data:") and '"token"' in line:
+                        first = time.perf_counter() - start
+                status = response.status_code
+            if first is not None:
+                results.first_tokens.append(first)
+        else:
+            response = await client.post(url, json=payload)
+            status = response.status_code
+        results.status_codes[status] = results.status_codes.get(status, 0) + 1
+        if status >= 400:
+            results.errors += 1
+        else:
+            results.latencies.append(time.perf_counter() - start)
+    except Exception:
+        results.errors += 1
+        results.status_codes["exception"] = results.status_codes.get("exception", 0) + 1
+
+
+async def sample_memory(results: Results, started: float, interval: float, stop: asyncio.Event):
+    while not stop.is_set():
+        results.memory.append((time.perf_counter() - started, rss_mb(), len(results.latencies)))
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+    results.memory.append((time.perf_counter() - started, rss_mb(), len(results.latencies)))
+
+
+async def run_load(base_url: str, args) -> tuple:
+    invocations_url = f"{base_url}/invocations"
+    prefetch_url = f"{base_url}/prefetch"
+    results = Results()
+
+    async def request(client, payload, results):
+        # Latency is measured from the submit, as a user would see it; the prefetch happens while "typing"
+        if args.mode == "prefetch":
+            await send_prefetch(client, prefetch_url, payload, args.think_ms / 1000.0)
+        await send_one(client, invocations_url, payload, results)
+
+    limits = httpx.Limits(max_connections=max(args.concurrency, 100), max_keepalive_connections=max(args.concurrency, 100))
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        # Warm up connections, caches and agent pools outside the measured window
+        for i in range(args.warmup):
+            await request(client, make_payload(args, -1 - i), Results())
+
+        stop = asyncio.Event()
+        started = time.perf_counter()
+        sampler = asyncio.create_task(sample_memory(results, started, args.sample_interval, stop))
+        deadline = started + args.duration
+        counter = iter(range(10**12))
+
+        if args.rate:
+            # Open loop: fire requests at a fixed rate regardless of how fast they complete
+            tasks = []
+            interval = 1.0 / args.rate
+            next_send = started
+            while next_send < deadline and (not args.requests or len(tasks) < args.requests):
+                await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+                tasks.append(asyncio.create_task(request(client, make_payload(args, next(counter)), results)))
+                next_send += interval
+            await asyncio.gather(*tasks)
+        else:
+            # Closed loop: a fixed number of workers, each sending back-to-back requests
+            sent = [0]
+
+            async def worker():
+                while time.perf_counter() < deadline and (not args.requests or sent[0] < args.requests):
+                    sent[0] += 1
+                    await request(client, make_payload(args, next(counter)), results)
+
+            await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await sampler
+    return results, elapsed
+
+
+def summarize(results: Results, elapsed: float, args, fake_kb=None) -> dict:
+    latencies = sorted(results.latencies)
+    first_tokens = sorted(results.first_tokens)
+    memory = results.memory
+    summary = {
+        "mode": "rate" if args.rate else "concurrency",
+        "target": args.rate if args.rate else args.concurrency,
+        "stream": args.stream,
+        "request_mode": args.mode,
+        "duration_seconds": round(elapsed, 3),
+        "completed": len(latencies),
+        "errors": results.errors,
+        "status_codes": {str(k): v for k, v in results.status_codes.items()},
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(percentile(latencies, 0.99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        },
+        "memory_mb": {
+            "start": round(memory[0][1], 1) if memory else 0.0,
+            "end": round(memory[-1][1], 1) if memory else 0.0,
+            "growth": round(memory[-1][1] - memory[0][1], 1) if memory else 0.0,
+            "samples": [{"t": round(t, 1), "rss_mb": round(m, 1), "completed": c} for t, m, c in memory],
+        },
+    }
+    if first_tokens:
+        summary["first_token_ms"] = {
+            "p50": round(percentile(first_tokens, 0.50) * 1000, 2),
+            "p95": round(percentile(first_tokens, 0.95) * 1000, 2),
+            "p99": round(percentile(first_tokens, 0.99) * 1000, 2),
+        }
+    if fake_kb is not None:
+        summary["fake_kb_calls"] = fake_kb.calls
+    return summary
+
+
+def print_summary(summary: dict):
+    print("\n" + "="*60)
+    print("Benchmark Results")
+    print("="*60)
+    target = f"{summary['target']} req/s" if summary["mode"] == "rate" else f"{summary['target']} concurrent"
+    print(f"Load:        {target}{' (streaming)' if summary['stream'] else ''}, {summary['request_mode']} mode")
+    print(f"Duration:    {summary['duration_seconds']:.1f}s")
+    print(f"Completed:   {summary['completed']}  Errors: {summary['errors']}  Status: {summary['status_codes']}")
+    print(f"Throughput:  {summary['throughput_rps']:.1f} req/s")
+    lat = summary["latency_ms"]
+    print(f"Latency ms:  p50={lat['p50']}  p95={lat['p95']}  p99={lat['p99']}  max={lat['max']}  mean={lat['mean']}")
+    if "first_token_ms" in summary:
+        ft = summary["first_token_ms"]
+        print(f"First token: p50={ft['p50']}  p95={ft['p95']}  p99={ft['p99']} ms")
+    if "fake_kb_calls" in summary:
+        print(f"KB calls:    {summary['fake_kb_calls']} (fake Bedrock retrieve calls)")
+    mem = summary["memory_mb"]
+    print(f"Memory MB:   start={mem['start']}  end={mem['end']}  growth={mem['growth']:+}")
+    print("\n  t(s)   rss(MB)  completed")
+    for sample in mem["samples"]:
+        print(f"  {sample['t']:>5}  {sample['rss_mb']:>8}  {sample['completed']:>9}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test /invocations with local fakes for Bedrock and the agent")
+    load = parser.add_argument_group("load")
+    load.add_argument("--concurrency", type=int, default=20, help="Concurrent workers (closed loop)")
+    load.add_argument("--rate", type=float, default=0, help="Requests per second (open loop); overrides --concurrency")
+    load.add_argument("--duration", type=float, default=20, help="Seconds to run")
+    load.add_argument("--requests", type=int, default=0, help="Stop after this many requests (0 = no limit)")
+    load.add_argument("--warmup", type=int, default=5, help="Unmeasured requests sent first")
+    load.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    load.add_argument("--stream", action="store_true", help="Use streaming mode and measure time to first token")
+    load.add_argument("--sessions", type=int, default=0, help="Spread requests over this many session IDs (0 = stateless)")
+    load.add_argument("--unique", action="store_true", help="Make every prompt unique to bypass caches")
+    load.add_argument("--answer-cache", action="store_true",
+                      help="Keep the in-process app's answer cache on (off by default so every request reaches the "
+                           "agent; use --unique to bypass it on a --url server)")
+    load.add_argument("--prompts", help="File with one prompt per line (default: the test page examples)")
+    load.add_argument("--compound", action="store_true", help="Use built-in compound questions and turn query expansion on for them")
+    load.add_argument("--mode", choices=("sequential", "pipelined", "prefetch"), default="sequential",
+                      help="sequential: retrieve every sub-query before generating; pipelined: generate once the "
+                           "original prompt's chunks arrive; prefetch: sequential, with a /prefetch hint sent "
+                           "--think-ms before each request")
+    load.add_argument("--think-ms", type=float, default=300, help="Delay between the prefetch hint and the request")
+    load.add_argument("--tenants", help="Comma-separated tenant names to spread requests over (with fakes, each "
+                                        "gets a fake knowledge base unless TENANTS is set)")
+    load.add_argument("--sample-interval", type=float, default=1.0, help="Seconds between memory samples")
+    load.add_argument("--url", help="Benchmark an already running server instead (no fakes)")
+    load.add_argument("--json", help="Write the summary as JSON to this file")
+    fakes = parser.add_argument_group("fakes")
+    fakes.add_argument("--kb-latency-ms", type=float, default=120, help="Fake Bedrock retrieve latency")
+    fakes.add_argument("--kb-jitter-ms", type=float, default=30, help="+/- jitter on the retrieve latency")
+    fakes.add_argument("--first-token-ms", type=float, default=300, help="Fake model time to first token")
+    fakes.add_argument("--tokens-per-second", type=float, default=50, help="Fake model generation rate")
+    fakes.add_argument("--answer-tokens", type=int, default=60, help="Tokens per fake answer")
+    args = parser.parse_args()
+    if args.prompts:
+        with open(args.prompts, "r", encoding="utf-8") as f:
+            args.prompt_list = [line.strip() for line in f if line.strip()]
+    elif args.compound:
+        args.prompt_list = COMPOUND_PROMPTS
+    else:
+        args.prompt_list = DEFAULT_PROMPTS
+    args.tenant_list = [name.strip() for name in (args.tenants or "").split(",") if name.strip()]
+    return args
+
+
+def main():
+    args = parse_args()
+    fake_kb = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+        print(f"Benchmarking running server at {base_url}")
+    else:
+        if args.tenant_list and not os.getenv("TENANTS") and not os.getenv("TENANTS_FILE"):
+            os.environ["TENANTS"] = json.dumps({name: {"knowledge_base_id": f"FAKE{i:06d}"}
+                                                for i, name in enumerate(args.tenant_list)})
+        import app as app_module
+        fake_kb = install_fakes(app_module, args)
+        app_module.ANSWER_CACHE_ENABLED = args.answer_cache
+        base_url = start_local_server(app_module)
+        print(f"Started in-process server with fakes at {base_url}")
+        print(f"  KB latency {args.kb_latency_ms}±{args.kb_jitter_ms} ms, first token {args.first_token_ms} ms, "
+              f"{args.tokens_per_second} tok/s x {args.answer_tokens} tokens, "
+              f"answer cache {'on' if args.answer_cache else 'off'}")
+
+    results, elapsed = asyncio.run(run_load(base_url, args))
+    summary = summarize(results, elapsed, args, fake_kb)
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nSummary written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
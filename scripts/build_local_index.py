@@ -0,0 +1,80 @@
+"""
+Builds the local vector index over the knowledge/ directory.
+The server builds the index at startup when it is missing or stale; run this
+ahead of time (e.g. in a container build) to keep startup fast.
+
+Chunking and batching can be overridden to compare settings. Write such
+experiments to another --index-dir: the server rebuilds an index whose chunk
+settings differ from CHUNK_SIZE/CHUNK_OVERLAP.
+
+Usage:
+    python scripts/build_local_index.py [--force] [--chunk-size N] [--chunk-overlap N]
+                                        [--workers N] [--batch-size N] [--index-dir DIR]
+"""
+import argparse
+import os
+import sys
+import time
+
+# Allow importing shared modules from the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ingest
+import local_index
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the local vector index")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the index is up to date")
+    parser.add_argument("--knowledge-dir", default=local_index.KNOWLEDGE_DIR)
+    parser.add_argument("--index-dir", default=local_index.INDEX_DIR)
+    parser.add_argument("--chunk-size", type=int, default=local_index.CHUNK_SIZE, help="Characters per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=local_index.CHUNK_OVERLAP,
+                        help="Characters shared by consecutive windows of long paragraphs")
+    parser.add_argument("--workers", type=int, default=ingest.INGEST_WORKERS,
+                        help="Parse processes (0 = CPU count, 1 = in-process)")
+    parser.add_argument("--batch-size", type=int, default=ingest.EMBED_BATCH_SIZE, help="Chunks per embedding batch")
+    return parser.parse_args()
+
+def print_stats(stats: dict):
+    print(f"\nPipeline: {stats['documents']} documents, {stats['workers']} parse workers, "
+          f"embedding batches of {stats['batch_size']}")
+    print(f"  {'stage':<8}{'items':>8}{'chars':>12}{'seconds':>10}{'items/s':>12}{'chars/s':>14}")
+    for name, stage in stats["stages"].items():
+        items_rate = f"{stage['items_per_second']:.0f}" if stage["items_per_second"] else "-"
+        chars_rate = f"{stage['chars_per_second']:.0f}" if stage["chars_per_second"] else "-"
+        print(f"  {name:<8}{stage['items']:>8}{stage['chars']:>12}{stage['seconds']:>10.3f}"
+              f"{items_rate:>12}{chars_rate:>14}")
+
+def main():
+    args = parse_args()
+    print("="*60)
+    print("Local Index Builder")
+    print("="*60)
+    print(f"Knowledge directory: {args.knowledge_dir}")
+    print(f"Index directory: {args.index_dir}")
+    print(f"Chunking: {args.chunk_size} characters, {args.chunk_overlap} overlap\n")
+
+    default_chunking = (args.chunk_size, args.chunk_overlap) == (local_index.CHUNK_SIZE, local_index.CHUNK_OVERLAP)
+    if default_chunking and not args.force and not local_index.is_stale(args.knowledge_dir, args.index_dir):
+        print("✓ Index is up to date (use --force to rebuild)")
+        return
+
+    start = time.perf_counter()
+    meta = ingest.ingest(args.knowledge_dir, args.index_dir, args.chunk_size, args.chunk_overlap,
+                         args.workers, args.batch_size)
+    elapsed = time.perf_counter() - start
+
+    print(f"✓ Indexed {meta['num_chunks']} chunks from {len(meta['files'])} files in {elapsed:.2f}s")
+    print(f"  Embedding backend: {meta['embedding_backend']} ({meta['embedding_dim']} dimensions)")
+    print_stats(meta["stats"])
+
+    # Quick sanity query against the freshly built index
+    index = local_index.LocalIndex.load(args.index_dir)
+    start = time.perf_counter()
+    results = index.search("What is NovaTech?", top_k=3)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"\nTest query 'What is NovaTech?' -> {len(results)} results in {elapsed_ms:.2f} ms")
+    for r in results:
+        print(f"  {r.score:.3f}  {r.id}")
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,17 @@ Quick script to check if the knowledge base is ready for queries.
 Run this to see if indexing is complete before testing the chatbot.
 """
 import os
-import boto3
+import sys
 import json
 
+# Allow importing shared modules from the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aws_clients import get_client
+
 REGION = os.getenv("AWS_REGION", "us-east-2")
-KNOWLEDGE_BASE_ID = "YN0B2UVKBS"
+KNOWLEDGE_BASE_ID = os.getenv("KNOWLEDGE_BASE_ID", "YN0B2UVKBS")  # Set via environment variable, as in app.py
 
-runtime_client = boto3.client("bedrock-agent-runtime", region_name=REGION)
+runtime_client = get_client("bedrock-agent-runtime", region=REGION)
 
 def check_ready():
     """Check if knowledge base retrieval is working"""
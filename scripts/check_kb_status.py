@@ -2,15 +2,19 @@
 Check knowledge base status and configuration
 """
 import os
-import boto3
+import sys
 import json
 
+# Allow importing shared modules from the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aws_clients import get_client
+
 REGION = os.getenv("AWS_REGION", "us-east-2")
-KNOWLEDGE_BASE_ID = "YN0B2UVKBS"
+KNOWLEDGE_BASE_ID = os.getenv("KNOWLEDGE_BASE_ID", "YN0B2UVKBS")  # Set via environment variable, as in app.py
 
 # Use bedrock-agent client to check KB details
-agent_client = boto3.client("bedrock-agent", region_name=REGION)
-runtime_client = boto3.client("bedrock-agent-runtime", region_name=REGION)
+agent_client = get_client("bedrock-agent", region=REGION)
+runtime_client = get_client("bedrock-agent-runtime", region=REGION)
 
 try:
     print(f"Checking Knowledge Base: {KNOWLEDGE_BASE_ID}")
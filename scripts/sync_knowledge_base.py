@@ -1,16 +1,47 @@
 """
 Script to sync/start a sync job for the knowledge base data source.
 This ensures the files are indexed and available for retrieval.
+
+Syncing is incremental: a manifest of content hashes (per file and per chunk)
+records what was last uploaded. Only added, changed and deleted files in
+knowledge/ are uploaded to / removed from the S3 data source, and no
+ingestion job is started when nothing changed. Pass --force to upload
+everything and re-ingest anyway. The manifest also records the knowledge
+base and data source IDs it was written for; if they differ from the
+current ones (or are missing), the run is a full sync and deletes nothing.
+
+The knowledge base version stamp is bumped when ingestion starts and again
+once the jobs have finished, so server caches refilled while documents were
+being indexed are dropped too. Pass --no-wait to return right after starting
+the jobs (the server then serves those entries until their TTL).
 """
 import os
-import boto3
+import sys
+import json
+import hashlib
 import time
 
+# Allow importing shared modules from the project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+import kb_version
+import local_index
+from aws_clients import get_client
+
 REGION = os.getenv("AWS_REGION", "us-east-2")
-KNOWLEDGE_BASE_ID = "YN0B2UVKBS"
+KNOWLEDGE_BASE_ID = os.getenv("KNOWLEDGE_BASE_ID", "YN0B2UVKBS")  # Set via environment variable, as in app.py
 
-agent_client = boto3.client("bedrock-agent", region_name=REGION)
-runtime_client = boto3.client("bedrock-agent-runtime", region_name=REGION)
+# Hashes of what was last uploaded, and a log with one summary line per run
+MANIFEST_FILE = os.getenv("KB_MANIFEST_FILE", os.path.join(PROJECT_ROOT, ".kb_manifest.json"))
+SYNC_LOG_FILE = os.getenv("KB_SYNC_LOG_FILE", os.path.join(PROJECT_ROOT, ".kb_sync_runs.jsonl"))
+# How long to wait for ingestion jobs to finish before giving up on the second version bump
+SYNC_WAIT_SECONDS = float(os.getenv("KB_SYNC_WAIT_SECONDS", "1800"))
+SYNC_POLL_SECONDS = 10
+FINISHED_JOB_STATUSES = ("COMPLETE", "FAILED", "STOPPED")
+
+agent_client = get_client("bedrock-agent", region=REGION)
+runtime_client = get_client("bedrock-agent-runtime", region=REGION)
+s3_client = get_client("s3", region=REGION)
 
 def list_data_sources():
     """List all data sources for the knowledge base"""
@@ -21,6 +52,113 @@ def list_data_sources():
         print(f"Error listing data sources: {e}")
         return []
 
+# ---------- Manifest ----------
+def build_manifest(data_source_ids=()):
+    """Hash every document in knowledge/, per file and per chunk, for the current knowledge base"""
+    files = {}
+    for path in local_index.list_documents():
+        name = os.path.relpath(path, local_index.KNOWLEDGE_DIR).replace(os.sep, "/")
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        files[name] = {
+            "sha256": local_index.file_sha256(path),
+            "size": os.path.getsize(path),
+            "chunks": [hashlib.sha256(c.encode("utf-8")).hexdigest() for c in local_index.chunk_text(text)],
+        }
+    return {
+        "knowledge_base_id": KNOWLEDGE_BASE_ID,
+        "data_source_ids": sorted(data_source_ids),
+        "files": files,
+    }
+
+def manifest_target_changed(old, new):
+    """True if the old manifest describes other (or unrecorded) knowledge base or data sources"""
+    return (old.get("knowledge_base_id") != new["knowledge_base_id"]
+            or old.get("data_source_ids") != new["data_source_ids"])
+
+def load_manifest():
+    """Load the manifest from the last successful sync (empty if there is none)"""
+    try:
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"files": {}}
+
+def save_manifest(manifest):
+    tmp_path = f"{MANIFEST_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, MANIFEST_FILE)
+
+def diff_manifests(old, new):
+    """Return (added, changed, deleted, chunks_changed) between two manifests"""
+    old_files, new_files = old.get("files", {}), new.get("files", {})
+    added = sorted(set(new_files) - set(old_files))
+    deleted = sorted(set(old_files) - set(new_files))
+    changed = sorted(name for name in set(new_files) & set(old_files)
+                     if new_files[name]["sha256"] != old_files[name]["sha256"])
+
+    chunks_changed = sum(len(new_files[name]["chunks"]) for name in added)
+    for name in changed:
+        chunks_changed += len(set(new_files[name]["chunks"]) - set(old_files[name]["chunks"]))
+    return added, changed, deleted, chunks_changed
+
+def record_run(summary):
+    """Append a one-line JSON summary of this run to the sync log"""
+    try:
+        with open(SYNC_LOG_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(summary) + "\n")
+    except OSError as e:
+        print(f"⚠ Could not write sync log: {e}")
+
+# ---------- S3 Upload ----------
+def get_s3_location(knowledge_base_id, data_source_id):
+    """Return (bucket, prefix) of an S3 data source, or None for other data source types"""
+    try:
+        response = agent_client.get_data_source(
+            knowledgeBaseId=knowledge_base_id,
+            dataSourceId=data_source_id
+        )
+        config = response.get('dataSource', {}).get('dataSourceConfiguration', {})
+        s3_config = config.get('s3Configuration')
+        if not s3_config:
+            return None
+        bucket = s3_config['bucketArn'].split(':::')[-1]
+        prefixes = s3_config.get('inclusionPrefixes') or [""]
+        return bucket, prefixes[0]
+    except Exception as e:
+        print(f"   Error reading data source configuration: {e}")
+        return None
+
+def upload_changes(bucket, prefix, upload, delete):
+    """Upload added/changed files and delete removed ones; returns True if all succeeded"""
+    ok = True
+    for name in upload:
+        key = f"{prefix}{name}"
+        try:
+            s3_client.upload_file(os.path.join(local_index.KNOWLEDGE_DIR, name), bucket, key)
+            print(f"   ⬆ s3://{bucket}/{key}")
+        except Exception as e:
+            print(f"   ❌ Upload failed for {name}: {e}")
+            ok = False
+    for name in delete:
+        key = f"{prefix}{name}"
+        try:
+            s3_client.delete_object(Bucket=bucket, Key=key)
+            print(f"   🗑 s3://{bucket}/{key}")
+        except Exception as e:
+            print(f"   ❌ Delete failed for {name}: {e}")
+            ok = False
+    return ok
+
+def invalidate_server_caches():
+    """Bump the knowledge base version stamp so the server drops cached retrievals"""
+    try:
+        version = kb_version.bump_version()
+        print(f"   Cache invalidated (knowledge base version {version})")
+    except OSError as e:
+        print(f"   ⚠ Could not update knowledge base version stamp: {e}")
+
 def start_sync_job(knowledge_base_id, data_source_id):
     """Start a sync job for a data source"""
     try:
@@ -28,6 +166,7 @@ def start_sync_job(knowledge_base_id, data_source_id):
             knowledgeBaseId=knowledge_base_id,
             dataSourceId=data_source_id
         )
+        invalidate_server_caches()
         return response.get('ingestionJob', {})
     except Exception as e:
         # Try alternative method name
@@ -36,6 +175,7 @@ def start_sync_job(knowledge_base_id, data_source_id):
                 knowledgeBaseId=knowledge_base_id,
                 dataSourceId=data_source_id
             )
+            invalidate_server_caches()
             return response
         except Exception as e2:
             print(f"Error starting sync job: {e}")
@@ -75,6 +215,25 @@ def check_sync_status(knowledge_base_id, data_source_id, job_id=None):
         print(f"Error checking sync status: {e}")
         return None
 
+def wait_for_sync_jobs(jobs):
+    """
+    Polls the started ingestion jobs ([(data_source_id, job_id)]) until every one
+    has finished. Returns the final status of each job, or None on timeout.
+    """
+    deadline = time.monotonic() + SYNC_WAIT_SECONDS
+    statuses = {}
+    while True:
+        for data_source_id, job_id in jobs:
+            if statuses.get(job_id) in FINISHED_JOB_STATUSES:
+                continue
+            job = check_sync_status(KNOWLEDGE_BASE_ID, data_source_id, job_id)
+            statuses[job_id] = (job or {}).get('status', 'UNKNOWN')
+        if all(status in FINISHED_JOB_STATUSES for status in statuses.values()):
+            return statuses
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(SYNC_POLL_SECONDS)
+
 def test_retrieval():
     """Test if retrieval is working"""
     try:
@@ -89,27 +248,89 @@ def test_retrieval():
         return False
 
 def main():
+    force = "--force" in sys.argv
+    wait = "--no-wait" not in sys.argv
+    run_started = time.time()
+
     print("="*60)
     print("Knowledge Base Sync Helper")
     print("="*60)
     print(f"Knowledge Base ID: {KNOWLEDGE_BASE_ID}")
     print(f"Region: {REGION}\n")
-    
-    # List data sources
+
     print("Checking data sources...")
     data_sources = list_data_sources()
-    
+
+    # Work out what changed since the last successful sync
+    old_manifest = load_manifest()
+    new_manifest = build_manifest(ds.get('dataSourceId', '') for ds in data_sources)
+    if old_manifest.get("files") and manifest_target_changed(old_manifest, new_manifest):
+        # The hashes describe another knowledge base: upload everything, and delete nothing from this one
+        old_sources = ", ".join(old_manifest.get("data_source_ids") or []) or "unknown"
+        print(f"Manifest was written for knowledge base {old_manifest.get('knowledge_base_id') or 'unknown'} "
+              f"(data sources {old_sources}) - running a full sync.")
+        old_manifest = {"files": {}}
+        force = True
+    added, changed, deleted, chunks_changed = diff_manifests(old_manifest, new_manifest)
+    summary = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(run_started)),
+        "knowledge_base_id": KNOWLEDGE_BASE_ID,
+        "added": added,
+        "changed": changed,
+        "deleted": deleted,
+        "chunks_changed": chunks_changed,
+        "forced": force,
+        "ingestion_jobs": [],
+    }
+
+    print("Checking local changes...")
+    print(f"   Added: {len(added)}  Changed: {len(changed)}  Deleted: {len(deleted)}  (chunks changed: {chunks_changed})")
+    for name in added:
+        print(f"   + {name}")
+    for name in changed:
+        print(f"   ~ {name}")
+    for name in deleted:
+        print(f"   - {name}")
+
+    if not (added or changed or deleted) and not force:
+        print("\n✓ Nothing changed since the last sync - skipping upload and ingestion.")
+        print("  (Run with --force to re-ingest anyway.)")
+        summary["status"] = "skipped"
+        summary["duration_seconds"] = round(time.time() - run_started, 3)
+        record_run(summary)
+        return
+
+    # With --force every file is uploaded again
+    upload = sorted(new_manifest["files"]) if force else added + changed
+
     if not data_sources:
         print("❌ No data sources found!")
         print("\nPlease ensure:")
         print("  1. You have created a data source in your knowledge base")
         print("  2. Files have been uploaded to the data source location (S3, etc.)")
+        summary["status"] = "no_data_sources"
+        summary["duration_seconds"] = round(time.time() - run_started, 3)
+        record_run(summary)
         return
     
+    all_ok = True
+    started_jobs = []
     for ds in data_sources:
         print(f"\n📁 Data Source: {ds.get('name', 'N/A')}")
         print(f"   ID: {ds.get('dataSourceId', 'N/A')}")
         print(f"   Status: {ds.get('status', 'N/A')}")
+
+        # Push only the files that changed; the ingestion job then re-indexes just those documents
+        location = get_s3_location(KNOWLEDGE_BASE_ID, ds.get('dataSourceId'))
+        if location:
+            bucket, prefix = location
+            print(f"\n   Uploading changes to s3://{bucket}/{prefix}")
+            if not upload_changes(bucket, prefix, upload, deleted):
+                all_ok = False
+                print("   ⚠ Some uploads failed - not starting an ingestion job for this data source.")
+                continue
+        else:
+            print("\n   ⚠ Not an S3 data source - files must be updated at the source manually.")
         
         # Try to start a sync job
         print(f"\n   Attempting to start sync job...")
@@ -119,13 +340,37 @@ def main():
             print(f"   ✓ Sync job started!")
             print(f"   Job ID: {job.get('ingestionJobId', 'N/A')}")
             print(f"   Status: {job.get('status', 'N/A')}")
+            summary["ingestion_jobs"].append(job.get('ingestionJobId', 'N/A'))
+            if job.get('ingestionJobId'):
+                started_jobs.append((ds.get('dataSourceId'), job['ingestionJobId']))
         else:
+            all_ok = False
             print(f"   ⚠ Could not start sync job automatically.")
             print(f"   Please sync the data source manually in the AWS Console:")
             print(f"   - Go to Amazon Bedrock > Knowledge bases")
             print(f"   - Select your knowledge base")
             print(f"   - Go to Data sources tab")
             print(f"   - Click 'Sync' for the data source")
+
+    # Retrievals cached while the jobs were indexing may mix old and new documents; drop them once indexing is done
+    if started_jobs and wait:
+        print(f"\nWaiting for {len(started_jobs)} ingestion job(s) to finish (up to {SYNC_WAIT_SECONDS:.0f}s)...")
+        statuses = wait_for_sync_jobs(started_jobs)
+        if statuses is None:
+            print("   ⚠ Ingestion still running - cached retrievals may be stale until their TTL expires.")
+        else:
+            print(f"   Ingestion finished: {', '.join(sorted(set(statuses.values())))}")
+            invalidate_server_caches()
+        summary["ingestion_statuses"] = statuses
+
+    # Only remember the new hashes once everything reached the data sources,
+    # so a failed run is retried in full next time
+    if all_ok:
+        save_manifest(new_manifest)
+    summary["status"] = "synced" if all_ok else "partial"
+    summary["duration_seconds"] = round(time.time() - run_started, 3)
+    record_run(summary)
+    print(f"\nSync run finished in {summary['duration_seconds']:.1f}s ({summary['status']})")
     
     print("\n" + "="*60)
     print("Testing retrieval...")
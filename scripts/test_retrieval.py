@@ -3,12 +3,16 @@ Test script to debug knowledge base retrieval
 """
 import os
 import json
-import boto3
+import sys
+
+# Allow importing shared modules from the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aws_clients import get_client
 
 REGION = os.getenv("AWS_REGION", "us-east-2")
-KNOWLEDGE_BASE_ID = "YN0B2UVKBS"
+KNOWLEDGE_BASE_ID = os.getenv("KNOWLEDGE_BASE_ID", "YN0B2UVKBS")  # Set via environment variable, as in app.py
 
-kb_client = boto3.client("bedrock-agent-runtime", region_name=REGION)
+kb_client = get_client("bedrock-agent-runtime", region=REGION)
 
 def test_retrieval(query: str):
     """Test the retrieval and print the full response structure"""
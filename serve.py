@@ -0,0 +1,252 @@
+"""
+Production server: several pre-forked uvicorn workers sharing one listening socket.
+
+`python app.py` runs a single process, which uses one core for all request
+handling. This launcher instead:
+
+1. imports app.py once in the parent, loading everything read-only up front
+   (local vector index, BM25 index, prompt templates, configuration),
+2. binds the listening socket in the parent,
+3. freezes the garbage collector's view of those objects and forks N workers.
+
+Workers share the loaded pages copy-on-write (the vector matrix is a memory
+map, so it is shared through the page cache as well). Each worker runs its
+own event loop, retrieval thread pool and agents, and accepts connections
+from the shared socket.
+
+On SIGTERM/SIGINT the parent asks every worker to stop: a worker first reports
+not-ready on /ready for SHUTDOWN_DRAIN_SECONDS, then stops accepting
+connections and finishes in-flight requests for up to GRACEFUL_TIMEOUT seconds.
+Workers that die unexpectedly are restarted.
+
+Metrics are per worker: every sample carries a worker="N" label, and with
+METRICS_BASE_PORT set, worker N also serves its /metrics on port
+METRICS_BASE_PORT + N, so Prometheus can scrape each worker directly instead
+of whichever one the shared socket hands the scrape to.
+
+Usage:
+    python serve.py [--workers N] [--host HOST] [--port PORT]
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import uvicorn
+
+# ---------- Config ----------
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "0"))  # 0 = one per CPU core
+# Connections+tasks a worker accepts at once; beyond this it answers 503. A backstop: admission control
+# in app.py (ADMISSION_MAX_IN_FLIGHT / ADMISSION_MAX_QUEUE) sheds /invocations load well before this
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "256"))
+SERVER_BACKLOG = int(os.getenv("SERVER_BACKLOG", "2048"))
+GRACEFUL_TIMEOUT = float(os.getenv("GRACEFUL_TIMEOUT", "30"))  # seconds to finish in-flight requests
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "0"))  # not-ready period before stopping
+METRICS_BASE_PORT = int(os.getenv("METRICS_BASE_PORT", "0"))  # worker N serves /metrics on this + N (0 = off)
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    """Creates the listening socket shared by all workers."""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class WorkerServer(uvicorn.Server):
+    """uvicorn server that reports not-ready for a drain period before shutting down."""
+
+    def __init__(self, config, app_module, drain_seconds: float):
+        super().__init__(config)
+        self.app_module = app_module
+        self.drain_seconds = drain_seconds
+        self._draining = False
+
+    def handle_exit(self, sig, frame):
+        if self._draining or self.drain_seconds <= 0:
+            self.app_module.set_ready(False, "shutting down")
+            super().handle_exit(sig, frame)
+            return
+        self._draining = True
+        self.app_module.set_ready(False, "draining")
+        timer = threading.Timer(self.drain_seconds, super().handle_exit, (sig, frame))
+        timer.daemon = True
+        timer.start()
+
+
+def serve_worker_metrics(registry, host: str, port: int):
+    """Serves this worker's /metrics on a port of its own, from a daemon thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="worker-metrics", daemon=True).start()
+    return server
+
+
+def run_worker(app_module, sock: socket.socket, worker_id: int, concurrency: int, host: str = SERVER_HOST):
+    """Serves requests from the shared socket until told to stop. Runs in a forked child."""
+    # Label this worker's series; a restarted worker keeps its ID, so Prometheus sees an ordinary counter reset
+    app_module.registry.set_const_labels(worker=str(worker_id))
+    if METRICS_BASE_PORT:
+        serve_worker_metrics(app_module.registry, host, METRICS_BASE_PORT + worker_id)
+    config = uvicorn.Config(
+        app_module.app,
+        limit_concurrency=concurrency,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        access_log=False,
+        log_level="warning",
+    )
+    server = WorkerServer(config, app_module, SHUTDOWN_DRAIN_SECONDS)
+    metrics_port = f", metrics on port {METRICS_BASE_PORT + worker_id}" if METRICS_BASE_PORT else ""
+    print(f"Worker {worker_id} started (pid {os.getpid()}{metrics_port})")
+    server.run(sockets=[sock])
+
+
+class Supervisor:
+    """Forks the workers, restarts the ones that die, and stops them all on shutdown."""
+
+    def __init__(self, app_module, sock: socket.socket, workers: int, concurrency: int, host: str = SERVER_HOST):
+        self.app_module = app_module
+        self.sock = sock
+        self.host = host
+        self.workers = workers
+        self.concurrency = concurrency
+        self.children = {}  # pid -> (worker_id, started_at)
+        self.stopping = False
+
+    def spawn(self, worker_id: int):
+        pid = os.fork()
+        if pid == 0:
+            # Child: restore default signal handling (uvicorn installs its own) and never return
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                run_worker(self.app_module, self.sock, worker_id, self.concurrency, self.host)
+            except BaseException as e:
+                print(f"Worker {worker_id} crashed: {e}")
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        self.children[pid] = (worker_id, time.monotonic())
+
+    def stop(self, signum=None, frame=None):
+        if self.stopping:
+            return
+        self.stopping = True
+        print(f"Shutting down {len(self.children)} workers...")
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _reap(self) -> list:
+        """Collects exited workers; returns their worker IDs and how long they ran."""
+        exited = []
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                break
+            if pid == 0:
+                break
+            worker_id, started_at = self.children.pop(pid, (None, 0.0))
+            if worker_id is not None:
+                exited.append((worker_id, time.monotonic() - started_at, os.waitstatus_to_exitcode(status)))
+        return exited
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for worker_id in range(self.workers):
+            self.spawn(worker_id)
+
+        while not self.stopping:
+            for worker_id, uptime, code in self._reap():
+                if self.stopping:
+                    break
+                print(f"Worker {worker_id} exited with code {code} after {uptime:.1f}s; restarting")
+                if uptime < 1.0:
+                    # Avoid a tight crash loop
+                    time.sleep(1.0)
+                self.spawn(worker_id)
+            time.sleep(0.2)
+
+        deadline = time.monotonic() + SHUTDOWN_DRAIN_SECONDS + GRACEFUL_TIMEOUT + 5
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            print(f"Worker pid {pid} did not stop in time; killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self._reap()
+        self.sock.close()
+        print("All workers stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the RAG server with multiple worker processes")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="Worker processes (0 = CPU count)")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY,
+                        help="Maximum concurrent connections per worker")
+    args = parser.parse_args()
+    workers = args.workers or os.cpu_count() or 1
+
+    # Load once, before forking, so workers share everything read-only
+    start = time.perf_counter()
+    import app as app_module
+    # The app defers the agent framework import to warm-up; import it here too so its modules are shared
+    # by all workers and each worker only has to build its agents and clients
+    import strands  # noqa: F401
+    print(f"Application loaded in {time.perf_counter() - start:.2f}s")
+
+    if not hasattr(os, "fork"):
+        print("Warning: fork is not available on this platform; running a single worker")
+        app_module.app.run(host=args.host, port=args.port, limit_concurrency=args.concurrency)
+        return
+
+    sock = bind_socket(args.host, args.port, SERVER_BACKLOG)
+    # Move everything loaded so far out of the collector's reach so workers don't
+    # touch (and copy) those pages during garbage collection
+    gc.collect()
+    gc.freeze()
+    print(f"Serving on http://{args.host}:{args.port} with {workers} workers "
+          f"(up to {args.concurrency} concurrent connections each)")
+    Supervisor(app_module, sock, workers, args.concurrency, args.host).run()
+
+
+if __name__ == "__main__":
+    main()
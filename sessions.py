@@ -0,0 +1,132 @@
+"""
+Per-request agent management.
+
+Strands agents keep their message history, so sharing one agent across all
+requests makes prompts (and memory) grow without bound and mixes different
+users' conversations. The SessionManager hands out agents instead:
+
+- Requests without a session ID get an agent from a pool of reusable
+  agents; its history is cleared before it goes back to the pool.
+- Requests with a session ID get that session's agent, whose history is
+  bounded by a sliding window. Idle sessions are evicted after a timeout and
+  the number of sessions kept in memory is capped (least recently used go first).
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+
+class _Session:
+    __slots__ = ("agent", "lock", "last_used", "active")
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        self.active = 0
+
+
+class SessionManager:
+    """
+    Hands out agents per request or per session.
+
+    Args:
+        agent_factory: Callable(window_size) -> Agent
+        window_size: Maximum number of messages kept in a session's history
+        idle_ttl: Seconds after which an unused session is evicted
+        max_sessions: Maximum number of sessions kept in memory
+        pool_size: Maximum number of idle stateless agents kept for reuse
+    """
+
+    def __init__(self, agent_factory, window_size: int = 10, idle_ttl: float = 900.0,
+                 max_sessions: int = 1000, pool_size: int = 16):
+        self.agent_factory = agent_factory
+        self.window_size = window_size
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.pool_size = pool_size
+        self._sessions = OrderedDict()  # session_id -> _Session, least recently used first
+        self._pool = []
+        self._lock = threading.Lock()
+        self.created_agents = 0
+        self.evicted_sessions = 0
+
+    def _new_agent(self):
+        self.created_agents += 1
+        return self.agent_factory(self.window_size)
+
+    def _evict_locked(self):
+        """Evicts idle and excess sessions. Sessions with a request in flight are never evicted."""
+        now = time.monotonic()
+        for session_id in list(self._sessions):
+            session = self._sessions[session_id]
+            over_capacity = len(self._sessions) > self.max_sessions
+            if session.active == 0 and (over_capacity or now - session.last_used > self.idle_ttl):
+                del self._sessions[session_id]
+                self.evicted_sessions += 1
+            elif not over_capacity:
+                # Remaining sessions were used more recently
+                break
+
+    def prefill(self, count: int) -> int:
+        """Creates up to `count` pooled agents ahead of time (bounded by pool_size); returns how many."""
+        created = 0
+        while created < count:
+            with self._lock:
+                if len(self._pool) >= self.pool_size:
+                    break
+            agent = self._new_agent()
+            with self._lock:
+                self._pool.append(agent)
+            created += 1
+        return created
+
+    @asynccontextmanager
+    async def agent_for(self, session_id=None):
+        """
+        Yields an agent for one request. Stateless requests (no session ID) get a
+        pooled agent with empty history; requests for the same session are serialized.
+        """
+        if not session_id:
+            with self._lock:
+                agent = self._pool.pop() if self._pool else None
+            if agent is None:
+                agent = self._new_agent()
+            try:
+                yield agent
+            finally:
+                agent.messages = []
+                with self._lock:
+                    if len(self._pool) < self.pool_size:
+                        self._pool.append(agent)
+            return
+
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = _Session(self._new_agent())
+                self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            session.active += 1
+            self._evict_locked()
+        try:
+            async with session.lock:
+                yield session.agent
+        finally:
+            with self._lock:
+                session.active -= 1
+                session.last_used = time.monotonic()
+
+    def stats(self) -> dict:
+        """Returns session and pool counters."""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "pooled_agents": len(self._pool),
+                "created_agents": self.created_agents,
+                "evicted_sessions": self.evicted_sessions,
+                "history_window": self.window_size,
+            }
@@ -0,0 +1,88 @@
+"""
+Single-flight scheduler for retrieval calls.
+
+Cache misses are dispatched onto the shared retrieval thread pool (and so
+over the client's pooled connections). Identical queries are deduplicated:
+while a query is in flight, every further caller for the same key waits for
+that call (single-flight) instead of making its own.
+
+Bedrock's Retrieve API takes one query per call, so calls are dispatched as
+soon as they arrive; there is nothing to merge into a batch.
+
+Every caller gets its own concurrent.futures.Future, resolved from the shared
+call. A caller that gives up (e.g. an SSE client disconnecting cancels its
+wrapped future) only cancels its own future; the call and the other waiters
+are unaffected. Futures can be awaited from any event loop with
+asyncio.wrap_future, so one scheduler serves handlers on different loops.
+"""
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Runs retrieval calls on an executor and shares results between identical concurrent calls.
+
+    Args:
+        executor: Executor the calls are dispatched to
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> futures of the callers waiting for that call
+        self.submitted = 0
+        self.deduplicated = 0
+        self.dispatched = 0
+
+    def submit(self, key, fn, *args) -> Future:
+        """
+        Schedules fn(*args) and returns a future for its result. A call with a key
+        that is already in flight waits for that call instead of starting another.
+        """
+        waiter = Future()
+        with self._lock:
+            self.submitted += 1
+            waiters = self._inflight.get(key)
+            if waiters is not None:
+                self.deduplicated += 1
+                waiters.append(waiter)
+                return waiter
+            self._inflight[key] = [waiter]
+            self.dispatched += 1
+        try:
+            self.executor.submit(self._run, key, fn, args)
+        except BaseException as e:
+            self._resolve(key, None, e)
+        return waiter
+
+    def _run(self, key, fn, args):
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            self._resolve(key, None, e)
+            return
+        self._resolve(key, result, None)
+
+    def _resolve(self, key, result, error):
+        # Remove before resolving so later callers start a fresh call (and hit the cache instead)
+        with self._lock:
+            waiters = self._inflight.pop(key, [])
+        for waiter in waiters:
+            # False if this caller already cancelled its future; the others still get the result
+            if not waiter.set_running_or_notify_cancel():
+                continue
+            if error is not None:
+                waiter.set_exception(error)
+            else:
+                waiter.set_result(result)
+
+    def stats(self) -> dict:
+        """Returns dispatch and deduplication counters."""
+        with self._lock:
+            return {
+                "submitted": self.submitted,
+                "deduplicated": self.deduplicated,
+                "dispatched": self.dispatched,
+                "in_flight": len(self._inflight),
+            }
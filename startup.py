@@ -0,0 +1,101 @@
+"""
+Startup timing and background warm-up.
+
+Importing the app should be quick so the process can answer /health right
+away. Heavy, non-shared work (importing the agent framework, constructing
+AWS clients, opening the first connection) is done by a WarmUp that runs in a
+background thread once the server starts; /ready stays red until it is done.
+Anything not warmed up is still built on first use.
+
+StartupTimer records how long each import/startup phase took so cold starts
+can be broken down.
+"""
+import threading
+import time
+import traceback
+
+
+class StartupTimer:
+    """Records consecutive startup phases (seconds since the previous mark)."""
+
+    def __init__(self, start: float = None):
+        self.start = start if start is not None else time.perf_counter()
+        self._last = self.start
+        self.phases = {}
+
+    def mark(self, phase: str) -> float:
+        """Ends the current phase under the given name; returns its duration."""
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+        return self.phases[phase]
+
+    def elapsed(self) -> float:
+        """Seconds since the timer started."""
+        return time.perf_counter() - self.start
+
+    def report(self) -> dict:
+        return {"phases": dict(self.phases), "total_seconds": self._last - self.start}
+
+
+class WarmUp:
+    """
+    Runs named warm-up steps once, in order, in a daemon thread. A failing step
+    is logged and recorded but does not stop the others.
+
+    Args:
+        steps: List of (name, callable) pairs
+        on_done: Called with no arguments after the last step
+    """
+
+    def __init__(self, steps: list, on_done=None):
+        self.steps = steps
+        self.on_done = on_done
+        self.timings = {}
+        self.errors = {}
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Starts the warm-up thread (only the first call of start() or run() has an effect)."""
+        with self._lock:
+            if self.started_at is not None:
+                return
+            self.started_at = time.perf_counter()
+            self._thread = threading.Thread(target=self._run, name="warm-up", daemon=True)
+            self._thread.start()
+
+    def run(self):
+        """Runs the warm-up in the calling thread (unless it has already been started)."""
+        with self._lock:
+            if self.started_at is not None:
+                return
+            self.started_at = time.perf_counter()
+        self._run()
+
+    def _run(self):
+        for name, step in self.steps:
+            start = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                self.errors[name] = str(e)
+                print(f"Warning: warm-up step '{name}' failed: {e}")
+                traceback.print_exc()
+            self.timings[name] = time.perf_counter() - start
+        self.finished_at = time.perf_counter()
+        self.done.set()
+        if self.on_done is not None:
+            self.on_done()
+
+    def stats(self) -> dict:
+        return {
+            "started": self.started_at is not None,
+            "done": self.done.is_set(),
+            "steps": dict(self.timings),
+            "errors": dict(self.errors),
+            "seconds": (self.finished_at - self.started_at) if self.finished_at else None,
+        }
@@ -0,0 +1,277 @@
+"""
+Multi-tenant knowledge base routing.
+
+Serving each knowledge base from its own deployment leaves every deployment
+with its own idle capacity. With the TenantRegistry, one process serves
+several knowledge bases instead. A request names a tenant (or its knowledge
+base ID) and is answered with that tenant's retrieval backends, retrieval
+cache and, if one is configured, its local index.
+
+- Tenants are configured up front (name -> knowledge base ID plus options).
+  Their resources are built by a factory on first use. AWS clients are not
+  per tenant: the knowledge base ID is a parameter of each Retrieve call, so
+  every tenant's Bedrock backend shares the process's pooled client.
+- At most max_active tenants stay loaded. Tenants idle for idle_ttl are
+  unloaded, and the least recently used go first when over capacity.
+  Tenants with requests in flight, and pinned ones (the default tenant), are
+  never unloaded. An unloaded tenant is rebuilt on its next request.
+- Each tenant has a concurrency quota, so one busy tenant cannot take every
+  slot of a worker. Requests over the quota are rejected rather than queued:
+  a queued request would hold a worker slot while it waits.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+_PATH_OPTIONS = ("knowledge_dir", "index_dir")
+
+
+def load_configs(text: str = "", path: str = "") -> dict:
+    """
+    Parses tenant configuration: a JSON object mapping tenant names to
+    {"knowledge_base_id", optional "max_concurrency", "retrieval_backend",
+    "knowledge_dir", "index_dir"}, from `text` or the JSON file at `path`.
+    Relative directories are resolved against the project root.
+    """
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+    if not text.strip():
+        return {}
+    configs = json.loads(text)
+    if not isinstance(configs, dict):
+        raise ValueError("Tenant configuration must be a JSON object of tenant name -> settings")
+    for name, config in configs.items():
+        if not isinstance(config, dict) or not config.get("knowledge_base_id"):
+            raise ValueError(f"Tenant {name!r} needs a knowledge_base_id")
+        for option in _PATH_OPTIONS:
+            if config.get(option):
+                config[option] = os.path.join(PROJECT_ROOT, config[option])
+    return configs
+
+
+class Tenant:
+    """
+    A loaded tenant and its resources.
+
+    Args:
+        name: Tenant name used in requests and metric labels
+        knowledge_base_id: Bedrock Knowledge Base the tenant answers from
+        backends: Retrieval backends by name ("bedrock", optionally "local")
+        default_backend: Backend used when a request does not choose one
+        retrieval_cache: The tenant's RetrievalCache (or None when caching is disabled)
+        max_concurrency: Requests handled for this tenant at once (0 = no quota)
+        pinned: Never unloaded (the default tenant)
+    """
+
+    def __init__(self, name: str, knowledge_base_id: str, backends: dict, default_backend: str = "bedrock",
+                 retrieval_cache=None, max_concurrency: int = 0, pinned: bool = False):
+        self.name = name
+        self.knowledge_base_id = knowledge_base_id
+        self.backends = backends
+        self.default_backend = default_backend
+        self.retrieval_cache = retrieval_cache
+        self.max_concurrency = max(int(max_concurrency), 0)
+        self.pinned = pinned
+        self.active = 0
+        self.peak_active = 0
+        self.requests = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+        self.loaded_at = time.time()
+        self.load_seconds = 0.0
+        self.last_used = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "knowledge_base_id": self.knowledge_base_id,
+            "backends": sorted(self.backends),
+            "default_backend": self.default_backend,
+            "pinned": self.pinned,
+            "active": self.active,
+            "peak_active": self.peak_active,
+            "max_concurrency": self.max_concurrency,
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "avg_request_seconds": self.busy_seconds / self.requests if self.requests else None,
+            "idle_seconds": time.monotonic() - self.last_used,
+            "load_seconds": self.load_seconds,
+            "retrieval_cache": self.retrieval_cache.stats() if self.retrieval_cache is not None else None,
+        }
+
+
+class TenantRegistry:
+    """
+    Resolves requests to tenants and keeps the loaded ones under an LRU bound.
+    Thread-safe: the entrypoint and the plain routes run on different event loops.
+
+    Args:
+        configs: Tenant name -> settings (see load_configs)
+        factory: Callable(name, config) -> Tenant; may block (e.g. to load a local index)
+        default: The pinned default Tenant, used when a request names none
+        max_active: Tenants kept loaded, the default included
+        idle_ttl: Seconds after which an idle tenant is unloaded
+    """
+
+    def __init__(self, configs: dict, factory, default: Tenant, max_active: int = 16, idle_ttl: float = 900.0):
+        if default.name in configs:
+            raise ValueError(f"Tenant name {default.name!r} is reserved for the default tenant")
+        self.configs = configs
+        self.factory = factory
+        self.default = default
+        self.max_active = max(int(max_active), 1)
+        self.idle_ttl = idle_ttl
+        self._by_kb = {config["knowledge_base_id"]: name for name, config in configs.items()}
+        self._by_kb.setdefault(default.knowledge_base_id, default.name)
+        self._tenants = OrderedDict([(default.name, default)])  # name -> Tenant, least recently used first
+        self._lock = threading.Lock()
+        self._build_locks = {}  # name -> lock held while the tenant is being built
+        self.loads = 0
+        self.evictions = 0
+
+    def resolve(self, name: str = None, knowledge_base_id: str = None) -> str:
+        """Returns the tenant name for a request. Raises KeyError for an unknown tenant or knowledge base."""
+        if name:
+            if name != self.default.name and name not in self.configs:
+                raise KeyError(f"Unknown tenant: {name}")
+            if knowledge_base_id and self._by_kb.get(knowledge_base_id) != name:
+                raise KeyError(f"Knowledge base {knowledge_base_id} does not belong to tenant {name}")
+            return name
+        if knowledge_base_id:
+            if knowledge_base_id not in self._by_kb:
+                raise KeyError(f"Unknown knowledge base: {knowledge_base_id}")
+            return self._by_kb[knowledge_base_id]
+        return self.default.name
+
+    def _loaded_locked(self, name: str, acquire: bool) -> tuple:
+        """(tenant, acquired) if the tenant is loaded, marking it used, else (None, False)."""
+        tenant = self._tenants.get(name)
+        if tenant is None:
+            return None, False
+        self._touch_locked(tenant)
+        return tenant, self._acquire_locked(tenant) if acquire else False
+
+    def _touch_locked(self, tenant: Tenant):
+        """Marks the tenant used, keeping the LRU order in step with last_used (eviction relies on it)."""
+        tenant.last_used = time.monotonic()
+        if self._tenants.get(tenant.name) is tenant:
+            self._tenants.move_to_end(tenant.name)
+
+    def loaded(self, name: str):
+        """Returns the tenant if its resources are loaded (marking it used), else None."""
+        with self._lock:
+            return self._loaded_locked(name, False)[0]
+
+    def acquire_loaded(self, name: str) -> tuple:
+        """
+        If the tenant is loaded, takes a slot of its quota under the same lock
+        and returns (tenant, acquired); else (None, False). Never blocks.
+        """
+        with self._lock:
+            tenant, acquired = self._loaded_locked(name, True)
+            # Requests for loaded tenants are the common case, so idle ones are unloaded here too
+            self._evict_locked()
+            return tenant, acquired
+
+    def get(self, name: str) -> Tenant:
+        """Returns the tenant, building its resources first if it is not loaded. May block."""
+        return self._get(name, False)[0]
+
+    def get_and_acquire(self, name: str) -> tuple:
+        """
+        Returns (tenant, acquired) like get() followed by acquire(), but the slot
+        is taken under the lock that returns the tenant, so it cannot be evicted
+        in between. May block.
+        """
+        return self._get(name, True)
+
+    def _get(self, name: str, acquire: bool) -> tuple:
+        with self._lock:
+            tenant, acquired = self._loaded_locked(name, acquire)
+            if tenant is not None:
+                return tenant, acquired
+            build_lock = self._build_locks.setdefault(name, threading.Lock())
+        with build_lock:
+            # Another thread may have built it while we waited
+            with self._lock:
+                tenant, acquired = self._loaded_locked(name, acquire)
+            if tenant is not None:
+                return tenant, acquired
+            start = time.perf_counter()
+            tenant = self.factory(name, self.configs[name])
+            tenant.load_seconds = time.perf_counter() - start
+            with self._lock:
+                self._tenants[name] = tenant
+                self.loads += 1
+                # Before evicting, so a tenant loaded for a request is never unloaded straight away
+                acquired = self._acquire_locked(tenant) if acquire else False
+                self._evict_locked()
+                self._build_locks.pop(name, None)
+        print(f"Loaded tenant {name} (knowledge base {tenant.knowledge_base_id}) in {tenant.load_seconds:.2f}s")
+        return tenant, acquired
+
+    def _evict_locked(self):
+        """Unloads idle and excess tenants. Pinned tenants and tenants with requests in flight stay."""
+        now = time.monotonic()
+        for name in list(self._tenants):
+            tenant = self._tenants[name]
+            over_capacity = len(self._tenants) > self.max_active
+            if not tenant.pinned and tenant.active == 0 and (over_capacity or now - tenant.last_used > self.idle_ttl):
+                del self._tenants[name]
+                self.evictions += 1
+            elif not over_capacity and not tenant.pinned:
+                # Remaining tenants were used more recently
+                break
+
+    def acquire(self, tenant: Tenant) -> bool:
+        """
+        Takes a slot of the tenant's quota. Returns False if the quota is used up.
+        The tenant may have been unloaded since it was returned; prefer get_and_acquire().
+        """
+        with self._lock:
+            acquired = self._acquire_locked(tenant)
+            self._evict_locked()
+            return acquired
+
+    def _acquire_locked(self, tenant: Tenant) -> bool:
+        if tenant.max_concurrency and tenant.active >= tenant.max_concurrency:
+            tenant.rejected += 1
+            return False
+        tenant.active += 1
+        tenant.peak_active = max(tenant.peak_active, tenant.active)
+        self._touch_locked(tenant)
+        return True
+
+    def release(self, tenant: Tenant, seconds: float = None):
+        """
+        Gives back a slot taken with acquire() once the request has finished.
+        With seconds=None the request was turned away and is not counted.
+        """
+        with self._lock:
+            tenant.active = max(tenant.active - 1, 0)
+            if seconds is not None:
+                tenant.requests += 1
+                tenant.busy_seconds += seconds
+            self._touch_locked(tenant)
+            self._evict_locked()
+
+    def loaded_tenants(self) -> list:
+        with self._lock:
+            return list(self._tenants.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            tenants = {name: tenant.stats() for name, tenant in self._tenants.items()}
+        return {
+            "default_tenant": self.default.name,
+            "configured": sorted([self.default.name, *self.configs]),
+            "loaded": len(tenants),
+            "max_active": self.max_active,
+            "idle_ttl": self.idle_ttl,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "tenants": tenants,
+        }
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Tests import the top-level modules and scripts directly, as the app and scripts do
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "scripts"))
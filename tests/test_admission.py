@@ -0,0 +1,77 @@
+import asyncio
+
+from admission import ADMITTED, REJECTED, SHED, TIMED_OUT, AdmissionController, AdmissionMiddleware
+
+
+def test_admits_up_to_the_limit_then_rejects_without_a_queue():
+    async def main():
+        controller = AdmissionController(max_in_flight=2, max_queue=0, queue_timeout=1)
+        outcomes = [await controller.acquire() for _ in range(3)]
+        return controller, outcomes
+
+    controller, outcomes = asyncio.run(main())
+    assert outcomes == [ADMITTED, ADMITTED, REJECTED]
+    assert controller.rejections[REJECTED] == 1
+
+
+def test_release_hands_the_slot_to_the_oldest_waiter():
+    async def main():
+        controller = AdmissionController(max_in_flight=1, max_queue=2, queue_timeout=5)
+        await controller.acquire()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        controller.release(0.1)
+        return controller, await waiter
+
+    controller, outcome = asyncio.run(main())
+    assert outcome == ADMITTED and controller.in_flight == 1
+
+
+def test_full_queue_sheds_the_oldest_and_waiters_time_out():
+    async def main():
+        controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=0.05)
+        await controller.acquire()
+        oldest = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        newest = asyncio.ensure_future(controller.acquire())
+        return await oldest, await newest
+
+    assert asyncio.run(main()) == (SHED, TIMED_OUT)
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def main():
+        controller = AdmissionController(max_in_flight=1, max_queue=2, queue_timeout=5)
+        await controller.acquire()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        return controller
+
+    controller = asyncio.run(main())
+    assert controller.stats()["queue_depth"] == 0 and controller.in_flight == 1
+
+
+def test_per_client_rate_limit():
+    controller = AdmissionController(max_in_flight=10, max_queue=0, queue_timeout=1, client_rate=1, client_burst=2)
+    assert controller.check_rate("a") == 0 and controller.check_rate("a") == 0
+    assert controller.check_rate("a") > 0
+    assert controller.check_rate("b") == 0
+
+
+def test_middleware_rate_limits_only_the_rate_limited_paths():
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse
+    from starlette.routing import Route
+    from starlette.testclient import TestClient
+
+    async def ok(request):
+        return PlainTextResponse("ok")
+
+    inner = Starlette(routes=[Route("/invocations", ok, methods=["POST"]), Route("/prefetch", ok, methods=["POST"])])
+    controller = AdmissionController(max_in_flight=10, max_queue=0, queue_timeout=1, client_rate=0.001, client_burst=1)
+    client = TestClient(AdmissionMiddleware(inner, controller, paths=("/invocations", "/prefetch"),
+                                            rate_limited_paths=("/invocations",)))
+    assert [client.post("/prefetch").status_code for _ in range(3)] == [200, 200, 200]
+    assert [client.post("/invocations").status_code for _ in range(2)] == [200, 429]
@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+from answer_cache import AnswerCache
+
+
+def test_disk_tier_survives_a_new_cache_and_promotes_to_memory(tmp_path):
+    db_path = str(tmp_path / "answers.sqlite3")
+    AnswerCache(db_path=db_path).put("k", "answer")
+
+    cache = AnswerCache(db_path=db_path)
+    assert cache.get_memory("k") is None
+    assert cache.get_disk("k") == "answer"
+    assert cache.get_memory("k") == "answer"
+    assert cache.get("missing") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 1)
+    assert cache.disk_size() == 1
+
+
+def test_connection_is_opened_lazily(tmp_path):
+    cache = AnswerCache(db_path=str(tmp_path / "answers.sqlite3"))
+    assert cache.disk_enabled and cache._db is None
+    assert not (tmp_path / "answers.sqlite3").exists()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_child_opens_its_own_connection(tmp_path):
+    cache = AnswerCache(db_path=str(tmp_path / "answers.sqlite3"))
+    cache.put_disk("parent", "1")
+    parent_db = cache._db
+    pid = os.fork()
+    if pid == 0:
+        ok = cache.get_disk("parent") == "1" and cache._db is not parent_db
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert cache._db is parent_db
+
+
+def test_version_change_clears_both_tiers(tmp_path):
+    version = ["v1"]
+    cache = AnswerCache(db_path=str(tmp_path / "answers.sqlite3"), version_fn=lambda: version[0])
+    cache.put(cache.key("question", []), "old")
+    version[0] = "v2"
+    key = cache.key("question", [])
+    assert cache.get(key) is None
+    assert cache.disk_size() == 0
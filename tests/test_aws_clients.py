@@ -0,0 +1,62 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import aws_clients
+
+
+class ThrottleOnceHandler(BaseHTTPRequestHandler):
+    """Answers Retrieve calls: throttles the first attempt, then returns no results."""
+    attempts = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        type(self).attempts += 1
+        if type(self).attempts == 1:
+            status, body = 429, {"message": "Rate exceeded"}
+            headers = {"x-amzn-ErrorType": "ThrottlingException"}
+        else:
+            status, body, headers = 200, {"retrievalResults": []}, {}
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    ThrottleOnceHandler.attempts = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ThrottleOnceHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_throttled_attempt_is_retried_and_counted(endpoint):
+    # A pool size of its own, to find this client's counters
+    client = aws_clients.get_client("bedrock-agent-runtime", endpoint_url=endpoint, max_pool_connections=7,
+                                    retries={"mode": "standard", "max_attempts": 3})
+    response = client.retrieve(knowledgeBaseId="KB12345678", retrievalQuery={"text": "q"})
+    assert response["retrievalResults"] == []
+    stats = next(s for s in aws_clients.client_stats() if s["max_pool_connections"] == 7)
+    assert (stats["attempts"], stats["throttled"], stats["errors"], stats["in_flight"]) == (2, 1, 0, 0)
+
+
+def test_clients_are_shared_per_configuration_and_built_lazily(endpoint):
+    lazy = aws_clients.lazy_client("bedrock-agent-runtime", endpoint_url=endpoint, max_pool_connections=3)
+    assert not lazy.created
+    client = aws_clients.get_client("bedrock-agent-runtime", endpoint_url=endpoint, max_pool_connections=3)
+    assert lazy.meta is client.meta and lazy.created
+    assert aws_clients.get_client("bedrock-agent-runtime", endpoint_url=endpoint, max_pool_connections=4) is not client
@@ -0,0 +1,89 @@
+import asyncio
+import io
+import json
+from types import SimpleNamespace
+
+from batch_answer import BatchRunner, load_checkpoint, read_prompts
+
+
+def test_read_prompts_accepts_json_and_plain_lines():
+    lines = ['{"id": "a", "prompt": " What is NovaTech? "}', "", '{"question": "Who founded it?"}',
+             "plain text question", '{"id": 7, "prompt": "numbered"}']
+    assert list(read_prompts(io.StringIO("\n".join(lines)))) == [
+        ("a", "What is NovaTech?", None),
+        ("3", "Who founded it?", None),
+        ("4", "plain text question", None),
+        ("7", "numbered", None),
+    ]
+
+
+def test_read_prompts_reports_bad_records_instead_of_raising():
+    lines = ['{"id": "a", "prompt": 5}', '{"id": ["x"], "prompt": "ok"}', '{"prompt": {"text": "q"}}']
+    items = list(read_prompts(io.StringIO("\n".join(lines))))
+    assert [(item_id, error is not None) for item_id, _, error in items] == [("a", True), ("2", True), ("3", True)]
+    assert "prompt must be a string" in items[0][2]
+    assert "id must be a string or number" in items[1][2]
+
+
+def _fake_app():
+    calls = []
+
+    async def answer_prompt(prompt, session_id, backend_name, multi_query, tenant=None):
+        calls.append(prompt)
+        await asyncio.sleep(0.01)
+        return f"answer to {prompt}", []
+
+    tenant = SimpleNamespace(name="default", retrieval_cache=None)
+    app = SimpleNamespace(answer_prompt=answer_prompt, source_references=lambda chunks: [],
+                          normalize_query=lambda text: " ".join(text.lower().split()), default_tenant=tenant)
+    return app, calls
+
+
+def test_runner_writes_errors_and_answers_duplicates_once():
+    app, calls = _fake_app()
+    out = io.StringIO()
+    runner = BatchRunner(app, out, concurrency=4, progress_every=0)
+    source = io.StringIO('{"id": 1, "prompt": "Same question"}\n{"id": 2, "prompt": "same  QUESTION"}\n'
+                         '{"id": 3, "prompt": 5}\n{"id": 4, "prompt": ""}\n')
+    asyncio.run(runner.run(read_prompts(source), set()))
+    records = {r["id"]: r for r in map(json.loads, out.getvalue().splitlines())}
+    assert calls == ["Same question"] and runner.deduplicated == 1
+    assert records["1"]["result"] == records["2"]["result"] == "answer to Same question"
+    assert records["3"] == {"id": "3", "error": "prompt must be a string, got int"}
+    assert records["4"]["error"] == "empty prompt"
+    assert runner.errors == 2
+
+
+def test_repeats_after_the_first_answer_finished_are_not_answered_again():
+    app, calls = _fake_app()
+    out = io.StringIO()
+    runner = BatchRunner(app, out, concurrency=1, progress_every=0)
+    source = io.StringIO("Same question\nOther question\nsame question\n")
+    asyncio.run(runner.run(read_prompts(source), set()))
+    assert calls == ["Same question", "Other question"] and runner.deduplicated == 1
+    assert json.loads(out.getvalue().splitlines()[2])["result"] == "answer to Same question"
+
+
+def test_failed_answers_are_retried_by_a_later_repeat():
+    app, calls = _fake_app()
+    answer_prompt = app.answer_prompt
+
+    async def fail_once(prompt, *args, **kwargs):
+        if not calls:
+            calls.append(prompt)
+            raise RuntimeError("throttled")
+        return await answer_prompt(prompt, *args, **kwargs)
+
+    app.answer_prompt = fail_once
+    out = io.StringIO()
+    runner = BatchRunner(app, out, concurrency=1, progress_every=0)
+    asyncio.run(runner.run(read_prompts(io.StringIO("Question\nQuestion\n")), set()))
+    records = list(map(json.loads, out.getvalue().splitlines()))
+    assert records[0]["error"] == "RuntimeError: throttled" and records[1]["result"] == "answer to Question"
+
+
+def test_checkpoint_skips_successes_and_drops_a_partial_last_line(tmp_path):
+    path = tmp_path / "answers.jsonl"
+    path.write_text('{"id": "1", "result": "x"}\n{"id": "2", "error": "boom"}\n{"id": "3", "res')
+    assert load_checkpoint(str(path)) == {"1"}
+    assert path.read_text().endswith('"boom"}\n')
@@ -0,0 +1,37 @@
+from chunks import Chunk
+from context_budget import SEPARATOR, assemble_context, context_length, context_parts, estimate_tokens
+
+
+def test_context_parts_and_length_match_the_joined_text():
+    chunks = [Chunk("alpha"), Chunk("beta"), Chunk("gamma")]
+    joined = "".join(context_parts(chunks))
+    assert joined == SEPARATOR.join(["alpha", "beta", "gamma"])
+    assert context_length(chunks) == len(joined)
+    assert context_parts([]) == [] and context_length([]) == 0
+
+
+def test_low_relevance_is_dropped_and_chunks_without_relevance_kept():
+    # A high ranking score (e.g. from reranking) does not save a chunk with low relevance
+    chunks = [Chunk("one two three four", score=0.9, relevance=0.9),
+              Chunk("five six seven eight", score=0.95, relevance=0.1),
+              Chunk("nine ten eleven twelve", score=0.2)]
+    selected, report = assemble_context(chunks, token_budget=0, min_score=0.5)
+    assert [c.text for c in selected] == ["one two three four", "nine ten eleven twelve"]
+    assert report["dropped_low_score"] == 1
+
+
+def test_contained_duplicates_are_dropped():
+    text = "NovaTech builds analytics software for retail and logistics companies"
+    chunks = [Chunk(text, score=0.9), Chunk(" ".join(text.split()[:6]), score=0.5)]
+    selected, report = assemble_context(chunks, token_budget=0)
+    assert selected == [chunks[0]]
+    assert report["dropped_duplicate"] == 1
+
+
+def test_budget_skips_large_chunks_but_keeps_smaller_ones():
+    big = Chunk("word " * 200, score=0.8)
+    small = Chunk("a short distinct passage", score=0.5)
+    selected, report = assemble_context([big, small], token_budget=estimate_tokens(small.text))
+    assert selected == [small]
+    assert report["dropped_budget"] == 1
+    assert report["tokens_saved"] == report["tokens_in"] - report["tokens_out"]
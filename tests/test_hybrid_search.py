@@ -0,0 +1,39 @@
+from chunks import Chunk
+from hybrid_search import reciprocal_rank_fusion, rerank, source_name
+
+PASSAGE = ("NovaTech InsightPro is an analytics platform for retail companies. It ships dashboards, "
+           "demand forecasting and inventory alerts, and it integrates with common point of sale systems.")
+
+
+def test_source_name_matches_s3_uris_and_local_paths():
+    assert source_name(Chunk("x", "s3://bucket/docs/Products.md")) == "products.md"
+    assert source_name(Chunk("x", "knowledge/products.md")) == "products.md"
+    assert source_name(Chunk("x")) == ""
+
+
+def test_bedrock_and_bm25_chunks_of_the_same_passage_are_fused():
+    # Bedrock cuts the document differently: same file, mostly the same words, different text
+    bedrock = [Chunk(PASSAGE[:120], "s3://bucket/docs/products.md", 0.71, "kb-1", 0.71),
+               Chunk("Founded in 2015, NovaTech is based in Austin.", "s3://bucket/docs/company.md", 0.65, "kb-2",
+                     0.65)]
+    bm25 = [Chunk(PASSAGE, "knowledge/products.md", 7.5, "knowledge/products.md#0"),
+            Chunk("Support is available around the clock.", "knowledge/support.md", 3.1, "knowledge/support.md#0")]
+    fused = reciprocal_rank_fusion([bedrock, bm25], k=60)
+    assert [c.id for c in fused] == ["kb-1", "kb-2", "knowledge/support.md#0"]
+    assert fused[0].score == 2 / 61
+    # The first occurrence's relevance survives; keyword-only chunks have none
+    assert fused[0].relevance == 0.71 and fused[2].relevance is None
+
+
+def test_overlapping_windows_of_one_retriever_stay_separate():
+    first = Chunk(PASSAGE, "knowledge/products.md", 0.9, "p#0", 0.9)
+    second = Chunk(PASSAGE[40:], "knowledge/products.md", 0.8, "p#1", 0.8)
+    assert len(reciprocal_rank_fusion([[first, second]])) == 2
+
+
+def test_rerank_replaces_the_score_but_keeps_relevance():
+    chunks = [Chunk("Support hours and contact details", "a", 0.03, "a", 0.4),
+              Chunk("InsightPro pricing starts at 99 dollars", "b", 0.02, "b", 0.6)]
+    reranked = rerank("InsightPro pricing", chunks, idf={"insightpro": 2.0, "pricing": 1.5})
+    assert [c.id for c in reranked] == ["b", "a"]
+    assert reranked[0].score != 0.02 and reranked[0].relevance == 0.6
@@ -0,0 +1,40 @@
+from metrics import Registry
+
+
+def test_callback_counters_render_as_counters():
+    registry = Registry()
+    stats = {"hits": 3}
+    registry.counter("cache_lookups_total", "Lookups", labels=("result",), fn=lambda: {("hit",): stats["hits"]})
+    registry.counter("loads_total", "Loads", fn=lambda: 2)
+    text = registry.render()
+    assert "# TYPE cache_lookups_total counter" in text
+    assert 'cache_lookups_total{result="hit"} 3' in text
+    assert "loads_total 2" in text
+
+
+def test_label_values_and_help_are_escaped():
+    registry = Registry()
+    counter = registry.counter("requests_total", "Requests\nby tenant", labels=("tenant",))
+    counter.inc(tenant='a"b\\c\nd')
+    text = registry.render()
+    assert 'requests_total{tenant="a\\"b\\\\c\\nd"} 1' in text
+    assert "# HELP requests_total Requests\\nby tenant" in text
+
+
+def test_failing_callback_renders_no_samples():
+    registry = Registry()
+    registry.gauge("broken", "Broken", fn=lambda: 1 / 0)
+    assert registry.render().splitlines() == ["# HELP broken Broken", "# TYPE broken gauge"]
+
+
+def test_const_labels_are_added_to_every_sample():
+    registry = Registry()
+    registry.counter("requests_total", "Requests", labels=("mode",)).inc(mode="json")
+    registry.gauge("in_flight", "In flight").set(2)
+    registry.histogram("latency_seconds", "Latency", buckets=(1.0,)).observe(0.5)
+    registry.set_const_labels(worker="3")
+    samples = [line for line in registry.render().splitlines() if not line.startswith("#")]
+    assert 'requests_total{mode="json",worker="3"} 1' in samples
+    assert 'in_flight{worker="3"} 2' in samples
+    assert 'latency_seconds_bucket{worker="3",le="1.0"} 1' in samples
+    assert all('worker="3"' in line for line in samples)
@@ -0,0 +1,52 @@
+import pytest
+
+from chunks import Chunk
+from query_expansion import expand_query, merge_results, stands_alone
+
+
+@pytest.mark.parametrize("prompt", [
+    "Is it safe, fast, and cheap?",
+    "What are salt and pepper used for?",
+    "Who founded NovaTech and where is it based?",
+    "1. 2. 3.",
+    "What is NovaTech?",
+    "What is the difference between InsightPro and DataVault?",
+])
+def test_prompts_that_do_not_split_cleanly_stay_whole(prompt):
+    assert expand_query(prompt) == [prompt]
+
+
+def test_shared_tail_is_distributed_over_coordinated_items():
+    assert expand_query("What is the price and warranty of InsightPro?") == [
+        "What is the price and warranty of InsightPro?",
+        "What is the price of InsightPro",
+        "What is the warranty of InsightPro",
+    ]
+
+
+def test_independent_clauses_are_split():
+    prompt = "How often is InsightPro updated, and is customer data secure?"
+    assert expand_query(prompt)[1:] == ["How often is InsightPro updated", "is customer data secure"]
+
+
+def test_max_queries_includes_the_prompt():
+    prompt = "What is the price, warranty, support plan and licence of InsightPro?"
+    queries = expand_query(prompt, max_queries=3)
+    assert len(queries) == 3 and queries[0] == prompt
+
+
+def test_stands_alone():
+    assert stands_alone("What is InsightPro")
+    assert stands_alone("is customer data secure")
+    assert not stands_alone("where is it based")
+    assert not stands_alone("fast")
+    assert not stands_alone("What are salt")
+
+
+def test_merge_results_interleaves_and_keeps_the_best_score():
+    a = [Chunk("alpha", "s3://a", 0.5, "a1"), Chunk("beta", "s3://a", 0.4, "a2")]
+    b = [Chunk("alpha", "s3://a", 0.9, "a1"), Chunk("gamma", "s3://b", 0.3, "b1")]
+    merged = merge_results([a, b], max_chunks=10)
+    assert [c.id for c in merged] == ["a1", "a2", "b1"]
+    assert merged[0].score == 0.9
+    assert len(merge_results([a, b], max_chunks=2)) == 2
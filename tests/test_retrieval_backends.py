@@ -0,0 +1,11 @@
+import embeddings
+from retrieval_backends import HybridBackend, LocalBackend
+
+
+def test_local_backend_blocks_only_with_bedrock_embeddings(monkeypatch):
+    monkeypatch.setattr(embeddings, "EMBEDDING_BACKEND", "local")
+    assert LocalBackend(index=None).blocking is False
+    monkeypatch.setattr(embeddings, "EMBEDDING_BACKEND", "bedrock")
+    local = LocalBackend(index=None)
+    assert local.blocking is True
+    assert HybridBackend(local, lexical=None).blocking is True
@@ -0,0 +1,50 @@
+import threading
+
+from retrieval_cache import RetrievalCache
+
+
+def _embed(text):
+    # Two-dimensional "embedding": questions about pricing point one way, everything else the other
+    return [1.0, 0.0] if "price" in text or "cost" in text else [0.0, 1.0]
+
+
+def test_exact_and_similar_hits_are_counted_separately():
+    cache = RetrievalCache(embed_fn=_embed)
+    cache.put("What is the price?", 5, ["chunk"], scope="bedrock")
+    assert cache.get_exact("what is the price", 5, scope="bedrock") == ["chunk"]
+    assert cache.get_exact("how much does it cost", 5, scope="bedrock") is None
+    assert cache.get_similar("how much does it cost", 5, scope="bedrock") == ["chunk"]
+    assert cache.get("who founded it", 5, scope="bedrock") is None
+    assert cache.get("what is the price", 5, scope="local") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["semantic_hits"], stats["misses"]) == (1, 1, 2)
+
+
+def test_embedding_runs_without_the_lock():
+    cache = RetrievalCache(embed_fn=_embed)
+    cache.put("What is the price?", 5, ["chunk"])
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_embed(text):
+        entered.set()
+        release.wait(5)
+        return _embed(text)
+
+    cache.embed_fn = slow_embed
+    lookup = threading.Thread(target=cache.get_similar, args=("how much does it cost", 5))
+    lookup.start()
+    assert entered.wait(5)
+    # The slow embedding call must not stop other requests from using the cache
+    assert cache.get_exact("what is the price", 5) == ["chunk"]
+    release.set()
+    lookup.join(5)
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_version_change_clears_entries():
+    version = ["1"]
+    cache = RetrievalCache(version_fn=lambda: version[0])
+    cache.put("question", 5, ["chunk"])
+    version[0] = "2"
+    assert cache.get("question", 5) is None
+    assert cache.stats()["invalidations"] == 1
@@ -0,0 +1,66 @@
+import asyncio
+
+from sessions import SessionManager
+
+
+class FakeAgent:
+    def __init__(self, window_size):
+        self.window_size = window_size
+        self.messages = []
+
+
+def test_stateless_agents_are_pooled_with_empty_history():
+    manager = SessionManager(FakeAgent, window_size=4, pool_size=1)
+
+    async def main():
+        async with manager.agent_for() as agent:
+            agent.messages.append("question")
+        async with manager.agent_for() as again:
+            return agent, again
+
+    agent, again = asyncio.run(main())
+    assert again is agent and agent.messages == []
+    assert agent.window_size == 4
+    assert manager.stats()["created_agents"] == 1
+
+
+def test_session_keeps_its_agent_and_history():
+    manager = SessionManager(FakeAgent)
+
+    async def main():
+        async with manager.agent_for("s1") as agent:
+            agent.messages.append("first")
+        async with manager.agent_for("s1") as again:
+            return agent, again
+
+    agent, again = asyncio.run(main())
+    assert again is agent and agent.messages == ["first"]
+
+
+def test_least_recently_used_sessions_are_evicted_over_capacity():
+    manager = SessionManager(FakeAgent, max_sessions=2)
+
+    async def main():
+        for session_id in ("a", "b", "a", "c"):
+            async with manager.agent_for(session_id):
+                pass
+
+    asyncio.run(main())
+    assert list(manager._sessions) == ["a", "c"]
+    assert manager.stats()["evicted_sessions"] == 1
+
+
+def test_idle_sessions_expire_but_active_ones_stay():
+    manager = SessionManager(FakeAgent, idle_ttl=0)
+
+    async def main():
+        async with manager.agent_for("busy"):
+            # "busy" has a request in flight, so a later session does not evict it
+            async with manager.agent_for("other"):
+                pass
+            assert "busy" in manager._sessions
+        async with manager.agent_for("last"):
+            pass
+
+    asyncio.run(main())
+    assert list(manager._sessions) == ["last"]
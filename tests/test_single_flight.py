@@ -0,0 +1,65 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def _blocking_call(release: threading.Event, calls: list):
+    def call(query):
+        calls.append(query)
+        release.wait(5)
+        return [query]
+    return call
+
+
+def test_identical_calls_share_one_dispatch():
+    release, calls = threading.Event(), []
+    single_flight = SingleFlight(ThreadPoolExecutor(2))
+    fn = _blocking_call(release, calls)
+    first = single_flight.submit("q", fn, "q")
+    second = single_flight.submit("q", fn, "q")
+    release.set()
+    assert first.result(5) == ["q"] and second.result(5) == ["q"]
+    assert calls == ["q"]
+    stats = single_flight.stats()
+    assert stats["dispatched"] == 1 and stats["deduplicated"] == 1 and stats["in_flight"] == 0
+
+
+def test_cancelled_waiter_does_not_cancel_the_others():
+    release, calls = threading.Event(), []
+    single_flight = SingleFlight(ThreadPoolExecutor(2))
+    fn = _blocking_call(release, calls)
+
+    async def main():
+        gone = asyncio.ensure_future(asyncio.wrap_future(single_flight.submit("q", fn, "q")))
+        staying = asyncio.ensure_future(asyncio.wrap_future(single_flight.submit("q", fn, "q")))
+        await asyncio.sleep(0.01)
+        gone.cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        return await staying
+
+    assert asyncio.run(main()) == ["q"]
+    assert calls == ["q"]
+
+
+def test_errors_reach_every_waiter_and_the_key_is_freed():
+    single_flight = SingleFlight(ThreadPoolExecutor(1))
+
+    def fail(query):
+        raise RuntimeError("boom")
+
+    future = single_flight.submit("q", fail, "q")
+    with pytest.raises(RuntimeError):
+        future.result(5)
+    assert single_flight.submit("q", lambda query: [query], "q").result(5) == ["q"]
+
+
+def test_calls_are_dispatched_without_waiting_for_a_batch():
+    calls = []
+    single_flight = SingleFlight(ThreadPoolExecutor(1))
+    assert single_flight.submit("a", lambda q: calls.append(q) or q, "a").result(1) == "a"
+    assert single_flight.stats()["dispatched"] == 1
@@ -0,0 +1,45 @@
+import threading
+
+from startup import StartupTimer, WarmUp
+
+
+def test_readiness_flips_only_after_every_step_has_run():
+    release = threading.Event()
+    ready = threading.Event()
+    ran = []
+
+    def fail():
+        ran.append("fail")
+        raise RuntimeError("no credentials")
+
+    warmup = WarmUp([("blocked", lambda: release.wait(5) and ran.append("blocked")), ("fail", fail)],
+                    on_done=ready.set)
+    warmup.start()
+    warmup.start()
+    assert not ready.is_set() and not warmup.stats()["done"]
+
+    release.set()
+    assert ready.wait(5)
+    stats = warmup.stats()
+    # A failing step is recorded but does not keep the worker from becoming ready
+    assert ran == ["blocked", "fail"]
+    assert stats["done"] and stats["errors"] == {"fail": "no credentials"}
+    assert set(stats["steps"]) == {"blocked", "fail"} and stats["seconds"] is not None
+
+
+def test_run_in_the_calling_thread_only_once():
+    calls = []
+    warmup = WarmUp([("step", lambda: calls.append(1))])
+    warmup.run()
+    warmup.run()
+    warmup.start()
+    assert calls == [1] and warmup.done.is_set()
+
+
+def test_startup_timer_phases_add_up():
+    timer = StartupTimer()
+    timer.mark("imports")
+    timer.mark("clients")
+    report = timer.report()
+    assert list(report["phases"]) == ["imports", "clients"]
+    assert abs(sum(report["phases"].values()) - report["total_seconds"]) < 1e-9
@@ -0,0 +1,40 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from starlette.testclient import TestClient
+
+import app as app_module
+from benchmark import install_fakes
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fakes = SimpleNamespace(kb_latency_ms=0, kb_jitter_ms=0, first_token_ms=0, tokens_per_second=0, answer_tokens=3)
+    install_fakes(app_module, fakes)
+    monkeypatch.setattr(app_module, "ANSWER_CACHE_ENABLED", False)
+    # Not entered as a context manager, so the lifespan warm-up does not run
+    return TestClient(app_module.app)
+
+
+def _events(response) -> list:
+    return [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+
+
+def test_stream_sends_sources_first_then_tokens_then_done(client):
+    response = client.post("/invocations", json={"prompt": "What industries does NovaTech serve?", "stream": True})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _events(response)
+    types = [event["type"] for event in events]
+    assert types == ["sources", "token", "token", "token", "done"]
+    assert events[0]["sources"] and all(source["source"] for source in events[0]["sources"])
+    assert events[-1]["result"] == "".join(event["data"] for event in events[1:-1])
+    assert app_module.default_tenant.active == 0
+
+
+def test_stream_done_event_carries_the_session_id(client):
+    response = client.post("/invocations", json={"prompt": "What is NovaTech?", "stream": True, "session_id": "s1"})
+    events = _events(response)
+    assert events[0]["type"] == "sources"
+    assert events[-1]["type"] == "done" and events[-1]["session_id"] == "s1"
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+import sync_knowledge_base as sync
+
+
+def _manifest(files, knowledge_base_id="KB1", data_source_ids=("DS1",)):
+    return {
+        "knowledge_base_id": knowledge_base_id,
+        "data_source_ids": sorted(data_source_ids),
+        "files": {name: {"sha256": digest, "size": 1, "chunks": chunks} for name, (digest, chunks) in files.items()},
+    }
+
+
+def test_diff_manifests_counts_only_new_chunks_of_changed_files():
+    old = _manifest({"kept.md": ("a", ["c1"]), "edited.md": ("b", ["c2", "c3"]), "gone.md": ("c", ["c4"])})
+    new = _manifest({"kept.md": ("a", ["c1"]), "edited.md": ("b2", ["c2", "c5"]), "new.md": ("d", ["c6", "c7"])})
+    assert sync.diff_manifests(old, new) == (["new.md"], ["edited.md"], ["gone.md"], 3)
+
+
+def test_manifest_target_changed():
+    new = _manifest({})
+    assert not sync.manifest_target_changed(_manifest({}), new)
+    assert sync.manifest_target_changed(_manifest({}, knowledge_base_id="KB2"), new)
+    assert sync.manifest_target_changed(_manifest({}, data_source_ids=("DS1", "DS2")), new)
+    # Manifests written before the target was recorded
+    assert sync.manifest_target_changed({"files": {}}, new)
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    """Runs main() against stand-ins for AWS; returns the calls made and the logged run summaries."""
+    calls = {"uploaded": [], "deleted": [], "jobs": []}
+    monkeypatch.setattr(sync, "MANIFEST_FILE", str(tmp_path / "manifest.json"))
+    monkeypatch.setattr(sync, "SYNC_LOG_FILE", str(tmp_path / "runs.jsonl"))
+    monkeypatch.setattr(sync, "KNOWLEDGE_BASE_ID", "KB1")
+    monkeypatch.setattr(sync, "list_data_sources", lambda: [{"dataSourceId": "DS1", "name": "docs"}])
+    monkeypatch.setattr(sync, "get_s3_location", lambda kb, ds: ("bucket", "docs/"))
+
+    def upload_changes(bucket, prefix, upload, delete):
+        calls["uploaded"].extend(upload)
+        calls["deleted"].extend(delete)
+        return True
+
+    def start_sync_job(kb, ds):
+        calls["jobs"].append(ds)
+        return {"ingestionJobId": "job-1", "status": "STARTING"}
+
+    monkeypatch.setattr(sync, "upload_changes", upload_changes)
+    monkeypatch.setattr(sync, "start_sync_job", start_sync_job)
+    monkeypatch.setattr(sync, "test_retrieval", lambda: True)
+    monkeypatch.setattr(sync.sys, "argv", ["sync_knowledge_base.py", "--no-wait"])
+
+    def main(old_manifest, files):
+        if old_manifest is not None:
+            with open(sync.MANIFEST_FILE, "w", encoding="utf-8") as f:
+                json.dump(old_manifest, f)
+        monkeypatch.setattr(sync, "build_manifest", lambda data_source_ids=(): {
+            **_manifest(files), "data_source_ids": sorted(data_source_ids)})
+        sync.main()
+        with open(sync.SYNC_LOG_FILE, "r", encoding="utf-8") as f:
+            return calls, [json.loads(line) for line in f]
+
+    return main
+
+
+def test_unchanged_documents_skip_upload_and_ingestion(run):
+    files = {"a.md": ("h1", ["c1"])}
+    calls, runs = run(_manifest(files), files)
+    assert calls == {"uploaded": [], "deleted": [], "jobs": []}
+    assert runs[-1]["status"] == "skipped"
+
+
+def test_changed_documents_are_uploaded_and_the_manifest_saved(run):
+    calls, runs = run(_manifest({"a.md": ("h1", ["c1"]), "b.md": ("h2", ["c2"])}), {"a.md": ("h1b", ["c1b"])})
+    assert (calls["uploaded"], calls["deleted"], calls["jobs"]) == (["a.md"], ["b.md"], ["DS1"])
+    assert runs[-1]["status"] == "synced"
+    assert sync.load_manifest()["files"].keys() == {"a.md"}
+
+
+def test_manifest_for_another_knowledge_base_forces_a_full_sync_that_deletes_nothing(run):
+    old = _manifest({"a.md": ("h1", ["c1"]), "old.md": ("h2", ["c2"])}, knowledge_base_id="KB-other")
+    calls, runs = run(old, {"a.md": ("h1", ["c1"])})
+    assert (calls["uploaded"], calls["deleted"]) == (["a.md"], [])
+    assert runs[-1]["forced"] and runs[-1]["added"] == ["a.md"]
@@ -0,0 +1,69 @@
+import pytest
+
+from tenants import Tenant, TenantRegistry, load_configs
+
+
+def _registry(max_active=2, idle_ttl=900.0, max_concurrency=0):
+    configs = {name: {"knowledge_base_id": f"KB-{name}"} for name in ("a", "b", "c")}
+
+    def factory(name, config):
+        return Tenant(name, config["knowledge_base_id"], backends={}, max_concurrency=max_concurrency)
+
+    default = Tenant("default", "KB-default", backends={}, pinned=True)
+    return TenantRegistry(configs, factory, default, max_active=max_active, idle_ttl=idle_ttl)
+
+
+def test_resolve_by_name_or_knowledge_base():
+    registry = _registry()
+    assert registry.resolve() == "default"
+    assert registry.resolve(knowledge_base_id="KB-b") == "b"
+    with pytest.raises(KeyError):
+        registry.resolve("missing")
+    with pytest.raises(KeyError):
+        registry.resolve("a", knowledge_base_id="KB-b")
+
+
+def test_acquired_tenant_is_not_evicted_by_later_loads():
+    # With a zero idle TTL every idle tenant is evictable the moment another one loads
+    registry = _registry(max_active=1, idle_ttl=0)
+    tenant, acquired = registry.get_and_acquire("a")
+    assert acquired and tenant.active == 1
+    registry.get("b")
+    assert registry.loaded("a") is tenant
+    registry.release(tenant, 0.1)
+    registry.get("c")
+    assert registry.loaded("a") is None
+    assert registry.evictions >= 1
+
+
+def test_acquire_loaded_only_takes_a_slot_of_a_loaded_tenant():
+    registry = _registry(max_concurrency=1)
+    assert registry.acquire_loaded("a") == (None, False)
+    tenant = registry.get("a")
+    assert registry.acquire_loaded("a") == (tenant, True)
+    # Quota used up: the tenant is returned but no slot is taken
+    assert registry.get_and_acquire("a") == (tenant, False)
+    assert tenant.rejected == 1
+    registry.release(tenant)
+    assert tenant.active == 0 and tenant.requests == 0
+
+
+def test_idle_tenants_are_unloaded_without_new_loads():
+    registry = _registry(max_active=4, idle_ttl=60)
+    tenant, _ = registry.get_and_acquire("a")
+    idle = registry.get("b")
+    idle.last_used -= 120
+    # Only loaded tenants are requested from here on, so nothing is built
+    registry.release(tenant, 0.1)
+    assert registry.loaded("b") is None
+    assert registry.loaded("a") is tenant
+    tenant.last_used -= 120
+    registry.acquire_loaded("default")
+    assert registry.loaded("a") is None
+    assert registry.evictions == 2
+
+
+def test_load_configs_requires_a_knowledge_base_id():
+    assert load_configs("") == {}
+    with pytest.raises(ValueError):
+        load_configs('{"a": {}}')